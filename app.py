@@ -5,12 +5,14 @@
 
 from flask import Flask, render_template, jsonify, request, make_response, send_from_directory
 from flask_cors import CORS
-import threading
 import queue
 import time
 import os
+import asyncio
+from collections import OrderedDict
 from datetime import datetime
 import json
+from prompt_cache import PromptParts, prompt_text
 
 app = Flask(__name__)
 CORS(app)
@@ -24,35 +26,233 @@ current_status = {
     "logs": [],
     "result": None,
     "provider": "gemini",  # gemini 或 zhipu
-    "error": None
+    "error": None,
+    "job_id": None,
+    "token_usage": None,
+    "prompt_cache": None
 }
 
 
+def new_job_status(provider):
+    """新任务的初始状态（结构与 current_status 相同）"""
+    return {
+        "running": True,
+        "progress": 0,
+        "current_step": "Initializing...",
+        "logs": [],
+        "result": None,
+        "provider": provider,
+        "error": None,
+        "job_id": None,
+        "token_forecast": None,
+        "token_usage": None,
+        "prompt_cache": None
+    }
+
+
+# 任务 ID -> (状态, Future)，保留最近的任务
+job_registry = OrderedDict()
+MAX_JOB_REGISTRY = 100
+
+
 class TaskGenerator:
-    """任务生成器，支持 Gemini 和智谱"""
+    """任务生成器，支持 Gemini 和智谱（流程以协程运行在共享事件循环上，见 pipeline_executor.py）"""
 
-    def __init__(self, provider="gemini", domain="情感,心理"):
+    def __init__(self, provider="gemini", domain="情感,心理", job_id=None, status=None):
+        """
+        Args:
+            provider: gemini / zhipu / gemini-web / gemini-deepseek
+            domain: 内容领域
+            job_id: 任务 ID（默认自动生成）
+            status: 任务状态 dict，默认写入全局 current_status（Web 界面轮询的任务）
+        """
+        from pipeline_executor import get_executor
+        from token_budget import ContextBudget
+        from prompt_cache import CacheStats
+        from model_router import load_routing
         self.provider = provider
         self.domain = domain
+        self.job_id = job_id
+        self.tracer = None
+        self.status = current_status if status is None else status
+        self.executor = get_executor()
+        self.budget = ContextBudget(provider)
+        # 路由策略在任务开始时读取一次（每次模型调用都要选模型，见 model_router.py）
+        self.routing = load_routing(provider)
+        self.cache_stats = CacheStats()
+        self.drafts = None
 
     def add_log(self, message, level="info"):
         """添加日志"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        current_status["logs"].append({
+        self.status["logs"].append({
             "time": timestamp,
             "level": level,
             "message": message
         })
         # 只保留最近 50 条日志
-        if len(current_status["logs"]) > 50:
-            current_status["logs"] = current_status["logs"][-50:]
+        if len(self.status["logs"]) > 50:
+            self.status["logs"] = self.status["logs"][-50:]
+        if self.tracer:
+            self.tracer.instant(message, level=level)
 
     def update_progress(self, progress, step):
         """更新进度"""
-        current_status["progress"] = progress
-        current_status["current_step"] = step
+        self.status["progress"] = progress
+        self.status["current_step"] = step
+        if self.tracer:
+            self.tracer.step(step, progress=progress)
+
+    def _plan_rewrite(self, article):
+        """按重写步骤的 token 上限规划要发送的原文（超出时只发送 AI 痕迹最重的段落）"""
+        plan = self.budget.plan_rewrite(article)
+        if plan.trimmed:
+            self.add_log(f"  Context over budget: rewriting {len(plan.selected)}/{len(plan.paragraphs)} paragraphs, "
+                         f"keeping the rest as is", "info")
+        return plan
+
+    def _record_tokens(self, provider, prompt, response, step=None, model=None):
+        """记录一次调用的估算 token 用量和费用（写入任务状态，按步骤汇总）"""
+        self.budget.record(provider, prompt_text(prompt), response, step, model)
+        self.status["token_usage"] = self.budget.summary()
+
+    def _record_cache_usage(self, provider, usage):
+        """记录服务商返回的缓存命中 token 数（进程内累计 + 本任务，见 prompt_cache.py）"""
+        from prompt_cache import record_usage
+        record_usage(provider, usage, self.cache_stats)
+        self.status["prompt_cache"] = self.cache_stats.summary()
+
+    def _route(self, provider, step):
+        """按本流程的路由策略选择步骤使用的模型（见 model_router.py）"""
+        from model_router import route
+        return route(self.provider, provider, step, routing=self.routing)
+
+    def _report_cost(self):
+        """任务结束时输出各步骤的用量和费用"""
+        from token_budget import cost_report
+        summary = self.budget.summary()
+        if not summary["by_step"]:
+            return
+        self.add_log("Cost by step (estimated):", "info")
+        for line in cost_report(summary):
+            self.add_log(f"  {line}", "info")
+        cache = self.cache_stats.summary()
+        if cache["prompt_tokens"]:
+            self.add_log(f"  Prompt cache: {cache['cached_tokens']}/{cache['prompt_tokens']} input tokens cached "
+                         f"({cache['hit_rate']:.0%})", "info")
+
+    def _article_id(self, prefix):
+        """本任务文章的 ID（带任务 ID，并发任务不会重名）"""
+        return f"{prefix}_{self.job_id}"
+
+    async def _record_draft(self, prefix, text, score):
+        """记录优化循环中评过分的一版草稿（相对上一版差量存储，见 article_store.DraftLog）"""
+        if self.drafts is None:
+            from article_store import DraftLog
+            self.drafts = DraftLog(self._article_id(prefix))
+        await self.executor.run_blocking(self.drafts.add, text, score, pool="io")
+
+    async def _structured(self, call, prompt, name, compact=False):
+        """
+        按结构化输出要求调用模型（见 structured_output.py），校验失败时做修复调用，仍失败则抛出异常终止任务
+
+        Args:
+            call: call(prompt, json_mode) 返回协程
+            prompt: 提示词（不含格式要求）
+            name: topic / score
+            compact: 使用精简输出格式（评分只输出一个整数）
+        """
+        from structured_output import generate_structured_async
+        return await generate_structured_async(call, prompt, name, log=lambda m: self.add_log(m, "warning"),
+                                               compact=compact)
+
+    async def _score(self, primary, prompt, text):
+        """
+        AI 浓度评分：默认只调用本流程的评分模型；配置了 SCORE_ENSEMBLE 时并发调用多个评分器，
+        按 SCORE_COMBINE 合并，并记录各评分器的分数和方差（见 scoring.py）
+
+        Args:
+            primary: 本流程的评分调用 call(prompt, json_mode)，返回协程
+            prompt: 评分提示词（不含格式要求）
+            text: 被评分的全文（本地启发式评分用）
+
+        Returns:
+            int: 0-100
+        """
+        from scoring import (ensemble_config, scorer_available, scorer_labels, heuristic_score,
+                             ensemble_score_async, describe)
+        names, method = ensemble_config()
+        if names == ["primary"]:
+            return (await self._structured(primary, prompt, "score", compact=True))["score"]
+
+        calls = {
+            "primary": primary,
+            "gemini": lambda p, json_mode: self._gemini_generate("evaluate", p, score=True),
+            "zhipu": lambda p, json_mode: self._zhipu_chat("evaluate", p, score=True),
+            "deepseek": lambda p, json_mode: self._deepseek_chat("evaluate", p, score=True),
+        }
+
+        async def heuristic():
+            return heuristic_score(text)
+
+        async def model_score(call):
+            return (await self._structured(call, prompt, "score", compact=True))["score"]
+
+        scorers = {}
+        for label, name in scorer_labels(names):
+            if not scorer_available(name):
+                self.add_log(f"  Scorer {label} skipped: no API key", "warning")
+            elif name == "heuristic":
+                scorers[label] = heuristic
+            else:
+                scorers[label] = lambda call=calls[name]: model_score(call)
+        if not scorers:
+            scorers["primary"] = lambda: model_score(primary)
+
+        result = await ensemble_score_async(scorers, method, log=lambda m: self.add_log(m, "warning"))
+        self.add_log(f"  Ensemble: {describe(result)}", "info")
+        return result["score"]
+
+    async def _save_article(self, prefix, title, article, score, provider, cover_image_path=None):
+        """
+        保存文章到文章存储（见 article_store.py），在 IO 线程池中写入
+
+        Returns:
+            str: 文件名（历史接口用它定位文章）
+        """
+        from article_store import get_article_store
+        from tracing import span
+
+        article_id = self._article_id(prefix)
+        # 元数据用HTML注释包裹
+        header = [
+            "<!--",
+            f"Title: {title}",
+            f"AI Score: {score}%",
+            f"Provider: {provider}",
+            f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        ]
+        if cover_image_path:
+            header.append(f"Cover: {cover_image_path}")
+        header.append("-->")
+        content = "\n".join(header) + "\n\n"
+        # 如果有封面图，在文章开头插入；正文不包含标题
+        if cover_image_path:
+            content += f"![封面图]({cover_image_path})\n\n"
+        content += article
+
+        store = get_article_store()
+        with span("write article", cat="io", path=article_id):
+            filename = await self.executor.run_blocking(
+                store.save, article_id, content, title=title, provider=provider, ai_score=score,
+                cover=cover_image_path, pool="io"
+            )
+        self.add_log(f"Article saved: {filename}", "success")
+        if self.drafts is not None and self.drafts.iteration:
+            self.add_log(f"  Drafts stored: {self.drafts.iteration} versions, {self.drafts.stored_bytes} bytes", "info")
+        return filename
 
-    def run_with_gemini(self):
+    async def run_with_gemini(self):
         """使用 Gemini 生成文章"""
         try:
             self.add_log("Starting Gemini 3 Pro...", "info")
@@ -61,38 +261,31 @@ class TaskGenerator:
             load_dotenv()
             import google.generativeai as genai
 
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
+            # 支持多个 Key 轮换（GEMINI_API_KEYS，见 key_pool.py）
+            from key_pool import get_key_pool
+            key_pool = get_key_pool("gemini")
+            if not key_pool.size:
                 raise Exception("GEMINI_API_KEY not found")
 
-            genai.configure(api_key=api_key)
+            # 模型按步骤从模型注册表选择最快的健康模型（见 model_registry.py）
+            genai.configure(api_key=key_pool.keys[0])
 
             # 步骤 1: 选题
             self.update_progress(10, "Researching topic...")
             self.add_log("Step 1/4: Deep thinking for viral topic", "info")
 
-            model = genai.GenerativeModel('models/gemini-3-pro-preview')
             topic_prompt = f"""作为公众号运营专家，请在 {self.domain} 领域构思一个爆款选题。
 
 要求：
 1. 标题吸睛（不超过 30 字）
 2. 有争议性或共鸣点
-3. 给出简要大纲
+3. 给出简要大纲"""
 
-格式：
-标题：《XXX》
-大纲：XXX"""
-
-            response = model.generate_content(topic_prompt)
-            topic_result = response.text
-            self.add_log(f"Topic selected: {topic_result[:100]}...", "success")
-
-            # 解析标题
-            title = "AI时代的思考"
-            if "《" in topic_result and "》" in topic_result:
-                start = topic_result.find("《") + 1
-                end = topic_result.find("》")
-                title = topic_result[start:end]
+            # 选题要求输出 JSON 并在本地校验，格式不对时做修复调用（见 structured_output.py）
+            topic = await self._structured(
+                lambda p, json_mode: self._gemini_generate("topic", p, json_mode), topic_prompt, "topic")
+            title = topic["title"]
+            self.add_log(f"Topic selected: {title}", "success")
 
             # 步骤 2: 写作
             self.update_progress(30, "Writing article...")
@@ -112,8 +305,7 @@ class TaskGenerator:
 
 请直接输出文章："""
 
-            response = model.generate_content(article_prompt)
-            article = response.text
+            article = await self._gemini_generate("write", article_prompt)
             self.add_log(f"Article written: {len(article)} characters", "success")
 
             # 步骤 3: 优化循环
@@ -127,21 +319,18 @@ class TaskGenerator:
                 self.add_log(f"Iteration {i}/2: Checking AI score...", "info")
 
                 # 评估
-                sample = article[:2000] if len(article) > 2000 else article
-                eval_prompt = f"""请评估以下文本的 AI 浓度（0-100分）：
+                sample = self.budget.fit_sample(article)
+                eval_prompt = PromptParts("请评估下面文本的 AI 浓度（0-100分）。", f"""
 
 文本：
-{sample}
-
-只需输出一个数字（0-100），不要解释。"""
+{sample}""")
 
-                response = model.generate_content(eval_prompt)
-                import re
-                match = re.search(r'\d+', response.text)
-                score = int(match.group()) if match else 50
-                score = max(0, min(100, score))
+                score = await self._score(
+                    lambda p, json_mode: self._gemini_generate("evaluate", p, score=True), eval_prompt, article
+                )
 
                 self.add_log(f"  AI Score: {score}%", "info" if score >= 30 else "success")
+                await self._record_draft("article", article, score)
 
                 if score < best_score:
                     best_score = score
@@ -158,7 +347,8 @@ class TaskGenerator:
                     break
 
                 self.add_log(f"  Rewriting to humanize...", "info")
-                rewrite_prompt = f"""请重写以下文本，使其更像真人写的：
+                plan = self._plan_rewrite(article)
+                rewrite_prompt = PromptParts("""请重写下面的原文，使其更像真人写的。
 
 要求：
 1. 增加口语化表达
@@ -167,13 +357,12 @@ class TaskGenerator:
 4. 使用地道的中文
 5. 避免"综上所述"、"首先其次"等 AI 用词
 
-原文：
-{article}
+请直接输出重写后的内容。""", f"""
 
-请直接输出重写后的内容："""
+原文：
+{plan.text}""")
 
-                response = model.generate_content(rewrite_prompt)
-                article = response.text
+                article = plan.merge(await self._gemini_generate("rewrite", rewrite_prompt))
 
                 progress = 50 + (i * 10)
                 self.update_progress(progress, f"Optimizing (iteration {i}/2)...")
@@ -182,28 +371,22 @@ class TaskGenerator:
             self.update_progress(100, "Saving article...")
             self.add_log("Step 4/4: Saving article", "info")
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"article_{timestamp}.md"
+            # 该流程不生成封面图
+            cover_image_path = None
 
-            with open(filename, 'w', encoding='utf-8') as f:
-                # 元数据用HTML注释包裹
-                f.write(f"<!--\n")
-                f.write(f"Title: {title}\n")
-                f.write(f"AI Score: {best_score}%\n")
-                f.write(f"Provider: Gemini 3 Pro\n")
-                f.write(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"-->\n\n")
-                # 只保存纯文章内容，不包含标题
-                f.write(article)
+            filename = await self._save_article("article", title, article, best_score,
+                                                "Gemini 3 Pro", cover_image_path)
 
-            self.add_log(f"Article saved: {filename}", "success")
+            # 计入语料文档频率（TF-IDF 关键词提取用）
+            from keyword_extractor import record_article
+            await self.executor.run_blocking(record_article, article, filename, pool="io")
 
             # 构建预览内容（包含封面图）
             preview_content = article
             if cover_image_path:
                 preview_content = f"![封面图]({cover_image_path})\n\n" + article
 
-            current_status["result"] = {
+            self.status["result"] = {
                 "title": title,
                 "content": preview_content,
                 "ai_score": best_score,
@@ -212,69 +395,44 @@ class TaskGenerator:
             }
 
             self.add_log("Complete!", "success")
-            current_status["running"] = False
+            self.status["running"] = False
 
         except Exception as e:
             self.add_log(f"Error: {str(e)}", "error")
-            current_status["error"] = str(e)
-            current_status["running"] = False
+            self.status["error"] = str(e)
+            self.status["running"] = False
 
-    def run_with_zhipu(self):
+    async def run_with_zhipu(self):
         """使用智谱生成文章"""
         try:
             self.add_log("Starting Zhipu GLM...", "info")
 
-            from zhipuai import ZhipuAI
-
-            api_key = os.getenv("ZHIPU_API_KEY")
-            if not api_key:
+            from key_pool import get_key_pool
+            if not get_key_pool("zhipu").size:
                 raise Exception("ZHIPU_API_KEY not found")
 
-            client = ZhipuAI(api_key=api_key)
-
             # 步骤 1: 选题
             self.update_progress(10, "Researching topic...")
             self.add_log("Step 1/4: Analyzing viral topic", "info")
 
-            topic_response = client.chat.completions.create(
-                model="glm-4.7",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"""作为公众号运营专家，请在 {self.domain} 领域构思一个爆款选题。
+            topic_prompt = f"""作为公众号运营专家，请在 {self.domain} 领域构思一个爆款选题。
 
 要求：
 1. 标题吸睛（不超过 30 字）
 2. 有争议性或共鸣点
-3. 给出简要大纲
+3. 给出简要大纲"""
 
-格式：
-标题：《XXX》
-大纲：XXX"""
-                    }
-                ]
-            )
-
-            topic_result = topic_response.choices[0].message.content
-            self.add_log(f"Topic selected: {topic_result[:100]}...", "success")
-
-            # 解析标题
-            title = "AI时代的思考"
-            if "《" in topic_result and "》" in topic_result:
-                start = topic_result.find("《") + 1
-                end = topic_result.find("》")
-                title = topic_result[start:end]
+            # 选题要求输出 JSON 并在本地校验，格式不对时做修复调用（见 structured_output.py）
+            topic = await self._structured(
+                lambda p, json_mode: self._zhipu_chat("topic", p, json_mode=json_mode), topic_prompt, "topic")
+            title = topic["title"]
+            self.add_log(f"Topic selected: {title}", "success")
 
             # 步骤 2: 写作
             self.update_progress(30, "Writing article...")
             self.add_log(f"Step 2/4: Writing article (2000 words)", "info")
 
-            article_response = client.chat.completions.create(
-                model="glm-4.7",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": f"""请写一篇公众号文章：
+            article_prompt = f"""请写一篇公众号文章：
 
 标题：《{title}》
 
@@ -288,11 +446,8 @@ class TaskGenerator:
 7. 有情感共鸣
 
 请直接输出文章，不要任何开场白。"""
-                    }
-                ]
-            )
 
-            article = article_response.choices[0].message.content
+            article = await self._zhipu_chat("write", article_prompt)
             self.add_log(f"Article written: {len(article)} characters", "success")
 
             # 步骤 3: 优化循环
@@ -306,34 +461,23 @@ class TaskGenerator:
                 self.add_log(f"Iteration {i}/2: Checking AI score...", "info")
 
                 # 评估 AI 率
-                sample = article[:2000] if len(article) > 2000 else article
-                eval_response = client.chat.completions.create(
-                    model="glm-4.7",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": f"""请评估以下文本的 AI 浓度（0-100分）：
-
-文本：
-{sample}
+                sample = self.budget.fit_sample(article)
+                eval_prompt = PromptParts("""请评估下面文本的 AI 浓度（0-100分）。
 
 评估标准：
 - 0-30分：像人写的
 - 30-60分：有些 AI 痕迹
-- 60-100分：明显是 AI 写的
+- 60-100分：明显是 AI 写的""", f"""
 
-只需输出一个数字（0-100），不要解释。"""
-                        }
-                    ]
-                )
+文本：
+{sample}""")
 
-                import re
-                score_text = eval_response.choices[0].message.content
-                match = re.search(r'\d+', score_text)
-                score = int(match.group()) if match else 50
-                score = max(0, min(100, score))
+                score = await self._score(
+                    lambda p, json_mode: self._zhipu_chat("evaluate", p, score=True), eval_prompt, article
+                )
 
                 self.add_log(f"  AI Score: {score}%", "info" if score >= 30 else "success")
+                await self._record_draft("article_zhipu", article, score)
 
                 if score < best_score:
                     best_score = score
@@ -350,15 +494,8 @@ class TaskGenerator:
                     break
 
                 self.add_log(f"  Rewriting to humanize...", "info")
-                rewrite_response = client.chat.completions.create(
-                    model="glm-4.7",
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": f"""请重写以下文本，使其更像真人写的：
-
-当前 AI 评分：{score}分
-目标评分：< 30分
+                plan = self._plan_rewrite(article)
+                rewrite_prompt = PromptParts("""请重写下面的原文，使其更像真人写的，目标 AI 评分 < 30分。
 
 要求：
 1. 大幅增加口语化表达
@@ -369,15 +506,14 @@ class TaskGenerator:
 6. 可以加入一些"我觉得"、"说实话"等主观表达
 7. 偶尔出现一些小瑕疵会更像人
 
-原文：
-{article}
+请直接输出重写后的文章内容。""", f"""
 
-请直接输出重写后的文章内容。"""
-                        }
-                    ]
-                )
+当前 AI 评分：{score}分
 
-                article = rewrite_response.choices[0].message.content
+原文：
+{plan.text}""")
+
+                article = plan.merge(await self._zhipu_chat("rewrite", rewrite_prompt))
 
                 progress = 50 + (i * 10)
                 self.update_progress(progress, f"Optimizing (iteration {i}/2)...")
@@ -386,28 +522,22 @@ class TaskGenerator:
             self.update_progress(100, "Saving article...")
             self.add_log("Step 4/4: Saving article", "info")
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"article_zhipu_{timestamp}.md"
+            # 该流程不生成封面图
+            cover_image_path = None
 
-            with open(filename, 'w', encoding='utf-8') as f:
-                # 元数据用HTML注释包裹
-                f.write(f"<!--\n")
-                f.write(f"Title: {title}\n")
-                f.write(f"AI Score: {best_score}%\n")
-                f.write(f"Provider: Zhipu GLM-4.7\n")
-                f.write(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"-->\n\n")
-                # 只保存纯文章内容，不包含标题
-                f.write(article)
+            filename = await self._save_article("article_zhipu", title, article, best_score,
+                                                "Zhipu GLM-4.7", cover_image_path)
 
-            self.add_log(f"Article saved: {filename}", "success")
+            # 计入语料文档频率（TF-IDF 关键词提取用）
+            from keyword_extractor import record_article
+            await self.executor.run_blocking(record_article, article, filename, pool="io")
 
             # 构建预览内容（包含封面图）
             preview_content = article
             if cover_image_path:
                 preview_content = f"![封面图]({cover_image_path})\n\n" + article
 
-            current_status["result"] = {
+            self.status["result"] = {
                 "title": title,
                 "content": preview_content,
                 "ai_score": best_score,
@@ -416,14 +546,14 @@ class TaskGenerator:
             }
 
             self.add_log("Complete!", "success")
-            current_status["running"] = False
+            self.status["running"] = False
 
         except Exception as e:
             self.add_log(f"Error: {str(e)}", "error")
-            current_status["error"] = str(e)
-            current_status["running"] = False
+            self.status["error"] = str(e)
+            self.status["running"] = False
 
-    def run_with_gemini_web(self):
+    async def run_with_gemini_web(self):
         """使用 Gemini Web 客户端生成文章"""
         import subprocess
         import json
@@ -431,8 +561,6 @@ class TaskGenerator:
         try:
             self.add_log("Starting Gemini Web Client...", "info")
 
-            script_dir = r"P:\claude-skills\gemini-web\scripts"
-
             # 步骤 1: 选题
             self.update_progress(10, "Researching topic...")
             self.add_log("Step 1/4: Deep thinking for viral topic", "info")
@@ -442,22 +570,13 @@ class TaskGenerator:
 要求：
 1. 标题吸睛（不超过 30 字）
 2. 有争议性或共鸣点
-3. 给出简要大纲
-
-格式：
-标题：《XXX》
-大纲：XXX"""
+3. 给出简要大纲"""
 
             self.add_log("Generating topic with Gemini Web...", "info")
-            topic_result = self._call_gemini_web(topic_prompt)
-
-            # 解析标题
-            title = "AI时代的思考"
-            if "《" in topic_result and "》" in topic_result:
-                start = topic_result.find("《") + 1
-                end = topic_result.find("》")
-                title = topic_result[start:end]
-
+            # Gemini Web 没有 JSON 模式，只靠提示词要求格式，本地校验失败时做修复调用
+            topic = await self._structured(
+                lambda p, json_mode: self._call_gemini_web(p, "topic"), topic_prompt, "topic")
+            title = topic["title"]
             self.add_log(f"Topic selected: {title}", "success")
 
             # 步骤 2: 写作
@@ -481,7 +600,7 @@ class TaskGenerator:
 请直接输出文章内容，不要输出标题。"""
 
             self.add_log("Writing article with Gemini Web...", "info")
-            article = self._call_gemini_web(article_prompt)
+            article = await self._call_gemini_web(article_prompt, "write")
             self.add_log(f"Article written: {len(article)} chars", "success")
 
             # 步骤 3: 人工化
@@ -494,20 +613,18 @@ class TaskGenerator:
             for i in range(2):
                 self.add_log(f"Iteration {i+1}/2: Checking AI score...", "info")
 
-                import requests
-                check_response = requests.post(
-                    'https://api.gptzero.me/v2/predict/text',
-                    json={'document': best_article},
-                    headers={'Accept': 'application/json'}
-                )
+                # 每轮检测当前版本（首轮为初稿，之后为上一轮的重写结果）
+                check_status, check_text = await self._gptzero_check(article)
 
-                if check_response.status_code == 200:
-                    import re
-                    match = re.search(r'\d+', check_response.text)
-                    score = int(match.group()) if match else 50
-                    score = max(0, min(100, score))
+                # 从响应字段取 AI 概率；响应里没有可用字段时视为本轮检测失败
+                from structured_output import parse_gptzero_score
+                score = parse_gptzero_score(check_text) if check_status == 200 else None
+                if check_status == 200 and score is None:
+                    self.add_log("  GPTZero response has no AI probability, skipping", "warning")
 
+                if score is not None:
                     self.add_log(f"  AI Score: {score}%", "info" if score >= 30 else "success")
+                    await self._record_draft("article_gemini_web", article, score)
 
                     if score < best_score:
                         best_score = score
@@ -524,7 +641,8 @@ class TaskGenerator:
                     break
 
                 self.add_log(f"  Rewriting to humanize...", "info")
-                rewrite_prompt = f"""请重写以下文本，使其更像真人写的：
+                plan = self._plan_rewrite(article)
+                rewrite_prompt = PromptParts("""请重写下面的原文，使其更像真人写的。
 
 要求：
 1. 大幅增加口语化表达
@@ -535,12 +653,12 @@ class TaskGenerator:
 6. 可以加入一些"我觉得"、"说实话"等主观表达
 7. 偶尔出现一些小瑕疵会更像人
 
-原文：
-{article}
+请直接输出重写后的文章内容。""", f"""
 
-请直接输出重写后的文章内容。"""
+原文：
+{plan.text}""")
 
-                article = self._call_gemini_web(rewrite_prompt)
+                article = plan.merge(await self._call_gemini_web(rewrite_prompt, "rewrite"))
 
                 progress = 50 + (i * 10)
                 self.update_progress(progress, f"Optimizing (iteration {i}/2)...")
@@ -553,7 +671,6 @@ class TaskGenerator:
             try:
                 # 读取封面图配置
                 import json
-                import os
                 config_file = os.path.join(os.path.dirname(__file__), "prompts_config.json")
 
                 cover_config = {"enabled": True, "style": "auto", "methods": ["placeholder", "zhipu", "gemini-web", "dalle"]}
@@ -571,27 +688,39 @@ class TaskGenerator:
                     from cover_generator import CoverGenerator
                     cover_gen = CoverGenerator()
 
+                    # 单次扫描文章：风格得分、内容标签、AI 痕迹短语
+                    from keyword_engine import scan_article
+                    scan = scan_article(article)
+                    if scan["topics"]:
+                        self.add_log(f"  Topics: {', '.join(scan['topics'])}", "info")
+                    if scan["ai_markers"]:
+                        self.add_log(f"  AI marker phrases: {', '.join(scan['ai_markers'])}", "warning")
+
                     # 确定风格
                     cover_style = cover_config.get("style", "auto")
                     if cover_style == "auto":
-                        # 自动选择风格
-                        content_lower = article.lower()
-                        if any(word in content_lower for word in ['ai', '科技', '技术', '数字', '算法']):
-                            cover_style = 'tech'
-                        elif any(word in content_lower for word in ['情感', '成长', '生活', '人生']):
-                            cover_style = 'warm'
-                        elif any(word in content_lower for word in ['自然', '环保', '健康']):
-                            cover_style = 'nature'
-                        else:
-                            cover_style = 'elegant'
+                        # 自动选择风格（关键词加权得分最高的风格）
+                        cover_style = scan["style"]
 
-                    # 按配置的优先级尝试生成
+                    # 按配置的优先级尝试生成（封面图写入文章存储的分片目录）
                     methods = cover_config.get("methods", ["placeholder", "zhipu", "gemini-web", "dalle"])
-                    cover_result = cover_gen.generate_cover(title, article, style=cover_style, output_dir=".", methods=methods)
+                    from article_store import get_article_store
+                    store = get_article_store()
+                    cover_dir = store.cover_dir(self._article_id("article_gemini_web"))
+                    cover_result = await self.executor.run_blocking(
+                        cover_gen.generate_cover,
+                        title, article, style=cover_style, output_dir=cover_dir, methods=methods,
+                        race=cover_config.get("race", False),
+                        method_timeout=cover_config.get("method_timeout"),
+                        pool="io"
+                    )
 
                     if cover_result["success"]:
-                        cover_image_path = cover_result["image_path"]
-                        self.add_log(f"  Cover generated: {cover_image_path} (method: {cover_result['method']})", "success")
+                        cover_image_path = store.cover_ref(cover_result["image_path"])
+                        if cover_result.get("cached"):
+                            self.add_log(f"  Cover cache hit: {cover_image_path} (method: {cover_result['method']})", "success")
+                        else:
+                            self.add_log(f"  Cover generated: {cover_image_path} (method: {cover_result['method']})", "success")
                     else:
                         self.add_log(f"  Cover generation skipped: {cover_result.get('error', 'Unknown error')}", "warning")
 
@@ -602,35 +731,19 @@ class TaskGenerator:
             self.update_progress(100, "Saving article...")
             self.add_log("Step 5/5: Saving article", "info")
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"article_gemini_web_{timestamp}.md"
-
-            with open(filename, 'w', encoding='utf-8') as f:
-                # 元数据用HTML注释包裹
-                f.write(f"<!--\n")
-                f.write(f"Title: {title}\n")
-                f.write(f"AI Score: {best_score}%\n")
-                f.write(f"Provider: Gemini Web (Client)\n")
-                f.write(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                if cover_image_path:
-                    f.write(f"Cover: {cover_image_path}\n")
-                f.write(f"-->\n\n")
-
-                # 如果有封面图，在文章开头插入
-                if cover_image_path:
-                    f.write(f"![封面图]({cover_image_path})\n\n")
+            filename = await self._save_article("article_gemini_web", title, article, best_score,
+                                                "Gemini Web (Client)", cover_image_path)
 
-                # 写入文章内容
-                f.write(article)
-
-            self.add_log(f"Article saved: {filename}", "success")
+            # 计入语料文档频率（TF-IDF 关键词提取用）
+            from keyword_extractor import record_article
+            await self.executor.run_blocking(record_article, article, filename, pool="io")
 
             # 构建预览内容（包含封面图）
             preview_content = article
             if cover_image_path:
                 preview_content = f"![封面图]({cover_image_path})\n\n" + article
 
-            current_status["result"] = {
+            self.status["result"] = {
                 "title": title,
                 "content": preview_content,
                 "ai_score": best_score,
@@ -639,54 +752,297 @@ class TaskGenerator:
             }
 
             self.add_log("Complete!", "success")
-            current_status["running"] = False
+            self.status["running"] = False
 
         except Exception as e:
             self.add_log(f"Error: {str(e)}", "error")
-            current_status["error"] = str(e)
-            current_status["running"] = False
+            self.status["error"] = str(e)
+            self.status["running"] = False
 
-    def _call_gemini_web(self, prompt):
-        """调用 Gemini Web Skill"""
-        import subprocess
+    async def _gemini_generate(self, step, prompt, json_mode=False, score=False):
+        """
+        调用 Gemini SDK（阻塞 SDK 放进有界线程池），返回文本（支持录制/回放）
+
+        Args:
+            step: topic / write / evaluate / rewrite，按路由策略选择模型（见 model_router.py）
+            prompt: 提示词（str，或拆分为固定前缀和后缀的 PromptParts：前缀够长时使用上下文缓存，见 prompt_cache.py）
+            json_mode: 要求输出 JSON（response_mime_type=application/json）
+            score: 使用评分调用配置（极小输出上限、温度 0、流式读到第一个整数即停止，见 scoring.py）
+        """
+        from cassette import cassette_call_async
+        from model_registry import record_call
+        from key_pool import get_key_pool
+        from scoring import gemini_score
+        from prompt_cache import gemini_request, gemini_usage, prefix_cacheable
+        model_name = self._route("gemini", step)
+
+        generation_config = {"response_mime_type": "application/json"} if json_mode else None
+
+        def generate(key):
+            model, contents = gemini_request(model_name, prompt, key)
+            if score:
+                # 前缀不可能命中缓存时读到整数即停止，不为统计用量读完整个流
+                on_usage = (lambda chunk: self._record_cache_usage("gemini", gemini_usage(chunk))) \
+                    if prefix_cacheable("gemini", prompt) else None
+                return gemini_score(model, contents, on_usage=on_usage)
+            response = model.generate_content(contents, generation_config=generation_config)
+            self._record_cache_usage("gemini", gemini_usage(response))
+            return response.text
+
+        async def call():
+            started = time.perf_counter()
+            try:
+                # 被限流的 Key 进入冷却，换下一个 Key 重试
+                async with self.executor.limit("gemini"):
+                    text = await self.executor.run_blocking(get_key_pool("gemini").call, generate)
+            except Exception as e:
+                record_call(model_name, error=e)
+                raise
+            record_call(model_name, time.perf_counter() - started)
+            return text
+
+        request = {"model": model_name, "prompt": prompt_text(prompt)}
+        if json_mode:
+            request["json"] = True
+        if score:
+            request["profile"] = "score"
+        response = await cassette_call_async("gemini", request, call)
+        self._record_tokens("gemini", prompt, response, step, model_name)
+        return response
+
+    async def _chat_completion(self, provider, base_url, payload, until_integer=False, track_usage=False):
+        """
+        调用 OpenAI 兼容的 chat/completions 接口（异步 HTTP），返回文本
+
+        Key 从服务商的 Key 池中按在途最少选取，429 时该 Key 冷却并换下一个 Key 重试（见 key_pool.py）；
+        until_integer 时以流式读取，读到第一个完整整数即得到答案并关闭流（评分调用，见 scoring.py）；
+        track_usage 时（前缀可能命中缓存，见 prompt_cache.prefix_cacheable）再读完剩余的几个 token 取最后一块中的 usage；
+        耗时和错误计入模型注册表，供模型路由按实测延迟选择；响应中的缓存命中 token 数计入缓存统计
+        """
+        from key_pool import get_key_pool, KeyRateLimited
+        from model_registry import record_call
+        from prompt_cache import openai_usage
+
+        async def stream(api_key):
+            from scoring import read_until_integer_async
+
+            usage = {}
+
+            async def deltas(response):
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    # stream_options.include_usage：最后一块没有 choices，只带 usage
+                    if chunk.get("usage"):
+                        usage["usage"] = chunk["usage"]
+                    choices = chunk.get("choices") or []
+                    if choices:
+                        yield (choices[0].get("delta") or {}).get("content") or ""
+
+            async with self.executor.limit(provider):
+                async with self.executor.http().stream(
+                    "POST",
+                    f'{base_url.rstrip("/")}/chat/completions',
+                    headers={
+                        'Content-Type': 'application/json',
+                        'Authorization': f'Bearer {api_key}'
+                    },
+                    json={**payload, "stream": True,
+                          **({"stream_options": {"include_usage": True}} if track_usage else {})},
+                    timeout=120
+                ) as response:
+                    if response.status_code == 429:
+                        raise KeyRateLimited(f"{provider} API error: 429", response.headers.get("Retry-After"))
+                    if response.status_code != 200:
+                        raise Exception(f"{provider} API error: {response.status_code}")
+                    chunks = deltas(response)
+                    text = await read_until_integer_async(chunks)
+                    if track_usage:
+                        # 前缀可能命中缓存时才读完剩余的几个 token，取最后一块中的 usage
+                        async for _ in chunks:
+                            pass
+                    else:
+                        await chunks.aclose()
+            if track_usage:
+                self._record_cache_usage(provider, openai_usage(usage))
+            return text
+
+        async def post(api_key):
+            async with self.executor.limit(provider):
+                response = await self.executor.http().post(
+                    f'{base_url.rstrip("/")}/chat/completions',
+                    headers={
+                        'Content-Type': 'application/json',
+                        'Authorization': f'Bearer {api_key}'
+                    },
+                    json=payload,
+                    timeout=120
+                )
+
+            if response.status_code == 429:
+                raise KeyRateLimited(f"{provider} API error: 429", response.headers.get("Retry-After"))
+            if response.status_code != 200:
+                raise Exception(f"{provider} API error: {response.status_code}")
+
+            data = response.json()
+            self._record_cache_usage(provider, openai_usage(data))
+            return data['choices'][0]['message']['content']
+
+        started = time.perf_counter()
+        try:
+            pool = get_key_pool(provider)
+            if not pool.size:
+                raise Exception(f"{provider.upper()}_API_KEY not found")
+            text = await pool.call_async(stream if until_integer else post)
+        except Exception as e:
+            record_call(payload["model"], error=e)
+            raise
+        record_call(payload["model"], time.perf_counter() - started)
+        return text
+
+    async def _zhipu_chat(self, step, prompt, json_mode=False, score=False):
+        """
+        调用智谱对话接口，返回文本（支持录制/回放；模型按步骤路由，见 model_router.py；
+        json_mode 开启 JSON 输出模式；score 使用评分调用配置，见 scoring.py）
+        """
+        from cassette import cassette_call_async
+        from scoring import SCORE_PROFILES
+        from prompt_cache import chat_messages, prefix_cacheable
+        base_url = os.getenv("ZHIPUAI_BASE_URL", "https://open.bigmodel.cn/api/paas/v4")
+        model = self._route("zhipu", step)
+        payload = {"model": model, "messages": chat_messages(prompt)}
+        request = {"model": model, "prompt": prompt_text(prompt)}
+        if json_mode:
+            payload["response_format"] = {"type": "json_object"}
+            request["json"] = True
+        if score:
+            payload.update(SCORE_PROFILES["zhipu"]["params"])
+            request["profile"] = "score"
+        response = await cassette_call_async(
+            "zhipu", request,
+            lambda: self._chat_completion("zhipu", base_url, payload, until_integer=score,
+                                          track_usage=score and prefix_cacheable("zhipu", prompt))
+        )
+        self._record_tokens("zhipu", prompt, response, step, model)
+        return response
+
+    async def _deepseek_chat(self, step, prompt, temperature=0.7, json_mode=False, score=False):
+        """
+        调用 DeepSeek 对话接口，返回文本（支持录制/回放；模型按步骤路由，见 model_router.py；
+        json_mode 开启 JSON 输出模式；score 使用评分调用配置，见 scoring.py）
+        """
+        from cassette import cassette_call_async
+        from scoring import SCORE_PROFILES
+        from prompt_cache import chat_messages, prefix_cacheable
+        model = self._route("deepseek", step)
+        if score:
+            temperature = SCORE_PROFILES["deepseek"]["params"]["temperature"]
+        deepseek_base_url = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com/v1")
+        payload = {
+            'model': model,
+            'messages': chat_messages(prompt),
+            'temperature': temperature
+        }
+        request = {"model": model, "temperature": temperature, "prompt": prompt_text(prompt)}
+        if json_mode:
+            payload['response_format'] = {'type': 'json_object'}
+            request["json"] = True
+        if score:
+            payload.update(SCORE_PROFILES["deepseek"]["params"])
+            request["profile"] = "score"
+        response = await cassette_call_async(
+            "deepseek", request,
+            lambda: self._chat_completion("deepseek", deepseek_base_url, payload, until_integer=score,
+                                          track_usage=score and prefix_cacheable("deepseek", prompt))
+        )
+        self._record_tokens("deepseek", prompt, response, step, model)
+        return response
+
+    async def _gptzero_check(self, document):
+        """调用 GPTZero 检测，返回 (状态码, 响应文本)（支持录制/回放）"""
+        from cassette import cassette_call_async
+
+        async def call():
+            async with self.executor.limit("gptzero"):
+                response = await self.executor.http().post(
+                    os.getenv("GPTZERO_API_URL", "https://api.gptzero.me/v2/predict/text"),
+                    json={'document': document},
+                    headers={'Accept': 'application/json'},
+                    timeout=60
+                )
+            return [response.status_code, response.text]
+
+        status, text = await cassette_call_async("gptzero", {"document": document}, call)
+        return status, text
+
+    async def _call_gemini_web(self, prompt, step=None):
+        """调用 Gemini Web Skill（支持录制/回放；step 用于按步骤汇总用量；网页客户端没有缓存接口，发送完整提示词）"""
+        from cassette import cassette_call_async
+        prompt = prompt_text(prompt)
+        response = await cassette_call_async("gemini-web", {"prompt": prompt}, lambda: self._run_gemini_web(prompt))
+        self._record_tokens("gemini-web", prompt, response, step)
+        return response
+
+    async def _run_gemini_web(self, prompt, timeout=120):
+        """通过异步子进程运行 Gemini Web Skill"""
+        import asyncio
         import json
         import sys
-        import os
+        import uuid
 
-        script_path = r"P:\claude-skills\gemini-web\scripts\main.ts"
+        # 脚本路径和启动命令可用环境变量覆盖（如本地压测用的替身脚本）
+        script_path = os.getenv("GEMINI_WEB_SCRIPT", r"P:\claude-skills\gemini-web\scripts\main.ts")
+        runner = os.getenv("GEMINI_WEB_RUNNER", "npx -y bun")
 
-        # 创建临时 prompt 文件（使用绝对路径避免 hash 负数问题）
-        temp_prompt_file = os.path.abspath(f"temp_gemini_prompt_{abs(hash(prompt))}.txt")
+        # 创建临时 prompt 文件（绝对路径 + 随机名，并发任务的相同提示词不会互相覆盖）
+        temp_prompt_file = os.path.abspath(f"temp_gemini_prompt_{uuid.uuid4().hex}.txt")
         with open(temp_prompt_file, 'w', encoding='utf-8') as f:
             f.write(prompt)
 
         try:
-            # Windows 需要 shell=True 才能找到 npx
+            # Windows 需要经过 shell 才能找到 npx
             use_shell = sys.platform == 'win32'
-
-            cmd = f'npx -y bun "{script_path}" --promptfiles "{temp_prompt_file}" --json'
+            cmd = f'{runner} "{script_path}" --promptfiles "{temp_prompt_file}" --json'
 
             self.add_log(f"Calling Gemini Web with prompt length: {len(prompt)}", "info")
 
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=120,
-                encoding='utf-8',
-                shell=use_shell,
-                cwd=r"P:\claude-skills\gemini-web\scripts"
-            )
+            from tracing import span
+            async with self.executor.limit("gemini-web"):
+                with span("gemini-web subprocess", cat="subprocess", script=os.path.basename(script_path)) as current:
+                    if use_shell:
+                        process = await asyncio.create_subprocess_shell(
+                            cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                            cwd=os.path.dirname(script_path)
+                        )
+                    else:
+                        import shlex
+                        process = await asyncio.create_subprocess_exec(
+                            *shlex.split(cmd), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                            cwd=os.path.dirname(script_path)
+                        )
+                    try:
+                        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+                    except (asyncio.TimeoutError, asyncio.CancelledError):
+                        process.kill()
+                        await process.wait()
+                        raise
+                    stdout = stdout.decode('utf-8', errors='replace')
+                    stderr = stderr.decode('utf-8', errors='replace')
+                    current.set(returncode=process.returncode, stdout_chars=len(stdout))
 
             # 记录命令输出用于调试
-            if result.returncode != 0:
-                error_msg = result.stderr or result.stdout or "Unknown error"
-                self.add_log(f"Gemini Web returncode: {result.returncode}", "error")
-                self.add_log(f"stderr: {result.stderr[:500] if result.stderr else 'None'}", "error")
-                self.add_log(f"stdout: {result.stdout[:500] if result.stdout else 'None'}", "error")
+            if process.returncode != 0:
+                error_msg = stderr or stdout or "Unknown error"
+                self.add_log(f"Gemini Web returncode: {process.returncode}", "error")
+                self.add_log(f"stderr: {stderr[:500] if stderr else 'None'}", "error")
+                self.add_log(f"stdout: {stdout[:500] if stdout else 'None'}", "error")
                 raise Exception(f"Gemini Web failed: {error_msg}")
 
-            output = result.stdout.strip()
+            output = stdout.strip()
             if not output:
                 raise Exception("Empty response from Gemini Web")
 
@@ -702,7 +1058,7 @@ class TaskGenerator:
             if os.path.exists(temp_prompt_file):
                 os.remove(temp_prompt_file)
 
-    def run_with_gemini_deepseek(self):
+    async def run_with_gemini_deepseek(self):
         """使用 Gemini Web + DeepSeek 组合生成文章
 
         流程：
@@ -713,6 +1069,10 @@ class TaskGenerator:
         try:
             self.add_log("Starting Gemini Web + DeepSeek workflow...", "info")
 
+            from key_pool import get_key_pool
+            if not get_key_pool("deepseek").size:
+                raise Exception("DEEPSEEK_API_KEY not found")
+
             # 步骤 1: Gemini Web 深度研究生成标题和大纲
             self.update_progress(10, "Researching and outlining...")
             self.add_log("Step 1/4: Gemini Web deep research for title and outline", "info")
@@ -726,29 +1086,21 @@ class TaskGenerator:
 2. 提出一个有吸引力、有争议性、能引发共鸣的文章标题
 3. 设计详细的文章大纲（包含开头、3-5个主要部分、结尾）
 
-请直接输出格式如下：
-标题：《文章标题》
-
-大纲：
-一、开头
-- 要点1
-
-二、主体部分1
-- 要点1
-- 要点2
-
-三、结尾
-- 要点"""
+大纲按"一、开头"、"二、……"分节，每节下用"- "列出要点，节之间空一行。"""
 
-            outline_text = self._call_gemini_web(topic_prompt)
+            # Gemini Web 没有 JSON 模式，只靠提示词要求格式，本地校验失败时做修复调用（见 structured_output.py）
+            topic = await self._structured(
+                lambda p, json_mode: self._call_gemini_web(p, "topic"), topic_prompt, "topic")
+            title = topic["title"]
+            outline_text = topic["outline"]
             self.add_log(f"Outline generated: {len(outline_text)} characters", "success")
-
-            # 提取标题
-            import re
-            title_match = re.search(r'标题[：:]\s*《(.+?)》', outline_text)
-            title = title_match.group(1) if title_match else self.domain
             self.add_log(f"Title: {title}", "info")
 
+            # 写作提示词只嵌入压缩后的大纲
+            outline_context = self.budget.fit_outline(outline_text)
+            if len(outline_context) < len(outline_text):
+                self.add_log(f"Outline compressed: {len(outline_text)} -> {len(outline_context)} characters", "info")
+
             # 步骤 2: DeepSeek 按大纲写文章
             self.update_progress(30, "Writing article...")
             self.add_log("Step 2/4: DeepSeek writing article based on outline", "info")
@@ -757,7 +1109,7 @@ class TaskGenerator:
 
 标题：《{title}》
 
-{outline_text}
+{outline_context}
 
 要求：
 1. 约 2000 字
@@ -769,28 +1121,7 @@ class TaskGenerator:
 
 请直接输出文章，不要输出标题："""
 
-            import requests
-            deepseek_api_key = "sk-b509aad3ce224271b0b8fb336063b4e7"
-            deepseek_response = requests.post(
-                'https://api.deepseek.com/v1/chat/completions',
-                headers={
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {deepseek_api_key}'
-                },
-                json={
-                    'model': 'deepseek-chat',
-                    'messages': [
-                        {'role': 'user', 'content': article_prompt}
-                    ],
-                    'temperature': 0.7
-                },
-                timeout=120
-            )
-
-            if deepseek_response.status_code != 200:
-                raise Exception(f"DeepSeek API error: {deepseek_response.status_code}")
-
-            article = deepseek_response.json()['choices'][0]['message']['content']
+            article = await self._deepseek_chat("write", article_prompt)
             self.add_log(f"Article written: {len(article)} characters", "success")
 
             # 步骤 3: Gemini Web 优化循环（2次迭代）
@@ -804,20 +1135,19 @@ class TaskGenerator:
                 self.add_log(f"Iteration {i}/2: Checking AI score...", "info")
 
                 # 评估
-                sample = article[:2000] if len(article) > 2000 else article
-                eval_prompt = f"""请评估以下文本的 AI 浓度（0-100分）：
+                sample = self.budget.fit_sample(article)
+                eval_prompt = PromptParts("请评估下面文本的 AI 浓度（0-100分）。", f"""
 
 文本：
-{sample}
-
-只需输出一个数字（0-100），不要解释。"""
+{sample}""")
 
-                eval_result = self._call_gemini_web(eval_prompt)
-                match = re.search(r'\d+', eval_result)
-                score = int(match.group()) if match else 50
-                score = max(0, min(100, score))
+                # 网页客户端无法设置生成参数，只用精简的输出要求
+                score = await self._score(
+                    lambda p, json_mode: self._call_gemini_web(p, "evaluate"), eval_prompt, article
+                )
 
                 self.add_log(f"  AI Score: {score}%", "info" if score >= 30 else "success")
+                await self._record_draft("article_gemini_deepseek", article, score)
 
                 if score < best_score:
                     best_score = score
@@ -834,7 +1164,8 @@ class TaskGenerator:
                     break
 
                 self.add_log(f"  Rewriting to humanize...", "info")
-                rewrite_prompt = f"""请重写以下文本，使其更像真人写的：
+                plan = self._plan_rewrite(article)
+                rewrite_prompt = PromptParts("""请重写下面的原文，使其更像真人写的。
 
 要求：
 1. 增加口语化表达
@@ -843,12 +1174,12 @@ class TaskGenerator:
 4. 使用地道的中文
 5. 避免"综上所述"、"首先其次"等 AI 用词
 
-原文：
-{article}
+请直接输出重写后的内容。""", f"""
 
-请直接输出重写后的内容："""
+原文：
+{plan.text}""")
 
-                article = self._call_gemini_web(rewrite_prompt)
+                article = plan.merge(await self._call_gemini_web(rewrite_prompt, "rewrite"))
 
                 progress = 50 + (i * 10)
                 self.update_progress(progress, f"Optimizing (iteration {i}/2)...")
@@ -861,7 +1192,6 @@ class TaskGenerator:
             try:
                 # 读取封面图配置
                 import json
-                import os
                 config_file = os.path.join(os.path.dirname(__file__), "prompts_config.json")
 
                 cover_config = {"enabled": True, "style": "auto", "methods": ["placeholder", "zhipu", "gemini-web", "dalle"]}
@@ -879,27 +1209,39 @@ class TaskGenerator:
                     from cover_generator import CoverGenerator
                     cover_gen = CoverGenerator()
 
+                    # 单次扫描文章：风格得分、内容标签、AI 痕迹短语
+                    from keyword_engine import scan_article
+                    scan = scan_article(article)
+                    if scan["topics"]:
+                        self.add_log(f"  Topics: {', '.join(scan['topics'])}", "info")
+                    if scan["ai_markers"]:
+                        self.add_log(f"  AI marker phrases: {', '.join(scan['ai_markers'])}", "warning")
+
                     # 确定风格
                     cover_style = cover_config.get("style", "auto")
                     if cover_style == "auto":
-                        # 自动选择风格
-                        content_lower = article.lower()
-                        if any(word in content_lower for word in ['ai', '科技', '技术', '数字', '算法']):
-                            cover_style = 'tech'
-                        elif any(word in content_lower for word in ['情感', '成长', '生活', '人生']):
-                            cover_style = 'warm'
-                        elif any(word in content_lower for word in ['自然', '环保', '健康']):
-                            cover_style = 'nature'
-                        else:
-                            cover_style = 'elegant'
+                        # 自动选择风格（关键词加权得分最高的风格）
+                        cover_style = scan["style"]
 
-                    # 按配置的优先级尝试生成
+                    # 按配置的优先级尝试生成（封面图写入文章存储的分片目录）
                     methods = cover_config.get("methods", ["placeholder", "zhipu", "gemini-web", "dalle"])
-                    cover_result = cover_gen.generate_cover(title, article, style=cover_style, output_dir=".", methods=methods)
+                    from article_store import get_article_store
+                    store = get_article_store()
+                    cover_dir = store.cover_dir(self._article_id("article_gemini_deepseek"))
+                    cover_result = await self.executor.run_blocking(
+                        cover_gen.generate_cover,
+                        title, article, style=cover_style, output_dir=cover_dir, methods=methods,
+                        race=cover_config.get("race", False),
+                        method_timeout=cover_config.get("method_timeout"),
+                        pool="io"
+                    )
 
                     if cover_result["success"]:
-                        cover_image_path = cover_result["image_path"]
-                        self.add_log(f"  Cover generated: {cover_image_path} (method: {cover_result['method']})", "success")
+                        cover_image_path = store.cover_ref(cover_result["image_path"])
+                        if cover_result.get("cached"):
+                            self.add_log(f"  Cover cache hit: {cover_image_path} (method: {cover_result['method']})", "success")
+                        else:
+                            self.add_log(f"  Cover generated: {cover_image_path} (method: {cover_result['method']})", "success")
                     else:
                         self.add_log(f"  Cover generation skipped: {cover_result.get('error', 'Unknown error')}", "warning")
 
@@ -910,35 +1252,19 @@ class TaskGenerator:
             self.update_progress(100, "Saving article...")
             self.add_log("Step 5/5: Saving article", "info")
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"article_gemini_deepseek_{timestamp}.md"
-
-            with open(filename, 'w', encoding='utf-8') as f:
-                # 元数据用HTML注释包裹
-                f.write(f"<!--\n")
-                f.write(f"Title: {title}\n")
-                f.write(f"AI Score: {best_score}%\n")
-                f.write(f"Provider: Gemini Web + DeepSeek\n")
-                f.write(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                if cover_image_path:
-                    f.write(f"Cover: {cover_image_path}\n")
-                f.write(f"-->\n\n")
+            filename = await self._save_article("article_gemini_deepseek", title, article, best_score,
+                                                "Gemini Web + DeepSeek", cover_image_path)
 
-                # 如果有封面图，在文章开头插入
-                if cover_image_path:
-                    f.write(f"![封面图]({cover_image_path})\n\n")
-
-                # 写入文章内容
-                f.write(article)
-
-            self.add_log(f"Article saved: {filename}", "success")
+            # 计入语料文档频率（TF-IDF 关键词提取用）
+            from keyword_extractor import record_article
+            await self.executor.run_blocking(record_article, article, filename, pool="io")
 
             # 构建预览内容（包含封面图）
             preview_content = article
             if cover_image_path:
                 preview_content = f"![封面图]({cover_image_path})\n\n" + article
 
-            current_status["result"] = {
+            self.status["result"] = {
                 "title": title,
                 "content": preview_content,
                 "ai_score": best_score,
@@ -947,28 +1273,60 @@ class TaskGenerator:
             }
 
             self.add_log("Complete!", "success")
-            current_status["running"] = False
+            self.status["running"] = False
 
         except Exception as e:
             self.add_log(f"Error: {str(e)}", "error")
-            current_status["error"] = str(e)
-            current_status["running"] = False
+            self.status["error"] = str(e)
+            self.status["running"] = False
 
     def run(self):
-        """运行任务"""
+        """同步运行任务（提交到共享事件循环并等待完成）"""
+        self.executor.run(self.run_async())
+
+    def submit(self):
+        """提交任务到共享事件循环，立即返回 Future（可 cancel() 取消）"""
+        return self.executor.submit(self.run_async())
+
+    async def run_async(self):
+        """运行任务（整个任务记录为一条追踪，见 tracing.py）"""
+        from tracing import start_trace, finish_trace
+        self.tracer = start_trace(self.job_id, name=f"generate:{self.provider}",
+                                  provider=self.provider, domain=self.domain)
+        self.job_id = self.tracer.job_id
+        self.status["job_id"] = self.job_id
+
+        # 开始前预估 token 用量和费用
+        from token_budget import forecast_job
+        forecast = forecast_job(self.provider)
+        self.status["token_forecast"] = forecast
+        self.add_log(f"Token forecast: ~{forecast['input_tokens']} in / ~{forecast['output_tokens']} out, "
+                     f"~${forecast['cost_usd']:.4f}", "info")
+
+        self.status["current_step"] = "Queued..."
+        await self.executor.job_slot()
         try:
             if self.provider == "gemini":
-                self.run_with_gemini()
+                await self.run_with_gemini()
             elif self.provider == "gemini-web":
-                self.run_with_gemini_web()
+                await self.run_with_gemini_web()
             elif self.provider == "gemini-deepseek":
-                self.run_with_gemini_deepseek()
+                await self.run_with_gemini_deepseek()
             else:
-                self.run_with_zhipu()
+                await self.run_with_zhipu()
+        except asyncio.CancelledError:
+            self.add_log("Stopped by user", "warning")
+            self.status["error"] = "Stopped by user"
+            self.status["running"] = False
+            raise
         except Exception as e:
             self.add_log(f"Fatal error: {str(e)}", "error")
-            current_status["error"] = str(e)
-            current_status["running"] = False
+            self.status["error"] = str(e)
+            self.status["running"] = False
+        finally:
+            self.executor.release_job_slot()
+            self._report_cost()
+            finish_trace(self.tracer, status="error" if self.status.get("error") else "ok")
 
 
 @app.route('/')
@@ -979,33 +1337,48 @@ def index():
 
 @app.route('/api/start', methods=['POST'])
 def start_task():
-    """启动任务"""
-    if current_status["running"]:
-        return jsonify({"error": "Task already running"})
+    """启动任务
 
+    JSON 参数 background=true 时作为后台任务运行：使用独立状态，可同时运行多个，
+    通过 /api/jobs/<job_id> 查询进度；否则为 Web 界面任务，状态写入 /api/status。
+    """
     data = request.json
     provider = data.get("provider", "gemini")
     domain = data.get("domain", "情感,心理")
+    background = bool(data.get("background"))
+
+    if not background and current_status["running"]:
+        return jsonify({"error": "Task already running"})
 
-    # 重置状态
-    current_status["running"] = True
-    current_status["progress"] = 0
-    current_status["current_step"] = "Initializing..."
-    current_status["logs"] = []
-    current_status["result"] = None
-    current_status["error"] = None
-    current_status["provider"] = provider
+    from tracing import new_job_id
+    job_id = new_job_id()
 
-    # 启动任务线程
-    def task_thread():
-        generator = TaskGenerator(provider=provider, domain=domain)
-        generator.run()
+    if background:
+        status = new_job_status(provider)
+    else:
+        # 上一个界面任务在登记表中改存快照，再重置状态
+        for entry in job_registry.values():
+            if entry["status"] is current_status:
+                entry["status"] = dict(current_status)
+        current_status.update(new_job_status(provider))
+        status = current_status
+    status["job_id"] = job_id
 
-    thread = threading.Thread(target=task_thread)
-    thread.daemon = True
-    thread.start()
+    # 提交到共享事件循环（不再每个任务一个线程）
+    generator = TaskGenerator(provider=provider, domain=domain, job_id=job_id, status=status)
+    job_registry[job_id] = {"status": status, "future": generator.submit()}
+    while len(job_registry) > MAX_JOB_REGISTRY:
+        job_registry.popitem(last=False)
 
-    return jsonify({"success": True, "message": f"Task started with {provider}"})
+    return jsonify({"success": True, "message": f"Task started with {provider}", "job_id": job_id})
+
+
+@app.route('/api/forecast')
+def get_forecast():
+    """任务开始前预估 token 用量和费用（?provider=gemini-deepseek）"""
+    from token_budget import forecast_job
+    provider = request.args.get('provider', 'gemini')
+    return jsonify({"success": True, "forecast": forecast_job(provider)})
 
 
 @app.route('/api/status')
@@ -1014,9 +1387,172 @@ def get_status():
     return jsonify(current_status)
 
 
+@app.route('/api/jobs')
+def list_jobs():
+    """最近任务列表（带追踪）和执行器概况"""
+    from tracing import list_traces
+    from pipeline_executor import get_executor
+    jobs = list_traces()
+    for job in jobs:
+        entry = job_registry.get(job["job_id"])
+        if entry:
+            job["running"] = entry["status"]["running"]
+            job["progress"] = entry["status"]["progress"]
+    return jsonify({"success": True, "jobs": jobs, "executor": get_executor().stats()})
+
+
+@app.route('/api/jobs/<job_id>')
+def get_job_status(job_id):
+    """查询单个任务的状态（结构与 /api/status 相同）"""
+    entry = job_registry.get(job_id)
+    if entry is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return jsonify(entry["status"])
+
+
+@app.route('/api/jobs/<job_id>/stop', methods=['POST'])
+def stop_job(job_id):
+    """取消单个任务"""
+    entry = job_registry.get(job_id)
+    if entry is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    entry["future"].cancel()
+    entry["status"]["running"] = False
+    entry["status"]["current_step"] = "Stopped by user"
+    return jsonify({"success": True, "message": "Task stopped"})
+
+
+@app.route('/api/jobs/<job_id>/trace')
+def get_job_trace(job_id):
+    """导出任务追踪（Chrome trace-viewer 格式，?download=1 作为附件下载）"""
+    from tracing import get_trace
+    trace = get_trace(job_id)
+    if trace is None:
+        return jsonify({"success": False, "error": "Trace not found"}), 404
+
+    response = make_response(json.dumps(trace, ensure_ascii=False))
+    response.headers['Content-Type'] = 'application/json; charset=utf-8'
+    if request.args.get('download'):
+        response.headers['Content-Disposition'] = f'attachment; filename=trace_{job_id}.json'
+    return response
+
+
+def _admin_allowed():
+    """管理接口鉴权：配置了 ADMIN_TOKEN 时校验 X-Admin-Token 头或 ?token=，否则只允许本机访问"""
+    token = os.getenv("ADMIN_TOKEN")
+    if token:
+        return (request.headers.get("X-Admin-Token") or request.args.get("token")) == token
+    return request.remote_addr in ("127.0.0.1", "::1", None)
+
+
+@app.route('/api/admin/profile/start', methods=['POST'])
+def admin_profile_start():
+    """开始全线程 CPU 栈采样（可选 JSON 参数 interval，单位秒，默认 0.005）"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    from profiler import start_profiler
+    interval = (request.get_json(silent=True) or {}).get("interval", 0.005)
+    profiler = start_profiler(interval)
+    return jsonify({"success": True, "profile": profiler.summary(top=0)})
+
+
+@app.route('/api/admin/profile/stop', methods=['POST'])
+def admin_profile_stop():
+    """停止 CPU 采样并返回 collapsed stacks（text/plain，?format=json 返回概况）"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    from profiler import stop_profiler
+    profiler = stop_profiler()
+    if profiler is None:
+        return jsonify({"success": False, "error": "Profiler not started"})
+
+    if request.args.get('format') == 'json':
+        return jsonify({"success": True, "profile": profiler.summary()})
+    response = make_response(profiler.collapsed())
+    response.headers['Content-Type'] = 'text/plain; charset=utf-8'
+    response.headers['Content-Disposition'] = 'attachment; filename=profile.collapsed.txt'
+    return response
+
+
+@app.route('/api/admin/profile')
+def admin_profile_status():
+    """当前（或最近一次）CPU 采样的概况"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    from profiler import get_profiler
+    profiler = get_profiler()
+    if profiler is None:
+        return jsonify({"success": True, "profile": None})
+    return jsonify({"success": True, "profile": profiler.summary()})
+
+
+@app.route('/api/admin/memory/snapshot', methods=['POST'])
+def admin_memory_snapshot():
+    """拍 tracemalloc 快照并返回与上一次快照的差异（首次调用只建立基线）"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    from profiler import take_memory_snapshot
+    data = request.get_json(silent=True) or {}
+    key_type = data.get("group_by", "lineno")
+    if key_type not in ("lineno", "filename", "traceback"):
+        key_type = "lineno"
+    result = take_memory_snapshot(frames=int(data.get("frames", 10)), top=int(data.get("top", 30)), key_type=key_type)
+    return jsonify({"success": True, **result})
+
+
+@app.route('/api/admin/memory/stop', methods=['POST'])
+def admin_memory_stop():
+    """停止 tracemalloc（追踪本身有开销，排查完记得关闭）"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    from profiler import stop_memory_tracking
+    stop_memory_tracking()
+    return jsonify({"success": True, "tracing": False})
+
+
+@app.route('/api/models')
+def get_models():
+    """模型注册表：各模型的可用性、实测延迟、错误率，以及各流程各步骤按路由策略选中的模型"""
+    from model_registry import get_model_registry
+    from model_router import routing_table
+    from token_budget import PIPELINE_STEPS
+    routing = {pipeline: routing_table(pipeline, steps) for pipeline, steps in PIPELINE_STEPS.items()}
+    return jsonify({"success": True, **get_model_registry().snapshot(), "routing": routing})
+
+
+@app.route('/api/prompt-cache')
+def get_prompt_cache():
+    """提示词缓存：各服务商输入 token 的缓存命中率，以及 Gemini 显式缓存的创建、复用次数"""
+    from prompt_cache import cache_summary
+    return jsonify({"success": True, **cache_summary()})
+
+
+@app.route('/api/admin/keys')
+def admin_keys():
+    """各服务商 Key 池的调用数、在途请求、限流次数和冷却剩余时间（Key 已脱敏）"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    from key_pool import pool_stats
+    return jsonify({"success": True, "pools": pool_stats()})
+
+
+@app.route('/api/admin/models/refresh', methods=['POST'])
+def admin_models_refresh():
+    """立即刷新模型注册表（list_models + 探测调用，在后台线程执行）"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    from model_registry import get_model_registry
+    import threading
+    threading.Thread(target=get_model_registry().refresh, name="model-registry-refresh", daemon=True).start()
+    return jsonify({"success": True, "message": "Refresh started"})
+
+
 @app.route('/api/stop', methods=['POST'])
 def stop_task():
     """停止任务"""
+    entry = job_registry.get(current_status.get("job_id"))
+    if entry is not None:
+        entry["future"].cancel()
     current_status["running"] = False
     current_status["current_step"] = "Stopped by user"
     return jsonify({"success": True, "message": "Task stopped"})
@@ -1029,6 +1565,7 @@ def upload_to_wechat():
         data = request.json
         title = data.get("title")
         content = data.get("content")
+        theme = data.get("theme", "default")
 
         if not title or not content:
             return jsonify({"success": False, "error": "标题或内容不能为空"})
@@ -1063,16 +1600,25 @@ def upload_to_wechat():
             })
 
         # 转换 Markdown 为 HTML
-        html_content = uploader.markdown_to_html(content)
-
-        # 上传到草稿箱
-        success = uploader.upload_draft(
-            title=title,
-            content=html_content,
-            author="AI助手",
-            digest=f"{title} - AI自动生成",
-            show_cover_pic=0  # 暂时不显示封面（需要额外配置）
-        )
+        html_content = uploader.markdown_to_html(content, theme=theme)
+
+        async def publish():
+            # 上传正文中的本地图片（如封面图）并替换为微信地址
+            html = await uploader.upload_content_images_async(
+                html_content, base_dir=os.path.dirname(os.path.abspath(__file__)))
+
+            # 上传到草稿箱
+            return await uploader.upload_draft_async(
+                title=title,
+                content=html,
+                author="AI助手",
+                digest=f"{title} - AI自动生成",
+                show_cover_pic=0  # 暂时不显示封面（需要额外配置）
+            )
+
+        # 微信接口调用在共享事件循环上执行（异步 HTTP）
+        from pipeline_executor import get_executor
+        success = get_executor().run(publish())
 
         if success:
             return jsonify({
@@ -1251,95 +1797,14 @@ def get_history():
     # 禁用缓存
     from flask import make_response
     try:
-        import glob
-        import os
-        from datetime import datetime
+        from history import list_history
 
         # 获取分页参数
         page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 10))
 
-        # 获取所有文章文件
-        files = glob.glob("article*.md")
-        files.sort(key=lambda x: os.path.getmtime(x), reverse=True)  # 按修改时间倒序
-
-        # 分页
-        total = len(files)
-        start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        files_page = files[start_idx:end_idx]
-
-        history = []
-        for filepath in files_page:
-            try:
-                filename = os.path.basename(filepath)
-                stat = os.stat(filepath)
-                size = stat.st_size
-                mtime = stat.st_mtime
-
-                # 读取文件前几行获取标题和provider
-                title = filename  # 默认使用文件名
-                provider = "Unknown"
-                ai_score = None
-
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    in_comment = False
-                    title_found = False  # 标记是否已找到标题
-
-                    for i, line in enumerate(f):
-                        # 检查HTML注释格式的元数据
-                        if line.strip() == '<!--':
-                            in_comment = True
-                            continue
-                        if line.strip() == '-->':
-                            in_comment = False
-                            continue
-                        if in_comment:
-                            if 'Title:' in line:
-                                title = line.split('Title:')[1].strip()
-                                title_found = True
-                            elif 'Provider:' in line:
-                                provider = line.split('Provider:')[1].strip()
-                            elif 'AI Score:' in line:
-                                score_text = line.split('AI Score:')[1].strip()
-                                ai_score = score_text.replace('%', '').strip()
-                            continue
-
-                        # 旧格式兼容（如果不在注释中）
-                        elif i < 15:  # 只检查前15行
-                            # 尝试解析 Markdown 标题 (# 标题)
-                            if not title_found and line.strip().startswith('# '):
-                                title = line.strip()[2:].strip()
-                                title_found = True
-                            # 旧格式的 **Provider**: xxx
-                            elif '**Provider**' in line or 'Provider**' in line:
-                                provider = line.split('**:**')[1].strip() if '**:**' in line else line.replace('**Provider**: ', '').replace('**Provider**:', '').strip()
-                            # 旧格式的 **AI Score**: xxx
-                            elif '**AI Score**' in line or 'AI Score**' in line:
-                                score_text = line.split('**:**')[1].strip() if '**:**' in line else line.replace('**AI Score**: ', '').replace('**AI Score**:', '').strip()
-                                ai_score = score_text.replace('%', '').strip()
-
-                # 简化provider名称（注意：更具体的判断要放在前面）
-                provider_short = provider
-                if 'Gemini 3 Pro' in provider:
-                    provider_short = 'Gemini API'
-                elif 'Gemini Web + DeepSeek' in provider:
-                    provider_short = 'Gemini Web + DeepSeek'
-                elif 'Gemini Web' in provider:
-                    provider_short = 'Gemini Web'
-                elif 'Zhipu GLM' in provider:
-                    provider_short = '智谱 GLM'
-
-                history.append({
-                    "filename": filename,
-                    "title": title,
-                    "size": size,
-                    "modified_time": mtime,
-                    "provider": provider_short,
-                    "ai_score": ai_score
-                })
-            except Exception as e:
-                print(f"Error reading file {filepath}: {e}")
+        # 从文章存储的索引列分页读取（按创建时间倒序，不解压正文）
+        history, total = list_history(page, per_page)
 
         response = make_response(jsonify({
             "success": True,
@@ -1365,29 +1830,79 @@ def get_history():
 def get_history_file(filename):
     """读取历史文章内容"""
     try:
-        import os
+        from history import read_article
 
-        # 安全检查：确保文件名不包含路径
+        # 安全检查：确保文件名不包含路径，且是文章文件
         if '/' in filename or '\\' in filename:
             return jsonify({"success": False, "error": "Invalid filename"})
 
-        filepath = os.path.join(os.path.dirname(__file__), filename)
+        if not filename.startswith("article"):
+            return jsonify({"success": False, "error": "Invalid file"})
 
-        # 确保文件存在且是文章文件
-        if not os.path.exists(filepath):
+        content = read_article(filename)
+        if content is None:
             return jsonify({"success": False, "error": "File not found"})
 
+        return jsonify({
+            "success": True,
+            "filename": filename,
+            "content": content
+        })
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.route('/api/history/<filename>/html')
+def get_history_html(filename):
+    """渲染历史文章为公众号 HTML（带主题内联样式）"""
+    try:
+        from history import read_article
+        from wechat_renderer import render_wechat_html
+
+        # 安全检查：确保文件名不包含路径
+        if '/' in filename or '\\' in filename:
+            return jsonify({"success": False, "error": "Invalid filename"})
+
         if not filename.startswith("article"):
             return jsonify({"success": False, "error": "Invalid file"})
 
-        # 读取文件内容
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
+        content = read_article(filename)
+        if content is None:
+            return jsonify({"success": False, "error": "File not found"})
+
+        theme = request.args.get('theme', 'default')
 
         return jsonify({
             "success": True,
             "filename": filename,
-            "content": content
+            "theme": theme,
+            "html": render_wechat_html(content, theme)
+        })
+
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)})
+
+
+@app.route('/api/history/<filename>/drafts')
+def get_history_drafts(filename):
+    """文章优化过程中的各版草稿和评分（?content=1 时返回还原后的全文）"""
+    try:
+        from article_store import get_article_store, article_id_from_filename
+
+        article_id = article_id_from_filename(filename)
+        if article_id is None:
+            return jsonify({"success": False, "error": "Invalid file"})
+
+        drafts = get_article_store().drafts(article_id, content=request.args.get('content') == '1')
+        scored = [d for d in drafts if d["score"] is not None]
+        return jsonify({
+            "success": True,
+            "filename": filename,
+            "drafts": drafts,
+            "best_iteration": min(scored, key=lambda d: d["score"])["iteration"] if scored else None,
+            "raw_bytes": sum(d["size"] for d in drafts),
+            "stored_bytes": sum(d["stored_bytes"] for d in drafts)
         })
 
     except Exception as e:
@@ -1463,9 +1978,49 @@ def save_prompts_config():
 
 @app.route('/cover/<path:filename>')
 def serve_cover(filename):
-    """提供封面图片访问"""
+    """提供封面图片访问
+
+    查询参数：
+        thumb: 返回指定宽度的预览缩略图（如 ?thumb=360）
+        max_kb: 返回不超过该大小的压缩版本（如 ?max_kb=64）
+    """
     import os
-    cover_dir = os.path.dirname(__file__)
+    from article_store import get_article_store
+
+    # /cover/covers/... 为文章存储中的封面（见 ArticleStore.cover_ref，存储目录可在项目目录之外），
+    # 其余按项目目录解析（旧版 ./cover_xxx.png）
+    if filename.startswith("covers/"):
+        cover_dir = os.path.join(get_article_store().directory, "covers")
+        filename = filename[len("covers/"):]
+    else:
+        cover_dir = os.path.dirname(os.path.abspath(__file__))
+
+    thumb = request.args.get('thumb', type=int)
+    max_kb = request.args.get('max_kb', type=int)
+    if thumb or max_kb:
+        from werkzeug.utils import safe_join
+        from cover_encoder import encode_cover, make_thumbnail
+
+        src_path = safe_join(cover_dir, filename)
+        if not src_path or not os.path.isfile(src_path):
+            return jsonify({"success": False, "error": "File not found"}), 404
+
+        fmt = request.args.get('format', 'jpeg').upper()
+        if fmt not in ("JPEG", "WEBP"):
+            fmt = "JPEG"
+
+        try:
+            if thumb:
+                variant = make_thumbnail(src_path, width=max(32, min(thumb, 1080)), fmt=fmt)
+            else:
+                variant = encode_cover(src_path, max_bytes=max(8, max_kb) * 1024, fmt=fmt)
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 500
+
+        response = send_from_directory(os.path.dirname(variant), os.path.basename(variant))
+        response.headers['Cache-Control'] = 'public, max-age=86400'
+        return response
+
     return send_from_directory(cover_dir, filename)
 
 
@@ -1481,4 +2036,11 @@ if __name__ == '__main__':
     print("=" * 60)
     print()
 
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    # 加载模型注册表缓存并启动后台刷新（不阻塞启动）；debug 模式下重载器的父进程只监视文件，
+    # 只在实际提供服务的子进程中启动，避免父子进程各探测一遍、消耗两份探测配额
+    debug = True
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        from model_registry import get_model_registry
+        get_model_registry()
+
+    app.run(debug=debug, host='0.0.0.0', port=5000)
@@ -0,0 +1,551 @@
+"""
+文章存储
+功能：文章正文 zlib 压缩后以追加方式写入 SQLite（WAL 模式），标题、服务商、AI 评分等元数据单独成列，
+      列表和分页只查索引列、不读正文；文章 ID 由任务 ID（时间戳 + 随机后缀）生成，并发任务不会互相覆盖；
+      封面图按 ID 哈希分片存放（covers/ab/），单个目录不会堆积上万个文件；
+      首次打开时自动把旧版散落在项目目录下的 article_*.md / article_*_data.json 导入，原文件移到 legacy/；
+      优化循环的每一版草稿和评分都以相对上一版的差量保存（按句子 diff，以上一版为 zlib 预设字典压缩），
+      可事后重新挑选最佳版本、断点续写或分析改写效果，十几版草稿大约只占一篇文章的空间
+
+目录结构（ARTICLE_STORE_DIR，默认项目目录下的 articles/）：
+    articles.db         元数据 + 压缩正文
+    covers/ab/*.png     封面图（按文章 ID 的哈希前两位分片）
+    legacy/ab/*.md      已导入的旧版文章文件
+
+环境变量：
+    ARTICLE_STORE_DIR   存储目录（旧版文章从该目录的上一级导入）
+
+用法：
+    python article_store.py                  # 查看统计
+    python article_store.py migrate [目录]   # 导入旧版文章文件
+    python article_store.py backup <文件>    # 在线备份数据库（不阻塞写入）
+    python article_store.py export <目录>    # 导出为 .md 文件
+    python article_store.py drafts <文章ID>  # 查看文章的各版草稿和评分
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import difflib
+import glob
+import shutil
+import sqlite3
+import hashlib
+import threading
+
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_DIR = os.path.join(PROJECT_DIR, "articles")
+
+# 压缩级别（6 是 zlib 默认值，文章正文压缩率约 2~3 倍）
+COMPRESS_LEVEL = 6
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    title TEXT,
+    provider TEXT,
+    ai_score TEXT,
+    size INTEGER NOT NULL,
+    cover TEXT,
+    body BLOB NOT NULL,
+    data BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_articles_created ON articles (created_at DESC);
+CREATE TABLE IF NOT EXISTS drafts (
+    article_id TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    score INTEGER,
+    size INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    blob BLOB NOT NULL,
+    PRIMARY KEY (article_id, iteration)
+);
+"""
+
+# 每隔多少版草稿存一次全文（限制还原一版草稿需要回放的差量数）
+KEYFRAME_INTERVAL = 10
+
+# 差量的切分单位：句子（以句末标点或换行结尾），改写通常只动其中一部分
+_SENTENCE_RE = re.compile(r'[^。！？!?\n]*(?:[。！？!?]+[”"』」）)]?|\n)|[^。！？!?\n]+$')
+
+
+def _compress(text):
+    return zlib.compress(text.encode('utf-8'), COMPRESS_LEVEL)
+
+
+def _decompress(blob):
+    return zlib.decompress(blob).decode('utf-8')
+
+
+def _split_sentences(text):
+    return _SENTENCE_RE.findall(text)
+
+
+def encode_delta(previous, text):
+    """
+    计算 text 相对 previous 的差量
+
+    Returns:
+        bytes: 差量（JSON 操作列表：[起, 止] 表示复用上一版的句子区间，字符串表示新增内容），
+               以上一版全文为预设字典压缩，改写后重复出现的词句也能被压缩掉
+    """
+    old = _split_sentences(previous)
+    new = _split_sentences(text)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            inserted = "".join(new[j1:j2])
+            if ops and isinstance(ops[-1], str):
+                ops[-1] += inserted
+            else:
+                ops.append(inserted)
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zdict=_zdict(previous))
+    payload = json.dumps(ops, ensure_ascii=False).encode('utf-8')
+    return compressor.compress(payload) + compressor.flush()
+
+
+def apply_delta(previous, delta):
+    """用 encode_delta 的结果从上一版还原草稿"""
+    decompressor = zlib.decompressobj(zdict=_zdict(previous))
+    ops = json.loads((decompressor.decompress(delta) + decompressor.flush()).decode('utf-8'))
+    old = _split_sentences(previous)
+    return "".join(op if isinstance(op, str) else "".join(old[op[0]:op[1]]) for op in ops)
+
+
+def _zdict(text):
+    # zlib 的窗口只有 32KB，预设字典取末尾部分
+    return text.encode('utf-8')[-32768:]
+
+
+def article_id_from_filename(filename):
+    """文件名（article_xxx.md）转文章 ID；不是文章文件名时返回 None"""
+    name = os.path.basename(filename)
+    if name != filename or not name.startswith("article"):
+        return None
+    return name[:-3] if name.endswith(".md") else name
+
+
+def shard_of(article_id):
+    """文章 ID 的分片目录名（哈希前两位，共 256 个分片）"""
+    return hashlib.sha1(article_id.encode('utf-8')).hexdigest()[:2]
+
+
+class ArticleStore:
+    """文章存储（线程安全：每个线程使用独立连接）"""
+
+    def __init__(self, directory=DEFAULT_STORE_DIR):
+        """
+        Args:
+            directory: 存储目录
+        """
+        self.directory = os.path.abspath(directory)
+        self.db_path = os.path.join(self.directory, "articles.db")
+        self._local = threading.local()
+        os.makedirs(self.directory, exist_ok=True)
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def cover_dir(self, article_id):
+        """文章封面图的分片目录（绝对路径，不存在时创建）"""
+        path = os.path.join(self.directory, "covers", shard_of(article_id))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cover_ref(self, path):
+        """
+        封面图在正文中的引用路径
+
+        存储目录内的封面用相对存储目录的 /cover/covers/...（/cover/<path> 路由按存储目录解析，
+        ARTICLE_STORE_DIR 在项目目录之外时同样可以预览和上传）；项目目录内的其他图片用 ./相对路径
+        """
+        path = os.path.abspath(path)
+        if os.path.commonpath([path, self.directory]) == self.directory:
+            return "/cover/" + os.path.relpath(path, self.directory).replace(os.sep, "/")
+        if os.path.commonpath([path, PROJECT_DIR]) == PROJECT_DIR:
+            return "./" + os.path.relpath(path, PROJECT_DIR).replace(os.sep, "/")
+        return path
+
+    def save(self, article_id, content, title=None, provider=None, ai_score=None, cover=None,
+             data=None, created_at=None):
+        """
+        追加一篇文章（ID 已存在时报错，不覆盖）
+
+        Args:
+            article_id: 文章 ID（以 article 开头）
+            content: 完整的 Markdown 内容（含元数据注释头）
+            title: 标题
+            provider: 服务商
+            ai_score: AI 评分
+            cover: 封面图路径
+            data: 附加数据（可 JSON 序列化，压缩存储）
+            created_at: 创建时间戳（默认当前时间）
+
+        Returns:
+            str: 文件名（article_id.md，历史接口用它定位文章）
+        """
+        body = _compress(content)
+        extra = _compress(json.dumps(data, ensure_ascii=False)) if data is not None else None
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO articles (id, created_at, title, provider, ai_score, size, cover, body, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (article_id, created_at or time.time(), title, provider,
+                 None if ai_score is None else str(ai_score).replace('%', '').strip(),
+                 len(content.encode('utf-8')), cover, body, extra)
+            )
+        return f"{article_id}.md"
+
+    def exists(self, article_id):
+        row = self._conn().execute("SELECT 1 FROM articles WHERE id = ?", (article_id,)).fetchone()
+        return row is not None
+
+    def get(self, article_id):
+        """
+        读取一篇文章
+
+        Returns:
+            dict: {"id", "filename", "title", "provider", "ai_score", "size", "cover", "created_at",
+                   "content", "data"}，不存在返回 None
+        """
+        row = self._conn().execute(
+            "SELECT id, created_at, title, provider, ai_score, size, cover, body, data FROM articles WHERE id = ?",
+            (article_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0],
+            "filename": f"{row[0]}.md",
+            "created_at": row[1],
+            "title": row[2],
+            "provider": row[3],
+            "ai_score": row[4],
+            "size": row[5],
+            "cover": row[6],
+            "content": _decompress(row[7]),
+            "data": json.loads(_decompress(row[8])) if row[8] is not None else None
+        }
+
+    def read(self, filename):
+        """按文件名读取 Markdown 内容（不存在返回 None）"""
+        article_id = article_id_from_filename(filename)
+        if article_id is None:
+            return None
+        row = self._conn().execute("SELECT body FROM articles WHERE id = ?", (article_id,)).fetchone()
+        return _decompress(row[0]) if row else None
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+
+    def list(self, offset=0, limit=10):
+        """
+        按创建时间倒序列出文章元数据（只读索引列，不解压正文）
+
+        Returns:
+            list: [{"filename", "title", "size", "modified_time", "provider", "ai_score"}]
+        """
+        from history import _short_provider
+
+        rows = self._conn().execute(
+            "SELECT id, created_at, title, provider, ai_score, size FROM articles "
+            "ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            (limit, offset)
+        ).fetchall()
+        return [
+            {
+                "filename": f"{row[0]}.md",
+                "title": row[2] or row[0],
+                "size": row[5],
+                "modified_time": row[1],
+                "provider": _short_provider(row[3] or "Unknown"),
+                "ai_score": row[4]
+            }
+            for row in rows
+        ]
+
+    def iter_ids(self):
+        """按创建时间倒序的全部文章 ID"""
+        return [row[0] for row in self._conn().execute("SELECT id FROM articles ORDER BY created_at DESC")]
+
+    def save_draft(self, article_id, iteration, text, score=None, previous=None):
+        """
+        追加一版草稿（相对上一版存差量；没有上一版、到了关键帧或差量不比全文小时存全文）
+
+        Args:
+            article_id: 文章 ID
+            iteration: 版本号（从 1 开始，每篇文章内递增）
+            text: 草稿全文
+            score: 该版的 AI 评分
+            previous: 上一版全文（调用方持有，避免回读数据库）
+
+        Returns:
+            int: 实际写入的字节数
+        """
+        full = _compress(text)
+        blob, kind = full, "full"
+        if previous is not None and iteration % KEYFRAME_INTERVAL != 1:
+            delta = encode_delta(previous, text)
+            if len(delta) < len(full):
+                blob, kind = delta, "delta"
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO drafts (article_id, iteration, created_at, score, size, kind, blob) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (article_id, iteration, time.time(), score, len(text.encode('utf-8')), kind, blob)
+            )
+        return len(blob)
+
+    def drafts(self, article_id, content=True):
+        """
+        按版本顺序读取文章的全部草稿（依次回放差量还原全文）
+
+        Args:
+            article_id: 文章 ID
+            content: 是否还原全文（只看评分和大小时传 False）
+
+        Returns:
+            list: [{"iteration", "score", "size", "stored_bytes", "kind", "created_at", "content"}]
+        """
+        rows = self._conn().execute(
+            "SELECT iteration, created_at, score, size, kind, blob FROM drafts "
+            "WHERE article_id = ? ORDER BY iteration",
+            (article_id,)
+        ).fetchall()
+        result = []
+        text = None
+        for iteration, created_at, score, size, kind, blob in rows:
+            item = {"iteration": iteration, "score": score, "size": size, "stored_bytes": len(blob),
+                    "kind": kind, "created_at": created_at}
+            if content:
+                text = _decompress(blob) if kind == "full" else apply_delta(text, blob)
+                item["content"] = text
+            result.append(item)
+        return result
+
+    def best_draft(self, article_id):
+        """评分最低的一版草稿（没有评分记录时返回 None）"""
+        scored = [d for d in self.drafts(article_id) if d["score"] is not None]
+        return min(scored, key=lambda d: d["score"]) if scored else None
+
+    def migrate_legacy(self, directory=None, move=True):
+        """
+        导入旧版文章文件（article*.md，以及同名的 _data.json）
+
+        Args:
+            directory: 旧版文件所在目录（默认项目目录，旧版写稿流程把文章写在这里；
+                       不能用存储目录的上一级，自定义 ARTICLE_STORE_DIR 时那里可能是任意目录）
+            move: 导入后把原文件移到 legacy/ 分片目录
+
+        Returns:
+            dict: {"success": bool, "imported": int, "skipped": int, "error": str}
+        """
+        from history import parse_headers
+
+        directory = directory or PROJECT_DIR
+        imported = skipped = 0
+        try:
+            paths = sorted(glob.glob(os.path.join(directory, "article*.md")))
+            if not paths:
+                return {"success": True, "imported": 0, "skipped": 0}
+            # 文件较多时在进程池中并行解析文件头
+            headers = {h["filename"]: h for h in parse_headers(paths)}
+            for path in paths:
+                article_id = article_id_from_filename(os.path.basename(path))
+                data_path = os.path.join(directory, f"{article_id}_data.json")
+                if self.exists(article_id):
+                    skipped += 1
+                else:
+                    header = headers.get(os.path.basename(path), {})
+                    with open(path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                    data = None
+                    if os.path.exists(data_path):
+                        with open(data_path, 'r', encoding='utf-8') as f:
+                            data = json.load(f)
+                    # 旧文件的服务商保留原始写法，列表展示时再缩写
+                    self.save(article_id, content, title=header.get("title"),
+                              provider=_legacy_provider(content) or header.get("provider"),
+                              ai_score=header.get("ai_score"), data=data,
+                              created_at=os.path.getmtime(path))
+                    imported += 1
+                if move:
+                    legacy_dir = os.path.join(self.directory, "legacy", shard_of(article_id))
+                    os.makedirs(legacy_dir, exist_ok=True)
+                    for src in (path, data_path):
+                        if os.path.exists(src):
+                            shutil.move(src, os.path.join(legacy_dir, os.path.basename(src)))
+            if imported:
+                print(f"[Store] ✓ 已导入 {imported} 篇旧版文章（跳过 {skipped} 篇已存在的）")
+            return {"success": True, "imported": imported, "skipped": skipped}
+        except Exception as e:
+            print(f"[Store] ✗ 导入旧版文章失败: {e}")
+            return {"success": False, "imported": imported, "skipped": skipped, "error": str(e)}
+
+    def backup(self, dest_path):
+        """
+        在线备份数据库到单个文件（SQLite backup API，备份期间仍可写入）
+
+        Returns:
+            dict: {"success": bool, "path": str, "articles": int, "error": str}
+        """
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(dest_path)), exist_ok=True)
+            target = sqlite3.connect(dest_path)
+            try:
+                self._conn().backup(target, pages=1024)
+            finally:
+                target.close()
+            count = self.count()
+            print(f"[Store] ✓ 已备份 {count} 篇文章到 {dest_path}")
+            return {"success": True, "path": dest_path, "articles": count}
+        except Exception as e:
+            print(f"[Store] ✗ 备份失败: {e}")
+            return {"success": False, "error": str(e)}
+
+    def export(self, output_dir, article_ids=None):
+        """
+        把文章导出为 .md 文件（与旧版文件格式一致）
+
+        Returns:
+            list: 导出的文件路径
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for article_id in article_ids or self.iter_ids():
+            content = self.read(f"{article_id}.md")
+            if content is None:
+                continue
+            path = os.path.join(output_dir, f"{article_id}.md")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            paths.append(path)
+        return paths
+
+    def stats(self):
+        """文章数、正文原始/压缩大小、草稿数和存储大小、数据库文件大小"""
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(body)), 0) FROM articles"
+        ).fetchone()
+        drafts = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(blob)), 0) FROM drafts"
+        ).fetchone()
+        return {
+            "directory": self.directory,
+            "articles": row[0],
+            "raw_bytes": row[1],
+            "compressed_bytes": row[2],
+            "drafts": drafts[0],
+            "draft_raw_bytes": drafts[1],
+            "draft_stored_bytes": drafts[2],
+            "db_bytes": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0
+        }
+
+
+def _legacy_provider(content):
+    """从元数据注释头中取原始的 Provider 写法"""
+    for line in content.splitlines()[:10]:
+        if line.startswith("Provider:"):
+            return line.split("Provider:", 1)[1].strip()
+    return None
+
+
+class DraftLog:
+    """
+    一篇文章的草稿记录（优化循环中每评一版调用一次 add）
+
+    记录失败只打印警告，不影响写稿流程
+    """
+
+    def __init__(self, article_id, store=None):
+        """
+        Args:
+            article_id: 文章 ID
+            store: 文章存储（默认共享实例）
+        """
+        self.article_id = article_id
+        self.store = store
+        self.iteration = 0
+        self.stored_bytes = 0
+        self._previous = None
+
+    def add(self, text, score=None):
+        """
+        记录一版草稿
+
+        Returns:
+            int: 版本号（记录失败返回 None）
+        """
+        try:
+            store = self.store or get_article_store()
+            self.stored_bytes += store.save_draft(self.article_id, self.iteration + 1, text,
+                                                  score=score, previous=self._previous)
+            self.iteration += 1
+            self._previous = text
+            return self.iteration
+        except Exception as e:
+            print(f"[Store] ⚠ 保存草稿失败: {e}")
+            return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_article_store():
+    """获取进程内共享的文章存储（首次使用时创建数据库并导入旧版文章）"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArticleStore(os.getenv("ARTICLE_STORE_DIR") or DEFAULT_STORE_DIR)
+            _store.migrate_legacy()
+        return _store
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="文章存储")
+    parser.add_argument("command", nargs="?", default="stats", choices=["stats", "migrate", "backup", "export", "drafts"])
+    parser.add_argument("path", nargs="?",
+                        help="migrate: 旧版文件目录；backup: 备份文件；export: 输出目录；drafts: 文章 ID")
+    args = parser.parse_args()
+
+    store = ArticleStore(os.getenv("ARTICLE_STORE_DIR") or DEFAULT_STORE_DIR)
+    if args.command == "migrate":
+        store.migrate_legacy(args.path)
+    elif args.command == "backup":
+        if not args.path:
+            parser.error("backup 需要指定备份文件路径")
+        store.backup(args.path)
+    elif args.command == "export":
+        if not args.path:
+            parser.error("export 需要指定输出目录")
+        print(f"[Store] ✓ 已导出 {len(store.export(args.path))} 篇文章到 {args.path}")
+    elif args.command == "drafts":
+        if not args.path:
+            parser.error("drafts 需要指定文章 ID")
+        for draft in store.drafts(article_id_from_filename(args.path) or args.path, content=False):
+            print(f"  v{draft['iteration']:<3} score={draft['score']!s:>4}  {draft['size']:>7} B -> "
+                  f"{draft['stored_bytes']:>6} B ({draft['kind']})")
+    print(json.dumps(store.stats(), ensure_ascii=False, indent=2))
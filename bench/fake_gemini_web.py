@@ -0,0 +1,47 @@
+"""
+替身 gemini-web 脚本
+与 gemini-web skill 的 main.ts 命令行兼容：--promptfiles <文件> --json，输出 {"text": ...}
+请求转发到 BENCH_STUB_URL 指向的替身服务，使延迟和故障注入对子进程同样生效
+"""
+
+import argparse
+import json
+import os
+import sys
+import urllib.request
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--promptfiles", nargs="+", required=True)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    prompt = ""
+    for path in args.promptfiles:
+        with open(path, 'r', encoding='utf-8') as f:
+            prompt += f.read()
+
+    base_url = os.environ.get("BENCH_STUB_URL", "http://127.0.0.1:8765")
+    request = urllib.request.Request(
+        f"{base_url}/gemini/generate",
+        data=json.dumps({"prompt": prompt}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            text = json.loads(response.read())["text"]
+    except Exception as e:
+        print(f"gemini-web stub error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # 模拟真实脚本：先输出日志行，再输出 JSON
+    print("[gemini-web] stub bridge")
+    if args.json:
+        print(json.dumps({"text": text}, ensure_ascii=False))
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
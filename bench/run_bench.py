@@ -0,0 +1,425 @@
+"""
+离线压测脚本
+功能：启动本地替身服务，端到端驱动 TaskGenerator、AutoArticleSystem 和 Flask 接口，
+      统计每分钟完成任务数、各步骤 p50/p95 延迟和峰值内存，全程不消耗真实配额
+
+使用方法（在项目根目录）：
+    python -m bench.run_bench
+    python -m bench.run_bench --jobs 5 --latency 300 --sigma 0.6 --error-rate 0.05 --rate-429 0.05
+    python -m bench.run_bench --targets zhipu,gemini-deepseek,flask --json bench_result.json
+
+录制/回放（回放时服务商调用不经过网络，结果可逐次复现）：
+    python -m bench.run_bench --seed 1 --record cassettes/bench.jsonl
+    python -m bench.run_bench --replay cassettes/bench.jsonl --replay-speed 1
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from bench.stub_servers import StubConfig, StubServer, StubGenerativeModel, StubCachedContent  # noqa: E402
+
+
+ALL_TARGETS = ["gemini", "zhipu", "gemini-web", "gemini-deepseek", "system", "flask", "concurrent", "prompt-cache"]
+
+
+def percentile(values, pct):
+    """线性插值百分位"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    low = int(k)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (k - low)
+
+
+def configure_environment(stub, work_dir):
+    """把所有外部服务指向替身服务（必须在导入业务模块前调用）"""
+    os.environ.update({
+        "BENCH_STUB_URL": stub.url,
+        "GEMINI_API_KEY": "bench-gemini-key",
+        "DEEPSEEK_API_KEY": "bench-deepseek-key",
+        "DEEPSEEK_BASE_URL": f"{stub.url}/deepseek/v1",
+        "ZHIPU_API_KEY": "bench.secret",
+        "ZHIPUAI_BASE_URL": f"{stub.url}/zhipu/api/paas/v4",
+        "GPTZERO_API_URL": f"{stub.url}/gptzero/v2/predict/text",
+        "GEMINI_WEB_SCRIPT": os.path.join(PROJECT_DIR, "bench", "fake_gemini_web.py"),
+        "GEMINI_WEB_RUNNER": f'"{sys.executable}"',
+        "WECHAT_APP_ID": "bench-app-id",
+        "WECHAT_APP_SECRET": "bench-app-secret",
+        "WECHAT_API_BASE": f"{stub.url}/wechat/cgi-bin/",
+        "WECHAT_ACCESS_TOKEN": "stub-access-token",
+        "OPENAI_API_KEY": "",
+        "USE_PLACEHOLDER_COVER": "true",
+        "COVER_CACHE_DIR": os.path.join(work_dir, "cover_cache"),
+        "TRACE_DIR": os.path.join(work_dir, "traces"),
+        "MODEL_REGISTRY_FILE": os.path.join(work_dir, "model_registry.json"),
+        "MODEL_REGISTRY_REFRESH": "false",
+        "ARTICLE_STORE_DIR": os.path.join(work_dir, "articles"),
+    })
+
+    # 关键词语料文件放到临时目录，避免污染项目目录
+    import keyword_extractor
+    keyword_extractor._df = keyword_extractor.DocumentFrequency(os.path.join(work_dir, "keyword_df.json"))
+
+    # 临时文章存储不导入项目目录中的旧版文章（否则会把它们移进临时目录）
+    import article_store
+    article_store._store = article_store.ArticleStore(os.environ["ARTICLE_STORE_DIR"])
+
+    # Gemini SDK 不支持自定义 HTTP 地址，替换为转发到替身服务的模型
+    try:
+        import google.generativeai as genai
+        from google.generativeai import caching
+        model = lambda model_name="stub", *args, **kwargs: StubGenerativeModel(stub.url, model_name)
+        model.from_cached_content = lambda cached_content, **kwargs: StubGenerativeModel(
+            stub.url, cached_content.model, cached_content=cached_content.name)
+        genai.GenerativeModel = model
+        StubCachedContent.base_url = stub.url
+        caching.CachedContent = StubCachedContent
+    except ImportError:
+        pass
+
+
+class StepTimer:
+    """按 update_progress 的步骤切换记录每步耗时"""
+
+    def __init__(self):
+        self.durations = {}
+        self._current = None
+        self._started = None
+
+    def mark(self, step):
+        now = time.perf_counter()
+        if self._current is not None:
+            self.durations.setdefault(self._current, []).append(now - self._started)
+        self._current, self._started = step, now
+
+    def finish(self):
+        self.mark(None)
+        self._current = None
+
+
+def reset_status(app_module, provider):
+    """与 /api/start 相同的状态重置"""
+    status = app_module.current_status
+    status.update({
+        "running": True, "progress": 0, "current_step": "Initializing...",
+        "logs": [], "result": None, "error": None, "provider": provider
+    })
+
+
+def run_task_generator(provider, jobs, timer):
+    """直接驱动 TaskGenerator 跑完整流程"""
+    import app as app_module
+
+    class BenchTaskGenerator(app_module.TaskGenerator):
+        def update_progress(self, progress, step):
+            timer.mark(f"{provider}: {step.split('(')[0].strip()}")
+            super().update_progress(progress, step)
+
+    results = []
+    for _ in range(jobs):
+        reset_status(app_module, provider)
+        started = time.perf_counter()
+        BenchTaskGenerator(provider=provider, domain="情感,心理").run()
+        timer.finish()
+        status = app_module.current_status
+        results.append({
+            "ok": bool(status.get("result")) and not status.get("error"),
+            "seconds": time.perf_counter() - started,
+            "error": status.get("error")
+        })
+    return results
+
+
+def run_system(jobs, timer):
+    """驱动 main.py 的 AutoArticleSystem（生成 + 保存 + 上传草稿）"""
+    import main as main_module
+
+    system = main_module.AutoArticleSystem()
+    system.max_iterations = 3
+    if system.gemini:
+        for name in ("research_topic", "write_article", "evaluate_ai_score", "humanize_rewrite"):
+            original = getattr(system.gemini, name)
+
+            def timed(*args, __name=name, __original=original, **kwargs):
+                timer.mark(f"system: {__name}")
+                try:
+                    return __original(*args, **kwargs)
+                finally:
+                    timer.finish()
+
+            setattr(system.gemini, name, timed)
+
+    results = []
+    for _ in range(jobs):
+        started = time.perf_counter()
+        error = None
+        ok = False
+        try:
+            data = system.generate_article()
+            if data:
+                system.save_to_file(data)
+                ok = system.upload_to_wechat(data["title"], data["content"])
+        except Exception as e:
+            error = str(e)
+        results.append({"ok": ok, "seconds": time.perf_counter() - started, "error": error})
+    return results
+
+
+def run_flask(jobs, timer):
+    """通过 Flask test client 驱动 /api/start、/api/status、/api/upload-wechat、/api/history"""
+    import app as app_module
+
+    client = app_module.app.test_client()
+    results = []
+    for _ in range(jobs):
+        started = time.perf_counter()
+        error = None
+        ok = False
+        try:
+            timer.mark("flask: /api/start -> done")
+            response = client.post("/api/start", json={"provider": "gemini-deepseek", "domain": "情感,心理"})
+            if not response.get_json().get("success"):
+                raise RuntimeError(response.get_json())
+            while client.get("/api/status").get_json()["running"]:
+                time.sleep(0.05)
+            status = client.get("/api/status").get_json()
+            if status.get("error") or not status.get("result"):
+                raise RuntimeError(status.get("error") or "no result")
+
+            timer.mark("flask: /api/upload-wechat")
+            result = status["result"]
+            upload = client.post("/api/upload-wechat", json={"title": result["title"], "content": result["content"]}).get_json()
+
+            timer.mark("flask: /api/history")
+            client.get("/api/history")
+            timer.finish()
+
+            ok = bool(upload.get("success"))
+            if not ok:
+                error = upload.get("error")
+        except Exception as e:
+            timer.finish()
+            error = str(e)
+        results.append({"ok": ok, "seconds": time.perf_counter() - started, "error": error})
+    return results
+
+
+def run_concurrent(jobs, concurrency, timer):
+    """通过 /api/start 同时提交多个后台任务（background=true），测共享事件循环的并发吞吐"""
+    import app as app_module
+
+    client = app_module.app.test_client()
+    results = []
+    for _ in range(jobs):
+        timer.mark(f"concurrent: {concurrency} jobs in flight")
+        started = time.perf_counter()
+        job_ids = []
+        for _ in range(concurrency):
+            response = client.post("/api/start", json={"provider": "gemini-deepseek", "domain": "情感,心理",
+                                                       "background": True}).get_json()
+            job_ids.append(response.get("job_id"))
+
+        pending = set(job_ids)
+        finished = {}
+        while pending:
+            for job_id in list(pending):
+                status = client.get(f"/api/jobs/{job_id}").get_json()
+                if not status.get("running"):
+                    finished[job_id] = (status, time.perf_counter() - started)
+                    pending.discard(job_id)
+            time.sleep(0.05)
+        timer.finish()
+
+        for status, seconds in finished.values():
+            results.append({
+                "ok": bool(status.get("result")) and not status.get("error"),
+                "seconds": seconds,
+                "error": status.get("error")
+            })
+    return results
+
+
+def run_prompt_cache(jobs, timer):
+    """
+    显式缓存路径：每个任务用一个超过最小缓存长度的新前缀经 gemini_request 调用 3 次，
+    检查缓存只创建一次、之后复用，且响应的 cached_content_token_count > 0
+    """
+    import uuid
+    from prompt_cache import PromptParts, gemini_request, gemini_usage, get_gemini_cache, record_usage
+
+    cache = get_gemini_cache()
+    rubric = "".join(f"{i}. 评分细则：句式是否过于整齐、连接词是否模板化、情绪是否空泛、细节是否具体可感。\n"
+                     for i in range(1, 41))
+    results = []
+    for _ in range(jobs):
+        started = time.perf_counter()
+        prefix = f"你是一名资深编辑，请评估文章的 AI 浓度（0-100）。批次 {uuid.uuid4().hex}\n{rubric}只输出一个整数。\n\n"
+        created, reused = cache.created, cache.reused
+        error = None
+        try:
+            for i in range(3):
+                timer.mark("prompt-cache: gemini_request")
+                model, content = gemini_request("gemini-stub", PromptParts(prefix, f"原文：第 {i} 篇测试文章。"))
+                usage = gemini_usage(model.generate_content(content))
+                record_usage("gemini", usage)
+                if not usage or not usage[1]:
+                    error = f"第 {i + 1} 次调用 cached_content_token_count 为 0"
+                    break
+            if error is None and (cache.created - created, cache.reused - reused) != (1, 2):
+                error = f"缓存创建 {cache.created - created} 次、复用 {cache.reused - reused} 次，应为 1 次、2 次"
+        except Exception as e:
+            error = str(e)
+        timer.finish()
+        results.append({"ok": error is None, "seconds": time.perf_counter() - started, "error": error})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线压测（本地替身服务）")
+    parser.add_argument("--targets", default=",".join(ALL_TARGETS), help=f"逗号分隔，可选：{', '.join(ALL_TARGETS)}")
+    parser.add_argument("--jobs", type=int, default=3, help="每个目标运行的任务数（concurrent 为批数）")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent 目标每批同时提交的任务数")
+    parser.add_argument("--latency", type=float, default=200, help="替身服务延迟中位数（毫秒）")
+    parser.add_argument("--sigma", type=float, default=0.5, help="对数正态延迟分布的 sigma")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="500 错误注入概率")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="429 限流注入概率")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="要求 JSON 输出时格式错误回答的注入概率")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--json", dest="json_path", help="把结果写入 JSON 文件")
+    parser.add_argument("--record", metavar="PATH", help="录制服务商调用到指定文件")
+    parser.add_argument("--replay", metavar="PATH", help="从指定文件回放服务商调用")
+    parser.add_argument("--replay-speed", type=float, default=0.0, help="回放耗时倍数（1 为原始耗时，0 为不等待）")
+    args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error("--record 和 --replay 不能同时使用")
+
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    config = StubConfig(args.latency, args.sigma, args.error_rate, args.rate_429, args.seed, args.malformed_rate)
+    stub = StubServer(config).start()
+
+    work_dir = tempfile.mkdtemp(prefix="gzh_bench_")
+    configure_environment(stub, work_dir)
+
+    from cassette import Cassette, set_cassette
+    cassette = None
+    if args.record:
+        cassette = Cassette(os.path.abspath(args.record), mode="record")
+    elif args.replay:
+        cassette = Cassette(os.path.abspath(args.replay), mode="replay", speed=args.replay_speed)
+    if cassette:
+        set_cassette(cassette)
+
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+
+    print("=" * 60)
+    print("Offline Benchmark")
+    print("=" * 60)
+    print(f"Stub server: {stub.url}")
+    print(f"Work dir:    {work_dir}")
+    print(f"Latency:     median {args.latency}ms, sigma {args.sigma}, 500 rate {args.error_rate}, 429 rate {args.rate_429}")
+    if cassette:
+        print(f"Cassette:    {cassette.mode} {cassette.path}")
+    print()
+
+    timer = StepTimer()
+    report = {"targets": {}, "steps": {}, "endpoints": {}}
+    tracemalloc.start()
+    started = time.perf_counter()
+
+    try:
+        for target in targets:
+            print(f"[Bench] Running {target} x {args.jobs}...")
+            target_started = time.perf_counter()
+            if target == "concurrent":
+                results = run_concurrent(args.jobs, args.concurrency, timer)
+            elif target == "system":
+                results = run_system(args.jobs, timer)
+            elif target == "flask":
+                results = run_flask(args.jobs, timer)
+            elif target == "prompt-cache":
+                results = run_prompt_cache(args.jobs, timer)
+            else:
+                results = run_task_generator(target, args.jobs, timer)
+
+            succeeded = [r for r in results if r["ok"]]
+            # 按墙钟时间计算吞吐（并发目标的单任务耗时会互相重叠）
+            total_seconds = time.perf_counter() - target_started
+            report["targets"][target] = {
+                "jobs": len(results),
+                "succeeded": len(succeeded),
+                "jobs_per_minute": round(len(succeeded) * 60 / total_seconds, 2) if total_seconds else 0,
+                "p50_job_s": round(percentile([r["seconds"] for r in results], 50), 2),
+                "errors": [r["error"] for r in results if r["error"]][:5]
+            }
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        os.chdir(cwd)
+        stub.stop()
+
+    report["wall_seconds"] = round(time.perf_counter() - started, 2)
+    report["peak_memory_mb"] = round(peak / 1024 / 1024, 2)
+    from prompt_cache import cache_summary
+    report["prompt_cache"] = cache_summary()
+    if cassette and cassette.mode == "replay":
+        report["cassette"] = {"hits": cassette.hits, "misses": cassette.misses}
+    for step, values in timer.durations.items():
+        report["steps"][step] = {
+            "count": len(values),
+            "p50_ms": round(percentile(values, 50) * 1000, 1),
+            "p95_ms": round(percentile(values, 95) * 1000, 1)
+        }
+    for route, entry in stub.stats.items():
+        report["endpoints"][route] = {
+            "count": entry["count"],
+            "p50_ms": round(percentile(entry["latencies"], 50) * 1000, 1),
+            "p95_ms": round(percentile(entry["latencies"], 95) * 1000, 1),
+            "status": {str(k): v for k, v in entry["status"].items()}
+        }
+
+    print()
+    print("=" * 60)
+    print("Results")
+    print("=" * 60)
+    print(f"{'target':<18}{'jobs':>6}{'ok':>6}{'jobs/min':>10}")
+    for target, entry in report["targets"].items():
+        print(f"{target:<18}{entry['jobs']:>6}{entry['succeeded']:>6}{entry['jobs_per_minute']:>10}")
+        for error in entry["errors"]:
+            print(f"    error: {str(error)[:100]}")
+    print()
+    print(f"{'step':<48}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}")
+    for step, entry in report["steps"].items():
+        print(f"{step[:47]:<48}{entry['count']:>5}{entry['p50_ms']:>10}{entry['p95_ms']:>10}")
+    print()
+    print(f"{'stub endpoint':<48}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}")
+    for route, entry in report["endpoints"].items():
+        print(f"{route[:47]:<48}{entry['count']:>5}{entry['p50_ms']:>10}{entry['p95_ms']:>10}")
+    print()
+    print(f"Wall time: {report['wall_seconds']}s, peak traced memory: {report['peak_memory_mb']} MB")
+    if "cassette" in report:
+        print(f"Cassette replay: {report['cassette']['hits']} hits, {report['cassette']['misses']} misses")
+    cache = report["prompt_cache"]
+    print(f"Prompt cache: {cache['cached_tokens']}/{cache['prompt_tokens']} input tokens cached "
+          f"({cache['hit_rate']:.0%})" + "".join(
+              f", {provider} {entry['hit_rate']:.0%}" for provider, entry in cache["by_provider"].items()))
+
+    if args.json_path:
+        with open(args.json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Saved: {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+"""
+本地替身服务
+功能：在本机模拟 DeepSeek、智谱、Gemini、GPTZero 和微信公众号接口，支持延迟分布、错误率、429 和格式错误回答注入；
+      模拟服务端的提示词前缀缓存（system 消息 / Gemini 显式缓存），在 usage 中返回缓存命中的 token 数
+      （智谱、Gemini 按 1024 token 的最小前缀，DeepSeek 按 64 token 的缓存单位）
+"""
+
+import json
+import math
+import random
+import re
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    """替身服务的延迟和故障注入配置"""
+
+    def __init__(self, latency_ms=200, sigma=0.5, error_rate=0.0, rate_429=0.0, seed=None, malformed_rate=0.0):
+        """
+        Args:
+            latency_ms: 延迟中位数（毫秒），按对数正态分布采样
+            sigma: 对数正态分布的 sigma，0 表示固定延迟
+            error_rate: 返回 500 的概率
+            rate_429: 返回 429 的概率
+            seed: 随机种子
+            malformed_rate: 要求 JSON 输出时返回格式错误回答的概率
+        """
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        """采样一次请求的 (延迟秒数, 注入的状态码或 None)"""
+        with self.lock:
+            latency = self.latency_ms / 1000.0
+            if self.sigma > 0:
+                latency *= math.exp(self.random.gauss(0, self.sigma))
+            roll = self.random.random()
+            text_seed = self.random.random()
+
+        if roll < self.rate_429:
+            return latency, 429, text_seed
+        if roll < self.rate_429 + self.error_rate:
+            return latency, 500, text_seed
+        return latency, None, text_seed
+
+
+SENTENCES = [
+    "说实话，我一开始也不信这个道理。",
+    "后来发现，很多焦虑其实来自我们不肯放过自己。",
+    "朋友问我，为什么不回消息也能睡得很香。",
+    "我想了想，大概是终于学会了和自己相处。",
+    "你有没有这样的时刻？明明很累，却停不下来。",
+    "成年人的体面，有时候就是不解释。",
+    "边界感这件事，越早明白越好。",
+    "别急着证明什么，日子是过给自己的。",
+]
+
+
+def fake_completion(prompt, rng, malformed_rate=0.0):
+    """根据提示词类型生成替身回答（提示词要求 JSON 时按 JSON 回答；有格式要求时按概率注入格式错误）"""
+    wants_json = "JSON" in prompt
+    malformed = (wants_json or "只输出" in prompt) and rng.random() < malformed_rate
+    if "AI 浓度" in prompt or "AI浓度" in prompt:
+        score = rng.randint(15, 65)
+        if malformed:
+            return f"我觉得这段文字的 AI 浓度大概在 {score} 分左右，主要是句式比较整齐。"
+        return json.dumps({"score": score}) if wants_json else str(score)
+    is_writing = "原文" in prompt or "写一篇" in prompt
+    if not is_writing and ("选题" in prompt or "大纲" in prompt):
+        topic = rng.choice(["学会主动掉队", "不回消息的自由", "边界感是一种能力", "允许自己停下来"])
+        title = f"成年人的顶级自律是{topic}"
+        outline = "一、开头 场景引入\n二、为什么我们停不下来\n三、如何与自己和解\n四、结尾 共鸣"
+        if malformed:
+            return f"好的，这是为你准备的选题：{title}。大纲如下：{outline}"
+        if wants_json:
+            return json.dumps({"title": title, "outline": outline}, ensure_ascii=False)
+        return f"标题：《{title}》\n大纲：{outline}"
+    length = 2000
+    match = re.search(r'约\s*(\d+)\s*字', prompt)
+    if match:
+        length = int(match.group(1))
+    parts = []
+    total = 0
+    while total < length:
+        sentence = rng.choice(SENTENCES)
+        parts.append(sentence)
+        total += len(sentence)
+        if rng.random() < 0.2:
+            parts.append("\n\n")
+    return "".join(parts)
+
+
+# 服务端前缀缓存的最小长度（替身里一个字符算一个 token；与服务商的最小缓存长度同一量级，
+# 短于该长度的前缀不会命中，压测报告的命中率才和线上一致）
+CACHE_MIN_PREFIX_TOKENS = 1024
+# DeepSeek 的自动前缀缓存以 64 token 为单位存储，不足一个单位的部分不会命中
+DEEPSEEK_CACHE_UNIT = 64
+
+
+def limit_output(text, max_tokens=None, stop=None):
+    """按 max_tokens / stop 截断替身回答（替身里一个字符算一个 token）"""
+    for sequence in stop or []:
+        if sequence and sequence in text:
+            text = text[:text.index(sequence)]
+    return text[:max_tokens] if max_tokens else text
+
+
+def sse_chunks(text, model, size=2, usage=None):
+    """把回答切成 OpenAI 兼容的流式事件（data: ...，以 [DONE] 结束；带 usage 时最后追加只含 usage 的一块）"""
+    events = []
+    for i in range(0, len(text), size):
+        delta = {"choices": [{"index": 0, "delta": {"content": text[i:i + size]}, "finish_reason": None}],
+                 "model": model, "object": "chat.completion.chunk"}
+        events.append(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n")
+    if usage:
+        final = {"choices": [], "model": model, "object": "chat.completion.chunk", "usage": usage}
+        events.append(f"data: {json.dumps(final, ensure_ascii=False)}\n\n")
+    events.append("data: [DONE]\n\n")
+    return "".join(events).encode("utf-8")
+
+
+def _tiny_png(width=64, height=27, color=(91, 138, 138)):
+    """不依赖 PIL 生成纯色 PNG"""
+    raw = b"".join(b"\x00" + bytes(color) * width for _ in range(height))
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+class StubServer:
+    """替身 HTTP 服务（后台线程运行）"""
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        self.config = config or StubConfig()
+        self.stats = {}
+        self._stats_lock = threading.Lock()
+        self._png = _tiny_png()
+        self._ids = 0
+        # 服务端缓存：见过的 system 前缀，Gemini 显式缓存名称 -> 内容
+        self._prefixes = set()
+        self._caches = {}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self, "GET")
+
+            def do_POST(self):
+                server._handle(self, "POST")
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _record(self, route, latency, status):
+        with self._stats_lock:
+            entry = self.stats.setdefault(route, {"count": 0, "latencies": [], "status": {}})
+            entry["count"] += 1
+            entry["latencies"].append(latency)
+            entry["status"][status] = entry["status"].get(status, 0) + 1
+
+    def _next_id(self):
+        with self._stats_lock:
+            self._ids += 1
+            return self._ids
+
+    def _handle(self, handler, method):
+        started = time.perf_counter()
+        path = handler.path.split("?", 1)[0]
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+
+        if method == "GET" and path == "/static/cover.png":
+            self._send(handler, 200, self._png, "image/png")
+            return
+
+        latency, injected, text_seed = self.config.sample()
+        time.sleep(latency)
+
+        if injected:
+            payload = {"error": {"code": injected, "message": "injected by stub"}}
+            if path.startswith("/wechat/"):
+                payload = {"errcode": 45009 if injected == 429 else -1, "errmsg": "injected by stub"}
+            self._send_json(handler, injected if not path.startswith("/wechat/") else 200, payload)
+            self._record(path, time.perf_counter() - started, injected)
+            return
+
+        rng = random.Random(text_seed)
+        status, payload = self._route(method, path, body, handler, rng)
+        if isinstance(payload, bytes):
+            self._send(handler, status, payload, "text/event-stream; charset=utf-8")
+        else:
+            self._send_json(handler, status, payload)
+        self._record(path, time.perf_counter() - started, status)
+
+    def _prompt_from(self, body):
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            return {}, ""
+        messages = data.get("messages") or []
+        prompt = "\n\n".join(m.get("content", "") for m in messages) if messages else data.get("prompt", "")
+        return data, prompt
+
+    def _prefix_hit(self, scope, prefix, min_tokens=CACHE_MIN_PREFIX_TOKENS):
+        """模拟服务端前缀缓存：同一服务商达到最小长度的同一前缀第二次出现起命中"""
+        if len(prefix) < min_tokens:
+            return False
+        with self._stats_lock:
+            hit = (scope, prefix) in self._prefixes
+            self._prefixes.add((scope, prefix))
+        return hit
+
+    def _chat_usage(self, path, data, prompt, text):
+        """chat completions 的 usage（替身里一个字符算一个 token）"""
+        messages = data.get("messages") or []
+        system = messages[0].get("content", "") if messages and messages[0].get("role") == "system" else ""
+        if "/deepseek/" in path:
+            # DeepSeek 按 64 token 的单位命中，只有整单位的前缀部分计入缓存
+            unit = DEEPSEEK_CACHE_UNIT
+            cached = len(system) // unit * unit if system and self._prefix_hit("deepseek", system, unit) else 0
+        else:
+            cached = len(system) if system and self._prefix_hit(path, system) else 0
+        usage = {"prompt_tokens": len(prompt), "completion_tokens": len(text),
+                 "total_tokens": len(prompt) + len(text)}
+        if "/deepseek/" in path:
+            usage.update({"prompt_cache_hit_tokens": cached, "prompt_cache_miss_tokens": len(prompt) - cached})
+        else:
+            usage["prompt_tokens_details"] = {"cached_tokens": cached}
+        return usage
+
+    def _route(self, method, path, body, handler, rng):
+        now = int(time.time())
+
+        # DeepSeek / 智谱：OpenAI 兼容的 chat completions
+        if path.endswith("/chat/completions"):
+            data, prompt = self._prompt_from(body)
+            text = limit_output(fake_completion(prompt, rng, self.config.malformed_rate),
+                                data.get("max_tokens"), data.get("stop"))
+            if data.get("stream"):
+                include_usage = (data.get("stream_options") or {}).get("include_usage")
+                usage = self._chat_usage(path, data, prompt, text) if include_usage else None
+                return 200, sse_chunks(text, data.get("model", "stub"), usage=usage)
+            return 200, {
+                "id": f"stub-{self._next_id()}",
+                "object": "chat.completion",
+                "created": now,
+                "model": data.get("model", "stub"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": self._chat_usage(path, data, prompt, text)
+            }
+
+        # 智谱 cogview 图片生成
+        if path.endswith("/images/generations"):
+            return 200, {"created": now, "data": [{"url": f"{self.url}/static/cover.png"}]}
+
+        # Gemini 显式缓存
+        if path == "/gemini/cachedContents":
+            data, _ = self._prompt_from(body)
+            if len(data.get("system_instruction") or "") < CACHE_MIN_PREFIX_TOKENS:
+                return 400, {"error": {"code": 400, "message": "cached content is too small"}}
+            name = f"cachedContents/stub-{self._next_id()}"
+            with self._stats_lock:
+                self._caches[name] = data.get("system_instruction") or ""
+            return 200, {"name": name, "model": data.get("model")}
+
+        # Gemini（供替身 GenerativeModel 和替身 gemini-web 脚本使用）
+        if path == "/gemini/generate":
+            data, prompt = self._prompt_from(body)
+            cached = ""
+            if data.get("cached_content"):
+                with self._stats_lock:
+                    cached = self._caches.get(data["cached_content"])
+                if cached is None:
+                    return 404, {"error": {"code": 404, "message": "cached content not found"}}
+            config = data.get("generation_config") or {}
+            prompt = cached + prompt
+            text = limit_output(fake_completion(prompt, rng, self.config.malformed_rate),
+                                config.get("max_output_tokens"), config.get("stop_sequences"))
+            return 200, {"text": text, "usage_metadata": {"prompt_token_count": len(prompt),
+                                                          "cached_content_token_count": len(cached)}}
+
+        # GPTZero
+        if path.startswith("/gptzero/"):
+            return 200, {"documents": [{"completely_generated_prob": round(rng.uniform(0.1, 0.6), 2)}]}
+
+        # 微信公众号
+        if path.startswith("/wechat/cgi-bin/"):
+            api = path[len("/wechat/cgi-bin/"):]
+            if api == "token":
+                return 200, {"access_token": "stub-access-token", "expires_in": 7200}
+            if api == "draft/add":
+                return 200, {"media_id": f"draft-{self._next_id()}"}
+            if api == "material/add_material":
+                return 200, {"media_id": f"thumb-{self._next_id()}", "url": f"{self.url}/static/cover.png"}
+            if api == "media/uploadimg":
+                return 200, {"url": f"{self.url}/static/cover.png?id={self._next_id()}"}
+            return 200, {"errcode": 0, "errmsg": "ok"}
+
+        return 404, {"error": f"unknown route {path}"}
+
+    def _send_json(self, handler, status, payload):
+        self._send(handler, status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+    @staticmethod
+    def _send(handler, status, data, content_type):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def _post_json(url, payload):
+    import urllib.request
+
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+class StubCachedContent:
+    """替身 google.generativeai.caching.CachedContent：create 转发到替身服务"""
+
+    base_url = None
+
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+
+    @classmethod
+    def create(cls, model, system_instruction=None, ttl=None, **kwargs):
+        data = _post_json(f"{cls.base_url}/gemini/cachedContents",
+                          {"model": model, "system_instruction": system_instruction})
+        return cls(data["name"], model)
+
+
+class StubGenerativeModel:
+    """替身 genai.GenerativeModel：generate_content 转发到替身服务"""
+
+    class Response:
+        def __init__(self, text, usage_metadata=None):
+            self.text = text
+            self.usage_metadata = usage_metadata
+
+    def __init__(self, base_url, model_name="stub", cached_content=None):
+        self.base_url = base_url
+        self.model_name = model_name
+        self.cached_content = cached_content
+
+    def generate_content(self, prompt, generation_config=None, stream=False, **kwargs):
+        from types import SimpleNamespace
+
+        config = generation_config if isinstance(generation_config, dict) else {}
+        data = _post_json(f"{self.base_url}/gemini/generate",
+                          {"prompt": prompt, "model": self.model_name, "generation_config": config,
+                           "cached_content": self.cached_content})
+        text = data["text"]
+        usage = SimpleNamespace(**data.get("usage_metadata", {}))
+        if stream:
+            # 流式时按块返回，和 SDK 一样逐块取 .text；用量只在最后一块中
+            chunks = [self.Response(text[i:i + 2]) for i in range(0, len(text), 2)] or [self.Response("")]
+            chunks[-1].usage_metadata = usage
+            return iter(chunks)
+        return self.Response(text, usage)
@@ -0,0 +1,249 @@
+"""
+服务商调用录制/回放模块
+功能：录制 Gemini、Gemini Web、DeepSeek、智谱、GPTZero 和封面接口的请求与响应（按请求哈希索引），
+      回放时完全离线返回，可按原始耗时或缩放后的耗时等待，用于流程改动和性能优化的确定性回归测试
+
+环境变量：
+    CASSETTE_MODE   off（默认）/ record / replay
+    CASSETTE_FILE   录制文件路径（JSONL），默认 cassettes/provider_calls.jsonl
+    CASSETTE_SPEED  回放耗时倍数：1 为原始耗时，0.5 为一半，0（默认）为不等待
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+DEFAULT_CASSETTE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "provider_calls.jsonl")
+
+MODES = ("off", "record", "replay")
+
+
+class CassetteMiss(Exception):
+    """回放模式下找不到对应的录制记录"""
+
+
+class CassetteReplayError(Exception):
+    """回放录制时原本就失败的调用"""
+
+
+class Cassette:
+    """服务商调用录制/回放器（线程安全）"""
+
+    def __init__(self, path=DEFAULT_CASSETTE_FILE, mode="off", speed=0.0):
+        """
+        初始化录制器
+
+        Args:
+            path: 录制文件路径（JSONL，每行一次调用）
+            mode: off / record / replay
+            speed: 回放耗时倍数（0 表示不等待）
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.speed = max(0.0, float(speed))
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._cursors = {}
+        self._seq = {}
+        self.hits = 0
+        self.misses = 0
+
+        if mode == "replay":
+            self._load()
+        elif mode == "record":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    @property
+    def active(self):
+        return self.mode != "off"
+
+    @staticmethod
+    def make_key(provider, request):
+        """按服务商和请求内容（模型、提示词等）生成稳定的哈希"""
+        payload = json.dumps([provider, request], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _load(self):
+        """加载录制文件，同一请求的多次响应按录制顺序排列"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._entries.setdefault(entry["key"], []).append(entry)
+        except OSError as e:
+            print(f"[Cassette] ⚠ 读取录制文件失败: {e}")
+            return
+        print(f"[Cassette] ✓ 已加载 {sum(len(v) for v in self._entries.values())} 条录制记录: {self.path}")
+
+    def _next_entry(self, key):
+        """取下一条录制响应；同一请求录制了多次时依次返回，用完后重复最后一条"""
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                return None
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            self.hits += 1
+            return entries[min(index, len(entries) - 1)]
+
+    def _append(self, entry):
+        with self._lock:
+            entry["seq"] = self._seq.get(entry["key"], 0)
+            self._seq[entry["key"]] = entry["seq"] + 1
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def call(self, provider, request, fn):
+        """
+        通过录制器执行一次服务商调用
+
+        Args:
+            provider: 服务商标识（如 "gemini"、"deepseek"、"cover"）
+            request: 决定响应的请求参数（dict，需可 JSON 序列化）
+            fn: 实际调用函数，返回值需可 JSON 序列化
+
+        Returns:
+            fn 的返回值（回放时为录制的返回值）
+        """
+        if self.mode == "off":
+            return fn()
+
+        key = self.make_key(provider, request)
+
+        if self.mode == "replay":
+            entry = self._replay_entry(provider, key)
+            if self.speed:
+                time.sleep(entry.get("elapsed", 0) * self.speed)
+            return self._replay_response(entry)
+
+        started = time.perf_counter()
+        try:
+            response = fn()
+        except Exception as e:
+            self._record(key, provider, request, started, error=e)
+            raise
+        self._record(key, provider, request, started, response=response)
+        return response
+
+    async def call_async(self, provider, request, coro_fn):
+        """
+        call 的协程版本
+
+        Args:
+            provider: 服务商标识
+            request: 决定响应的请求参数
+            coro_fn: 无参函数，返回实际调用的协程
+        """
+        if self.mode == "off":
+            return await coro_fn()
+
+        import asyncio
+        key = self.make_key(provider, request)
+
+        if self.mode == "replay":
+            entry = self._replay_entry(provider, key)
+            if self.speed:
+                await asyncio.sleep(entry.get("elapsed", 0) * self.speed)
+            return self._replay_response(entry)
+
+        started = time.perf_counter()
+        try:
+            response = await coro_fn()
+        except Exception as e:
+            self._record(key, provider, request, started, error=e)
+            raise
+        self._record(key, provider, request, started, response=response)
+        return response
+
+    def _replay_entry(self, provider, key):
+        entry = self._next_entry(key)
+        if entry is None:
+            raise CassetteMiss(f"No recorded response for {provider} (key {key[:12]})")
+        return entry
+
+    @staticmethod
+    def _replay_response(entry):
+        if entry.get("error") is not None:
+            raise CassetteReplayError(entry["error"])
+        return entry.get("response")
+
+    def _record(self, key, provider, request, started, response=None, error=None):
+        self._append({
+            "key": key, "provider": provider, "request": request,
+            "response": response, "error": f"{type(error).__name__}: {error}" if error is not None else None,
+            "elapsed": round(time.perf_counter() - started, 4),
+            "recorded_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        })
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """获取进程内共享的录制器（首次使用时读取环境变量）"""
+    global _cassette
+    with _cassette_lock:
+        if _cassette is None:
+            mode = os.getenv("CASSETTE_MODE", "off").strip().lower() or "off"
+            if mode not in MODES:
+                print(f"[Cassette] ⚠ 未知的 CASSETTE_MODE: {mode}，已关闭录制")
+                mode = "off"
+            _cassette = Cassette(
+                path=os.getenv("CASSETTE_FILE") or DEFAULT_CASSETTE_FILE,
+                mode=mode,
+                speed=float(os.getenv("CASSETTE_SPEED", "0") or 0)
+            )
+        return _cassette
+
+
+def set_cassette(cassette):
+    """替换进程内共享的录制器（压测脚本等使用）"""
+    global _cassette
+    with _cassette_lock:
+        _cassette = cassette
+
+
+def _token_attrs(provider, prompt, response=None):
+    """provider span 的 token 属性（按 token_budget 的字符比例估算）"""
+    from token_budget import estimate_tokens
+    attrs = {"input_tokens": estimate_tokens(prompt, provider)}
+    if isinstance(response, str):
+        attrs.update(response_chars=len(response), output_tokens=estimate_tokens(response, provider))
+    return attrs
+
+
+def cassette_call(provider, request, fn):
+    """通过共享录制器执行一次服务商调用的便捷函数（同时记录为当前任务的 provider span，带 token 数和状态）"""
+    from tracing import span
+    cassette = get_cassette()
+    prompt = request.get("prompt") or request.get("document") or ""
+    with span(provider, cat="provider", model=request.get("model"), prompt_chars=len(prompt),
+              cassette=cassette.mode, **_token_attrs(provider, prompt)) as current:
+        response = cassette.call(provider, request, fn)
+        current.set(status="ok", **_token_attrs(provider, prompt, response))
+        return response
+
+
+async def cassette_call_async(provider, request, coro_fn):
+    """cassette_call 的协程版本（coro_fn 为返回协程的无参函数）"""
+    from tracing import span
+    cassette = get_cassette()
+    prompt = request.get("prompt") or request.get("document") or ""
+    with span(provider, cat="provider", model=request.get("model"), prompt_chars=len(prompt),
+              cassette=cassette.mode, **_token_attrs(provider, prompt)) as current:
+        response = await cassette.call_async(provider, request, coro_fn)
+        current.set(status="ok", **_token_attrs(provider, prompt, response))
+        return response
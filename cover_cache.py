@@ -0,0 +1,147 @@
+"""
+封面图缓存模块
+功能：按 标题 + 风格 + 生成方式 + 提示词版本 缓存 AI 封面，超出容量按 LRU 淘汰
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+import unicodedata
+
+
+def normalize_title(title):
+    """标题归一化：全半角统一、去书名号、标点和空白、小写"""
+    title = unicodedata.normalize("NFKC", title or "")
+    title = re.sub(r'[《》「」『』"\'“”‘’!?！？。，,.:：;；、…\-—~·]', "", title)
+    return re.sub(r'\s+', "", title).lower()
+
+
+class CoverCache:
+    """内容寻址的封面缓存（磁盘文件 + JSON 索引）"""
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        """
+        初始化缓存
+
+        Args:
+            cache_dir: 缓存目录（默认 COVER_CACHE_DIR 或项目目录下的 cover_cache/）
+            max_bytes: 缓存总大小上限（默认 COVER_CACHE_MAX_MB，200MB）
+        """
+        if cache_dir is None:
+            cache_dir = os.getenv("COVER_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "cover_cache")
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("COVER_CACHE_MAX_MB", "200")) * 1024 * 1024)
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None
+
+    @staticmethod
+    def make_key(title, style, method, prompt_version):
+        """生成缓存键"""
+        raw = f"{normalize_title(title)}|{style}|{method}|{prompt_version}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, key, dest_path):
+        """
+        查找缓存，命中则复制到 dest_path
+
+        Returns:
+            bool: 是否命中
+        """
+        with self._lock:
+            index = self._load_index()
+            entry = index.get(key)
+            if not entry:
+                return False
+
+            cached_path = os.path.join(self.cache_dir, entry["file"])
+            if not os.path.exists(cached_path):
+                index.pop(key, None)
+                self._save_index()
+                return False
+
+            entry["last_used"] = time.time()
+            entry["hits"] = entry.get("hits", 0) + 1
+            self._save_index()
+
+        shutil.copyfile(cached_path, dest_path)
+        return True
+
+    def put(self, key, src_path, method=""):
+        """把生成好的封面存入缓存，必要时按最近最少使用淘汰"""
+        if not src_path or not os.path.exists(src_path):
+            return
+
+        ext = os.path.splitext(src_path)[1] or ".png"
+        filename = f"{key}{ext}"
+
+        with self._lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            shutil.copyfile(src_path, os.path.join(self.cache_dir, filename))
+
+            index = self._load_index()
+            index[key] = {
+                "file": filename,
+                "method": method,
+                "size": os.path.getsize(src_path),
+                "created": time.time(),
+                "last_used": time.time(),
+                "hits": 0
+            }
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        """超出容量时按 last_used 从旧到新删除（调用方需持有锁）"""
+        total = sum(entry["size"] for entry in self._index.values())
+        if total <= self.max_bytes:
+            return
+
+        for key, entry in sorted(self._index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self._index[key]
+
+    def _load_index(self):
+        if self._index is None:
+            index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_cover_cache():
+    """获取进程内共享的封面缓存"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = CoverCache()
+        return _shared_cache
@@ -0,0 +1,190 @@
+"""
+封面图编码模块
+功能：按字节预算压缩封面（JPEG/WebP）、生成预览缩略图，结果按源文件哈希缓存
+"""
+
+import os
+import io
+import hashlib
+import threading
+
+
+# 微信 thumb 素材限制：JPG，64KB 以内
+WECHAT_THUMB_MAX_BYTES = 64 * 1024
+
+FORMAT_EXTENSIONS = {
+    "JPEG": ".jpg",
+    "WEBP": ".webp",
+}
+
+_variant_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _file_digest(path):
+    """源文件内容哈希（取前 16 位作为缓存键）"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+
+def _variant_path(src_path, digest, suffix, fmt, output_dir):
+    """缓存变体的文件路径：<输出目录>/<原文件名>_<哈希>_<后缀>.<扩展名>"""
+    if output_dir is None:
+        output_dir = os.path.join(os.path.dirname(os.path.abspath(src_path)), "cover_variants")
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(src_path))[0]
+    return os.path.join(output_dir, f"{stem}_{digest}_{suffix}{FORMAT_EXTENSIONS[fmt]}")
+
+
+def _cached(key, path):
+    """命中缓存（内存记录或磁盘上已有文件）则返回路径"""
+    with _cache_lock:
+        cached = _variant_cache.get(key)
+    if cached and os.path.exists(cached):
+        return cached
+    if os.path.exists(path):
+        with _cache_lock:
+            _variant_cache[key] = path
+        return path
+    return None
+
+
+def _to_rgb(img):
+    """JPEG 不支持透明通道，铺白底后转 RGB"""
+    from PIL import Image
+
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, "white")
+        background.paste(img, mask=img.split()[-1])
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def _encode(img, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(buffer, fmt, quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def encode_to_budget(img, max_bytes, fmt="JPEG", min_quality=40, max_quality=92):
+    """
+    二分查找质量参数，编码为不超过 max_bytes 的最高质量图片
+
+    最低质量仍超出预算时，按 0.85 倍缩小尺寸后重试。
+
+    Args:
+        img: PIL Image
+        max_bytes: 字节预算
+        fmt: 输出格式（JPEG 或 WEBP）
+        min_quality: 最低质量
+        max_quality: 最高质量
+
+    Returns:
+        bytes: 编码后的图片数据
+    """
+    fmt = fmt.upper()
+    img = _to_rgb(img)
+
+    while True:
+        best = None
+        lo, hi = min_quality, max_quality
+        while lo <= hi:
+            quality = (lo + hi) // 2
+            data = _encode(img, fmt, quality)
+            if len(data) <= max_bytes:
+                best = data
+                lo = quality + 1
+            else:
+                hi = quality - 1
+
+        if best is not None:
+            return best
+
+        width, height = img.size
+        if width <= 64 or height <= 64:
+            return _encode(img, fmt, min_quality)
+        img = img.resize((int(width * 0.85), int(height * 0.85)))
+
+
+def encode_cover(src_path, max_bytes=WECHAT_THUMB_MAX_BYTES, fmt="JPEG", output_dir=None):
+    """
+    生成不超过字节预算的封面变体（结果按源文件哈希缓存）
+
+    Args:
+        src_path: 源图片路径（通常为 PNG）
+        max_bytes: 字节预算，默认微信 thumb 限制 64KB
+        fmt: 输出格式（JPEG 或 WEBP）
+        output_dir: 输出目录，默认源文件旁的 cover_variants/
+
+    Returns:
+        str: 编码后的文件路径
+    """
+    from PIL import Image
+
+    fmt = fmt.upper()
+    digest = _file_digest(src_path)
+    path = _variant_path(src_path, digest, f"{max_bytes // 1024}k", fmt, output_dir)
+    key = (digest, "budget", max_bytes, fmt)
+
+    cached = _cached(key, path)
+    if cached:
+        return cached
+
+    with Image.open(src_path) as img:
+        data = encode_to_budget(img, max_bytes, fmt)
+
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    print(f"[Cover] ✓ 封面压缩: {os.path.getsize(src_path) // 1024}KB -> {len(data) // 1024}KB ({fmt})")
+    with _cache_lock:
+        _variant_cache[key] = path
+    return path
+
+
+def make_thumbnail(src_path, width=360, fmt="JPEG", quality=80, output_dir=None):
+    """
+    生成预览用的小缩略图（结果按源文件哈希缓存）
+
+    Args:
+        src_path: 源图片路径
+        width: 缩略图宽度（等比缩放）
+        fmt: 输出格式（JPEG 或 WEBP）
+        quality: 编码质量
+        output_dir: 输出目录，默认源文件旁的 cover_variants/
+
+    Returns:
+        str: 缩略图文件路径
+    """
+    from PIL import Image
+
+    fmt = fmt.upper()
+    digest = _file_digest(src_path)
+    path = _variant_path(src_path, digest, f"w{width}", fmt, output_dir)
+    key = (digest, "thumb", width, fmt)
+
+    cached = _cached(key, path)
+    if cached:
+        return cached
+
+    with Image.open(src_path) as img:
+        img = _to_rgb(img)
+        if img.width > width:
+            img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+        data = _encode(img, fmt, quality)
+
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    with _cache_lock:
+        _variant_cache[key] = path
+    return path
@@ -8,7 +8,216 @@ import os
 import subprocess
 import requests
 from datetime import datetime
-import re
+import time
+import threading
+import contextvars
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# 封面提示词版本，修改 AI 提示词后递增，使旧缓存失效
+COVER_PROMPT_VERSION = 1
+
+# 竞速模式下每种方式的默认超时（秒）
+DEFAULT_METHOD_TIMEOUTS = {
+    "zhipu": 45,
+    "gemini-web": 60,
+    "dalle": 60,
+}
+
+# 占位符封面尺寸 (2.35:1) 和各风格配色
+PLACEHOLDER_SIZE = (1080, 460)
+PLACEHOLDER_COLORS = {
+    "elegant": {'bg': '#F5F0E6', 'accent': '#5B8A8A', 'text': '#2D3748'},
+    "tech": {'bg': '#1A202C', 'accent': '#00D4FF', 'text': '#FFFFFF'},
+    "warm": {'bg': '#FFFAF0', 'accent': '#ED8936', 'text': '#2D3748'},
+    "bold": {'bg': '#000000', 'accent': '#F6E05E', 'text': '#FFFFFF'},
+    "minimal": {'bg': '#FFFFFF', 'accent': '#000000', 'text': '#000000'},
+    "playful": {'bg': '#FFFBEB', 'accent': '#9F7AEA', 'text': '#2D3748'},
+    "nature": {'bg': '#F5E6D3', 'accent': '#276749', 'text': '#2D3748'},
+    "retro": {'bg': '#F5E6D3', 'accent': '#C05621', 'text': '#2D3748'}
+}
+
+# 中文字体候选（可用 COVER_FONT_PATH 指定，多个路径用 os.pathsep 分隔）
+CJK_FONT_CANDIDATES = [
+    "msyh.ttc",  # 微软雅黑（Windows 字体目录可直接按名字加载）
+    r"C:\Windows\Fonts\msyh.ttc",
+    r"C:\Windows\Fonts\simhei.ttf",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "/System/Library/Fonts/STHeiti Medium.ttc",
+]
+
+_template_cache = {}
+_template_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def find_cjk_font():
+    """查找可用的中文字体路径，找不到返回 None（结果进程内缓存）"""
+    from PIL import ImageFont
+
+    configured = os.getenv("COVER_FONT_PATH", "")
+    candidates = [p for p in configured.split(os.pathsep) if p] + CJK_FONT_CANDIDATES
+    for path in candidates:
+        try:
+            ImageFont.truetype(path, 12)
+            return path
+        except OSError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=16)
+def get_font(size):
+    """按字号获取字体（解析 TTC 很慢，每个字号只加载一次）"""
+    from PIL import ImageFont
+
+    path = find_cjk_font()
+    if path:
+        return ImageFont.truetype(path, size)
+    # 如果找不到中文字体，使用默认字体
+    return ImageFont.load_default()
+
+
+@lru_cache(maxsize=8192)
+def _glyph_width(size, char):
+    """单个字符在指定字号下的宽度（缓存）"""
+    return get_font(size).getlength(char)
+
+
+def wrap_title(title, size, max_width, max_lines=2):
+    """
+    按像素宽度对标题折行（中文逐字折行）
+
+    Args:
+        title: 标题
+        size: 字号
+        max_width: 每行最大宽度（像素）
+        max_lines: 最多行数，超出部分以省略号结尾
+
+    Returns:
+        list: 每行文本
+    """
+    ellipsis_width = _glyph_width(size, "…")
+    lines = []
+    line = ""
+    line_width = 0.0
+
+    for char in title:
+        width = _glyph_width(size, char)
+        if line and line_width + width > max_width:
+            lines.append(line)
+            if len(lines) == max_lines:
+                break
+            line, line_width = "", 0.0
+        line += char
+        line_width += width
+    else:
+        if line:
+            lines.append(line)
+        return lines
+
+    # 超出行数：最后一行截断并加省略号
+    last = lines[-1]
+    last_width = sum(_glyph_width(size, c) for c in last)
+    while last and last_width + ellipsis_width > max_width:
+        last_width -= _glyph_width(size, last[-1])
+        last = last[:-1]
+    lines[-1] = last + "…"
+    return lines
+
+
+def get_style_template(style):
+    """获取某风格预渲染好的底图（背景 + 装饰），调用方需 copy() 后再绘制"""
+    with _template_lock:
+        template = _template_cache.get(style)
+        if template is None:
+            from PIL import Image, ImageDraw
+
+            width, height = PLACEHOLDER_SIZE
+            color_scheme = PLACEHOLDER_COLORS.get(style, PLACEHOLDER_COLORS["elegant"])
+            template = Image.new('RGB', (width, height), color=color_scheme['bg'])
+            draw = ImageDraw.Draw(template)
+
+            # 绘制装饰元素（简单的几何形状）
+            accent_color = color_scheme['accent']
+            draw.rectangle([(50, 50), (200, 410)], fill=accent_color)  # 左侧装饰条
+            draw.ellipse([(width-250, 50), (width-50, 200)], fill=accent_color)  # 右上圆形
+
+            _template_cache[style] = template
+        return template
+
+
+def render_placeholder_cover(title, style, image_path):
+    """
+    渲染占位符封面（模块级函数，可在进程池中执行）
+
+    Returns:
+        dict: 与 CoverGenerator.generate_cover 相同的结果结构
+    """
+    try:
+        from PIL import ImageDraw
+
+        # 复制该风格的预渲染底图，只绘制文字
+        if style not in PLACEHOLDER_COLORS:
+            style = "elegant"
+        img = get_style_template(style).copy()
+        draw = ImageDraw.Draw(img)
+        text_color = PLACEHOLDER_COLORS[style]['text']
+
+        font_large = get_font(48)
+        font_small = get_font(24)
+
+        # 标题折行（标题区：装饰条右侧到右上圆形左侧）
+        width = PLACEHOLDER_SIZE[0]
+        lines = wrap_title(title, 48, max_width=width - 250 - 280)
+
+        # 绘制标题文字
+        line_height = 60
+        y = 180 - (len(lines) - 1) * line_height // 2
+        for line in lines:
+            draw.text((250, y), line, fill=text_color, font=font_large)
+            y += line_height
+
+        # 绘制副标题
+        subtitle = f"{datetime.now().strftime('%Y年%m月%d日')}"
+        draw.text((250, y), subtitle, fill=text_color, font=font_small)
+
+        # 保存图片
+        img.save(image_path, 'PNG')
+
+        return {
+            "success": True,
+            "image_path": image_path,
+            "method": "placeholder",
+            "error": None
+        }
+
+    except ImportError:
+        return {
+            "success": False,
+            "image_path": None,
+            "method": "placeholder",
+            "error": "PIL not installed. Run: pip install Pillow"
+        }
+    except Exception as e:
+        return {
+            "success": False,
+            "image_path": None,
+            "method": "placeholder",
+            "error": str(e)
+        }
+
+
+def _render_placeholder_item(item):
+    """map 用的单参数包装"""
+    return render_placeholder_cover(*item)
 
 
 class CoverGenerator:
@@ -16,8 +225,10 @@ class CoverGenerator:
 
     def __init__(self):
         self.openai_api_key = os.getenv("OPENAI_API_KEY", "")
-        self.zhipu_api_key = os.getenv("ZHIPU_API_KEY", "")
+        from key_pool import load_keys
+        self.zhipu_api_key = (load_keys("zhipu") or [""])[0]
         self.use_placeholder = os.getenv("USE_PLACEHOLDER_COVER", "true").lower() == "true"
+        self.use_cache = os.getenv("COVER_CACHE", "true").lower() == "true"
         # gemini-web skill 路径 - 支持多个可能的路径
         possible_paths = [
             os.path.expanduser("~\\.claude\\skills\\gemini-web"),
@@ -30,7 +241,8 @@ class CoverGenerator:
                 self.gemini_web_skill = path
                 break
 
-    def generate_cover(self, title, article_content, style="elegant", output_dir=".", methods=None):
+    def generate_cover(self, title, article_content, style="elegant", output_dir=".", methods=None,
+                       race=False, method_timeout=None):
         """
         生成封面图
 
@@ -40,12 +252,15 @@ class CoverGenerator:
             style: 封面风格 (elegant, tech, warm, bold, minimal, playful, nature, retro)
             output_dir: 输出目录
             methods: 生成方式优先级列表（可选），默认 ["placeholder", "zhipu", "gemini-web", "dalle"]
+            race: 是否并发竞速（AI 方式同时启动，placeholder 仅作兜底）
+            method_timeout: 竞速模式下每种方式的超时秒数，数字或 {method: 秒数}
 
         Returns:
             dict: {
                 "success": bool,
                 "image_path": str,
                 "method": str,
+                "cached": bool (命中封面缓存时为 True),
                 "error": str (if failed)
             }
         """
@@ -57,27 +272,28 @@ class CoverGenerator:
         if methods is None:
             methods = ["placeholder", "zhipu", "gemini-web", "dalle"]
 
-        # 按优先级尝试各种生成方式
+        if race:
+            return self._race_cover(title, article_content, style, output_dir, timestamp, methods, method_timeout)
+
+        # 先按优先级查 AI 方式的封面缓存，只查排在第一个总会成功的方式（已启用的 placeholder）之前的：
+        # placeholder 优先级更高时应当用它，不能返回旧配置留下的 AI 封面
+        for method in methods:
+            if not self._method_enabled(method):
+                continue
+            if method == "placeholder":
+                break
+            cached = self._cache_lookup(title, style, method, image_path)
+            if cached:
+                return cached
+
+        # 缓存未命中，按优先级尝试各种生成方式
         for method in methods:
-            if method == "gemini-web":
-                result = self._generate_with_gemini_web(title, article_content, style, image_path)
-                if result["success"]:
-                    return result
-            elif method == "zhipu":
-                if self.zhipu_api_key:
-                    result = self._generate_with_zhipu(title, article_content, style, image_path)
-                    if result["success"]:
-                        return result
-            elif method == "dalle":
-                if self.openai_api_key:
-                    result = self._generate_with_dalle(title, article_content, style, image_path)
-                    if result["success"]:
-                        return result
-            elif method == "placeholder":
-                if self.use_placeholder:
-                    result = self._generate_placeholder(title, style, image_path)
-                    if result["success"]:
-                        return result
+            if not self._method_enabled(method):
+                continue
+            result = self._run_method(method, title, article_content, style, image_path)
+            if result["success"]:
+                self._cache_store(title, style, result)
+                return result
 
         # 所有方式都失败
         return {
@@ -87,6 +303,212 @@ class CoverGenerator:
             "error": "No image generation method configured or all methods failed"
         }
 
+    def _method_enabled(self, method):
+        """检查某种生成方式是否已配置"""
+        if method == "zhipu":
+            return bool(self.zhipu_api_key)
+        if method == "dalle":
+            return bool(self.openai_api_key)
+        if method == "placeholder":
+            return self.use_placeholder
+        return method == "gemini-web"
+
+    def _run_method(self, method, title, article_content, style, image_path):
+        """执行单种生成方式（每次尝试记录为当前任务的 cover span）"""
+        from tracing import span
+        with span(f"cover:{method}", cat="cover", style=style) as current:
+            result = self._run_method_recorded(method, title, article_content, style, image_path)
+            current.set(success=bool(result.get("success")), error=result.get("error"))
+            return result
+
+    def _run_method_recorded(self, method, title, article_content, style, image_path):
+        """执行单种生成方式（AI 方式支持录制/回放，录制内容为生成的图片）"""
+        if method == "placeholder":
+            return self._generate_placeholder(title, style, image_path)
+
+        from cassette import get_cassette
+        cassette = get_cassette()
+        if not cassette.active:
+            return self._call_method(method, title, article_content, style, image_path)
+
+        import base64
+        import hashlib
+
+        def call():
+            result = self._call_method(method, title, article_content, style, image_path)
+            image = None
+            if result.get("success"):
+                with open(result["image_path"], 'rb') as f:
+                    image = base64.b64encode(f.read()).decode("ascii")
+            return {"success": bool(result.get("success")), "error": result.get("error"), "image": image}
+
+        request = {
+            "method": method,
+            "title": title,
+            "style": style,
+            "article_sha256": hashlib.sha256((article_content or "").encode("utf-8")).hexdigest(),
+            "prompt_version": COVER_PROMPT_VERSION
+        }
+        recorded = cassette.call("cover", request, call)
+
+        if not recorded.get("success"):
+            return {"success": False, "image_path": None, "method": method, "error": recorded.get("error")}
+        if cassette.mode == "replay":
+            with open(image_path, 'wb') as f:
+                f.write(base64.b64decode(recorded["image"]))
+        return {"success": True, "image_path": image_path, "method": method, "error": None}
+
+    def _call_method(self, method, title, article_content, style, image_path):
+        """实际调用 AI 生成方式"""
+        if method == "gemini-web":
+            return self._generate_with_gemini_web(title, article_content, style, image_path)
+        if method == "zhipu":
+            return self._generate_with_zhipu(title, article_content, style, image_path)
+        if method == "dalle":
+            return self._generate_with_dalle(title, article_content, style, image_path)
+        return self._generate_placeholder(title, style, image_path)
+
+    def _race_cover(self, title, article_content, style, output_dir, timestamp, methods, method_timeout):
+        """
+        并发竞速生成封面
+
+        已启用的 AI 方式同时启动，各自有独立的截止时间；在截止前完成的结果中按 methods
+        顺序取优先级最高的一个。placeholder 不参与竞速，只在没有 AI 结果时兜底。
+        """
+        ai_methods = [m for m in methods if m != "placeholder" and self._method_enabled(m)]
+
+        # 缓存中已有 AI 封面时按优先级直接返回
+        for method in ai_methods:
+            cached = self._cache_lookup(title, style, method, os.path.join(output_dir, f"cover_{timestamp}_{method}.png"))
+            if cached:
+                return cached
+
+        if isinstance(method_timeout, dict):
+            timeouts = {**DEFAULT_METHOD_TIMEOUTS, **method_timeout}
+        elif method_timeout:
+            timeouts = {m: float(method_timeout) for m in DEFAULT_METHOD_TIMEOUTS}
+        else:
+            timeouts = dict(DEFAULT_METHOD_TIMEOUTS)
+
+        results = {}
+        errors = []
+
+        if ai_methods:
+            started = time.monotonic()
+            deadlines = {m: started + timeouts.get(m, 60) for m in ai_methods}
+            pool = ThreadPoolExecutor(max_workers=len(ai_methods))
+            futures = {}
+            for method in ai_methods:
+                path = os.path.join(output_dir, f"cover_{timestamp}_{method}.png")
+                # 每个任务复制一份上下文，使竞速线程中的 span 归入当前任务的追踪
+                context = contextvars.copy_context()
+                futures[pool.submit(context.run, self._run_method, method, title, article_content, style, path)] = method
+
+            pending = set(futures)
+            while pending:
+                # 已有结果且没有更高优先级的方式在等待时，直接返回
+                if results:
+                    best_rank = min(ai_methods.index(m) for m in results)
+                    if all(ai_methods.index(futures[f]) > best_rank for f in pending):
+                        break
+
+                now = time.monotonic()
+                expired = {f for f in pending if deadlines[futures[f]] <= now}
+                for future in expired:
+                    errors.append(f"{futures[future]}: timeout after {timeouts.get(futures[future], 60)}s")
+                pending -= expired
+                if not pending:
+                    break
+
+                next_deadline = min(deadlines[futures[f]] for f in pending)
+                done, _ = wait(pending, timeout=max(0, next_deadline - now), return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.discard(future)
+                    method = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {"success": False, "error": str(e)}
+                    if result.get("success"):
+                        results[method] = result
+                    else:
+                        errors.append(f"{method}: {result.get('error')}")
+
+            # 超时或被淘汰的任务在后台结束后清理其文件
+            for future in pending:
+                future.add_done_callback(self._discard_result)
+            pool.shutdown(wait=False)
+
+        if results:
+            best = min(results, key=ai_methods.index)
+            for method, result in results.items():
+                if method != best:
+                    self._discard_file(result.get("image_path"))
+            self._cache_store(title, style, results[best])
+            return results[best]
+
+        if self.use_placeholder and "placeholder" in methods:
+            image_path = os.path.join(output_dir, f"cover_{timestamp}.png")
+            result = self._run_method("placeholder", title, article_content, style, image_path)
+            if result["success"]:
+                return result
+            errors.append(f"placeholder: {result.get('error')}")
+
+        return {
+            "success": False,
+            "image_path": None,
+            "method": "none",
+            "error": "; ".join(errors) or "No image generation method configured or all methods failed"
+        }
+
+    def _cache_lookup(self, title, style, method, image_path):
+        """查询封面缓存，命中则复制到 image_path 并返回结果（placeholder 不缓存）"""
+        if not self.use_cache or method == "placeholder":
+            return None
+        try:
+            from cover_cache import get_cover_cache
+            key = get_cover_cache().make_key(title, style, method, COVER_PROMPT_VERSION)
+            if get_cover_cache().get(key, image_path):
+                return {
+                    "success": True,
+                    "image_path": image_path,
+                    "method": method,
+                    "cached": True,
+                    "error": None
+                }
+        except Exception as e:
+            print(f"[Cover] ⚠ 读取封面缓存失败: {e}")
+        return None
+
+    def _cache_store(self, title, style, result):
+        """把 AI 生成的封面写入缓存"""
+        method = result.get("method")
+        if not self.use_cache or method == "placeholder" or result.get("cached"):
+            return
+        try:
+            from cover_cache import get_cover_cache
+            key = get_cover_cache().make_key(title, style, method, COVER_PROMPT_VERSION)
+            get_cover_cache().put(key, result["image_path"], method=method)
+        except Exception as e:
+            print(f"[Cover] ⚠ 写入封面缓存失败: {e}")
+
+    def _discard_result(self, future):
+        """竞速淘汰的任务完成后删除其生成的文件"""
+        try:
+            result = future.result()
+        except Exception:
+            return
+        if result and result.get("success"):
+            self._discard_file(result.get("image_path"))
+
+    @staticmethod
+    def _discard_file(path):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
     def _generate_with_gemini_web(self, title, article_content, style, image_path):
         """使用 gemini-web skill 生成封面"""
         # 检查 gemini-web skill 路径是否存在
@@ -227,43 +649,24 @@ Create a visually appealing cover that matches the article topic."""
 
 请生成一张视觉吸引力强的封面图。"""
 
-            # 调用智谱AI图片生成API
-            client = ZhipuAI(api_key=self.zhipu_api_key)
+            # 调用智谱AI图片生成API（多个 Key 时按 Key 池轮换，见 key_pool.py）
+            from key_pool import get_key_pool
 
-            response = client.images.generations(
-                model="cogview-3",  # 智谱AI的图片生成模型
-                prompt=prompt,
-                size="1024:1024"  # cogview-3 支持的尺寸
-            )
+            def generate(api_key):
+                return ZhipuAI(api_key=api_key).images.generations(
+                    model="cogview-3",  # 智谱AI的图片生成模型
+                    prompt=prompt,
+                    size="1024:1024"  # cogview-3 支持的尺寸
+                )
+
+            response = get_key_pool("zhipu", self.zhipu_api_key).call(generate)
 
             # 获取图片URL
             if response and hasattr(response, 'data') and len(response.data) > 0:
                 image_url = response.data[0].url
 
-                # 下载图片
-                img_response = requests.get(image_url, timeout=30)
-                if img_response.status_code == 200:
-                    with open(image_path, 'wb') as f:
-                        f.write(img_response.content)
-
-                    # 使用 Pillow 调整图片尺寸为横向
-                    from PIL import Image
-                    img = Image.open(image_path)
-                    # 裁剪为 2.35:1 比例
-                    width, height = img.size
-                    target_width = 1080
-                    target_height = int(target_width / 2.35)
-
-                    # 居中裁剪
-                    left = (width - target_width) // 2 if width > target_width else 0
-                    top = (height - target_height) // 2 if height > target_height else 0
-                    right = left + target_width
-                    bottom = top + target_height
-
-                    if right <= width and bottom <= height:
-                        img_cropped = img.crop((left, top, right, bottom))
-                        img_cropped.save(image_path, 'PNG')
-
+                # 下载到内存并裁剪为封面尺寸（只解码、编码各一次）
+                if self._download_and_fit(image_url, image_path):
                     return {
                         "success": True,
                         "image_path": image_path,
@@ -331,7 +734,7 @@ Design: Clean, professional, suitable for Chinese social media."""
                     "model": "dall-e-3",
                     "prompt": prompt,
                     "n": 1,
-                    "size": "1024x1792",  # 横向比例
+                    "size": "1792x1024",  # 横向比例
                     "response_format": "url"
                 },
                 timeout=60
@@ -341,12 +744,8 @@ Design: Clean, professional, suitable for Chinese social media."""
                 data = response.json()
                 image_url = data["data"][0]["url"]
 
-                # 下载图片
-                img_response = requests.get(image_url, timeout=30)
-                if img_response.status_code == 200:
-                    with open(image_path, 'wb') as f:
-                        f.write(img_response.content)
-
+                # 下载到内存并裁剪为封面尺寸（只解码、编码各一次）
+                if self._download_and_fit(image_url, image_path):
                     return {
                         "success": True,
                         "image_path": image_path,
@@ -369,101 +768,97 @@ Design: Clean, professional, suitable for Chinese social media."""
                 "error": str(e)
             }
 
+    def _download_and_fit(self, image_url, image_path, size=PLACEHOLDER_SIZE, timeout=30):
+        """
+        流式下载图片到内存，缩放后居中裁剪为封面尺寸，按 image_path 扩展名编码一次写盘
+
+        Returns:
+            bool: 是否成功
+        """
+        import io
+        from PIL import Image, ImageOps
+
+        with requests.get(image_url, timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                return False
+            buffer = io.BytesIO()
+            for chunk in response.iter_content(chunk_size=65536):
+                buffer.write(chunk)
+        buffer.seek(0)
+
+        with Image.open(buffer) as img:
+            # 大图先用 draft 降采样解码（仅 JPEG 有效），减少峰值内存
+            img.draft('RGB', (size[0] * 2, size[1] * 2))
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGB")
+            cover = ImageOps.fit(img, size, method=Image.LANCZOS, centering=(0.5, 0.5))
+
+        ext = os.path.splitext(image_path)[1].lower()
+        if ext in (".jpg", ".jpeg"):
+            cover.convert("RGB").save(image_path, 'JPEG', quality=90, optimize=True)
+        elif ext == ".webp":
+            cover.save(image_path, 'WEBP', quality=90)
+        else:
+            cover.save(image_path, 'PNG', optimize=True)
+        return True
+
     def _generate_placeholder(self, title, style, image_path):
-        """生成占位符封面（使用文本和渐变色）"""
+        """生成占位符封面（使用文本和渐变色，在共享进程池中渲染）"""
         try:
-            from PIL import Image, ImageDraw, ImageFont
-
-            # 创建横向图片 (2.35:1)
-            width, height = 1080, 460
-            img = Image.new('RGB', (width, height), color='white')
-            draw = ImageDraw.Draw(img)
-
-            # 根据风格选择颜色
-            colors = {
-                "elegant": {'bg': '#F5F0E6', 'accent': '#5B8A8A', 'text': '#2D3748'},
-                "tech": {'bg': '#1A202C', 'accent': '#00D4FF', 'text': '#FFFFFF'},
-                "warm": {'bg': '#FFFAF0', 'accent': '#ED8936', 'text': '#2D3748'},
-                "bold": {'bg': '#000000', 'accent': '#F6E05E', 'text': '#FFFFFF'},
-                "minimal": {'bg': '#FFFFFF', 'accent': '#000000', 'text': '#000000'},
-                "playful": {'bg': '#FFFBEB', 'accent': '#9F7AEA', 'text': '#2D3748'},
-                "nature": {'bg': '#F5E6D3', 'accent': '#276749', 'text': '#2D3748'},
-                "retro": {'bg': '#F5E6D3', 'accent': '#C05621', 'text': '#2D3748'}
+            result = self.submit_placeholder(title, style, image_path).result()
+        except Exception as e:
+            return {
+                "success": False,
+                "image_path": None,
+                "method": "placeholder",
+                "error": str(e)
             }
+        if result["success"]:
+            result["image_path"] = image_path
+        return result
 
-            color_scheme = colors.get(style, colors["elegant"])
-
-            # 绘制背景
-            draw.rectangle([(0, 0), (width, height)], fill=color_scheme['bg'])
-
-            # 绘制装饰元素（简单的几何形状）
-            accent_color = color_scheme['accent']
-            draw.rectangle([(50, 50), (200, 410)], fill=accent_color)  # 左侧装饰条
-            draw.ellipse([(width-250, 50), (width-50, 200)], fill=accent_color)  # 右上圆形
+    def submit_placeholder(self, title, style, image_path):
+        """
+        提交占位符封面渲染到共享进程池
 
-            # 绘制标题
-            try:
-                # 尝试使用中文字体
-                font_large = ImageFont.truetype("msyh.ttc", 48)  # 微软雅黑
-                font_small = ImageFont.truetype("msyh.ttc", 24)
-            except:
-                # 如果找不到中文字体，使用默认字体
-                font_large = ImageFont.load_default()
-                font_small = ImageFont.load_default()
+        Returns:
+            concurrent.futures.Future，结果为 generate_cover 结构的 dict（image_path 为绝对路径）
+        """
+        from process_pool import submit_cpu
+        return submit_cpu(render_placeholder_cover, title, style, os.path.abspath(image_path))
 
-            # 截断标题（最多15个字符）
-            display_title = title[:15] + "..." if len(title) > 15 else title
+    def render_placeholders(self, items):
+        """
+        批量渲染占位符封面（多核并行）
 
-            # 绘制标题文字
-            text_color = color_scheme['text']
-            draw.text((250, 180), display_title, fill=text_color, font=font_large)
+        Args:
+            items: [(title, style, image_path), ...]
 
-            # 绘制副标题
-            subtitle = f"{datetime.now().strftime('%Y年%m月%d日')}"
-            draw.text((250, 240), subtitle, fill=text_color, font=font_small)
+        Returns:
+            list: 与 items 顺序对应的结果 dict
+        """
+        from process_pool import map_cpu
+        return map_cpu(_render_placeholder_item, [(t, s, os.path.abspath(p)) for t, s, p in items])
 
-            # 保存图片
-            img.save(image_path, 'PNG')
+    def select_style(self, article_content):
+        """根据文章内容自动选择封面风格"""
+        from keyword_engine import scan_article
+        return scan_article(article_content)["style"]
 
-            return {
-                "success": True,
-                "image_path": image_path,
-                "method": "placeholder",
-                "error": None
-            }
+    def _extract_keywords(self, content, max_keywords=10):
+        """从文章内容中提取关键词（关键词表命中的词优先，再用语料 TF-IDF 补足）"""
+        from keyword_engine import scan_article
+        from keyword_extractor import extract_keywords
 
-        except ImportError:
-            return {
-                "success": False,
-                "image_path": None,
-                "method": "placeholder",
-                "error": "PIL not installed. Run: pip install Pillow"
-            }
-        except Exception as e:
-            return {
-                "success": False,
-                "image_path": None,
-                "method": "placeholder",
-                "error": str(e)
-            }
+        matched = scan_article(content)["keywords"]
+        keywords = sorted(matched, key=lambda w: -matched[w])[:max_keywords]
 
-    def _extract_keywords(self, content, max_keywords=10):
-        """从文章内容中提取关键词"""
-        # 简单的关键词提取（基于常见词频）
-        common_words = {'的', '了', '是', '在', '我', '你', '他', '她', '它', '我们', '他们', '这', '那', '有', '没有', '会', '能', '可以', '但是', '因为', '所以', '如果', '虽然', '然后', '还是', '或者', '和', '与', '及'}
-
-        # 分词（简单按空格和标点）
-        words = re.findall(r'[\u4e00-\u9fa5]{2,4}', content)
-
-        # 统计词频
-        word_count = {}
-        for word in words:
-            if word not in common_words and len(word) >= 2:
-                word_count[word] = word_count.get(word, 0) + 1
-
-        # 排序并返回前N个
-        sorted_words = sorted(word_count.items(), key=lambda x: x[1], reverse=True)
-        return [word[0] for word in sorted_words[:max_keywords]]
+        for word in extract_keywords(content, top_k=max_keywords):
+            if len(keywords) >= max_keywords:
+                break
+            if word not in keywords:
+                keywords.append(word)
+        return keywords
 
 
 # 便捷函数
@@ -23,7 +23,6 @@ import sys
 import os
 import json
 import argparse
-from datetime import datetime
 
 # 首先加载 .env 文件
 try:
@@ -45,13 +44,13 @@ except ImportError:
 class GeminiTool:
     """Gemini 3 Pro 工具类"""
 
-    def __init__(self, api_key: str = None, model: str = "models/gemini-3-pro-preview"):
+    def __init__(self, api_key: str = None, model: str = None):
         """
         初始化 Gemini 工具
 
         Args:
             api_key: Gemini API Key（如果不提供，将从环境变量读取）
-            model: 模型名称（默认 gemini-3.0-pro）
+            model: 模型名称（默认按模型注册表选择最快的健康模型）
         """
         # 优先使用传入的 api_key，否则从环境变量读取
         if not api_key:
@@ -63,7 +62,7 @@ class GeminiTool:
         # 配置 API
         genai.configure(api_key=api_key)
 
-        # 尝试列出可用模型，找到最佳匹配
+        # 从模型注册表的缓存中选择（不在启动时探测）
         self.model_name = self._find_best_model(model)
 
         # 创建生成器
@@ -76,22 +75,13 @@ class GeminiTool:
         查找最佳可用的模型
 
         Args:
-            preferred: 首选模型名称
+            preferred: 首选模型名称（健康时直接使用，否则按写作步骤的路由策略选择）
 
         Returns:
             实际可用的模型名称
         """
-        # 根据实际可用的模型列表（2026年1月）
-        candidates = [
-            preferred,  # 用户指定的
-            "models/gemini-3-pro-preview",  # Gemini 3 Pro Preview
-            "models/gemini-2.5-pro",  # Gemini 2.5 Pro（稳定版）
-            "models/gemini-2.0-flash-exp",  # Gemini 2.0 Flash Experimental
-            "models/gemini-pro-latest",  # 保底选项
-        ]
-
-        # 尝试使用首选模型
-        return candidates[0]
+        from model_router import route
+        return route("gemini", "gemini", "write", preferred)
 
     def ask(self, prompt: str, context: str = "") -> str:
         """
@@ -142,6 +132,25 @@ class GeminiTool:
         except Exception as e:
             return f"错误：{str(e)}"
 
+    def ask_structured(self, prompt: str, name: str) -> dict:
+        """
+        要求模型输出 JSON（开启 JSON 模式）并在本地校验，格式不对时做修复调用（见 structured_output.py）
+
+        Args:
+            prompt: 提示词（不含格式要求）
+            name: topic / score
+
+        Returns:
+            通过校验的数据，修复后仍失败时抛出 StructuredOutputError
+        """
+        from structured_output import generate_structured
+
+        def call(p, json_mode):
+            config = {"response_mime_type": "application/json"} if json_mode else None
+            return self.model.generate_content(p, generation_config=config).text
+
+        return generate_structured(call, prompt, name)
+
     def evaluate_ai_score(self, text: str) -> int:
         """
         评估文本的 AI 浓度
@@ -150,7 +159,7 @@ class GeminiTool:
             text: 待评估的文本
 
         Returns:
-            AI 评分 (0-100)
+            AI 评分 (0-100)，评估失败返回 None
         """
         # 截取前 2000 字
         sample = text[:2000] if len(text) > 2000 else text
@@ -163,25 +172,19 @@ class GeminiTool:
 评估标准：
 - 0-30分：像人写的
 - 30-60分：有些 AI 痕迹
-- 60-100分：明显是 AI 写的
-
-只需输出一个数字（0-100），不要解释。"""
+- 60-100分：明显是 AI 写的"""
 
         try:
-            response = self.model.generate_content(prompt)
-            result = response.text.strip()
-
-            # 提取数字
-            import re
-            match = re.search(r'\d+', result)
-            if match:
-                score = int(match.group())
-                return max(0, min(100, score))
-
-            return 50  # 默认值
+            from structured_output import generate_structured
+            from model_router import route
+            from scoring import gemini_score
+            # 评分按路由策略用便宜的快速模型和评分调用配置（见 scoring.py），不占用写作模型
+            scorer = genai.GenerativeModel(route("gemini", "gemini", "evaluate"))
+            return generate_structured(lambda p, json_mode: gemini_score(scorer, p), prompt, "score",
+                                       compact=True)["score"]
         except Exception as e:
             print(f"[Gemini] 评估失败: {e}")
-            return 50
+            return None
 
     def humanize(self, text: str, current_score: int = None) -> str:
         """
@@ -227,7 +230,7 @@ class GeminiTool:
             domain: 内容领域
 
         Returns:
-            包含文章信息的字典
+            包含文章信息的字典，选题失败返回 None
         """
         print(f"\n{'='*60}")
         print("Gemini 3 Pro 公众号文章生成")
@@ -240,21 +243,14 @@ class GeminiTool:
 要求：
 1. 标题吸睛（不超过 30 字）
 2. 有争议性或共鸣点
-3. 给出简要大纲
-
-格式：
-标题：《XXX》
-大纲：XXX"""
+3. 给出简要大纲"""
 
-        topic_result = self.ask(topic_prompt)
-        print(f"✓ 选题完成\n")
-
-        # 解析标题
-        title = "AI时代的思考"
-        if "《" in topic_result and "》" in topic_result:
-            start = topic_result.find("《") + 1
-            end = topic_result.find("》")
-            title = topic_result[start:end]
+        try:
+            title = self.ask_structured(topic_prompt, "topic")["title"]
+        except Exception as e:
+            print(f"✗ 选题失败: {e}")
+            return None
+        print(f"✓ 选题完成：{title}\n")
 
         # 步骤 2：写作
         print(f"[2/4] 正在撰写文章（约 2000 字）...")
@@ -279,16 +275,21 @@ class GeminiTool:
         print(f"[3/4] AI 率优化（最多 5 次）...\n")
 
         best_article = article
-        best_score = 100
+        # 还没有拿到有效评分时为 None（首次评分就失败时按未评分保存）
+        best_score = None
 
         for i in range(1, 6):
             print(f"第 {i} 次迭代：")
 
             # 评估
             score = self.evaluate_ai_score(article)
+            if score is None:
+                print(f"  ✗ 评分失败，使用最佳版本\n")
+                article = best_article
+                break
             print(f"  AI 评分：{score}%")
 
-            if score < best_score:
+            if best_score is None or score < best_score:
                 best_score = score
                 best_article = article
 
@@ -308,16 +309,17 @@ class GeminiTool:
         # 步骤 4：保存
         print(f"[4/4] 保存文章...")
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"gemini_article_{timestamp}.md"
-
-        with open(filename, 'w', encoding='utf-8') as f:
-            f.write(f"# {title}\n\n")
-            f.write(f"**AI 评分**：{best_score}%\n\n")
-            f.write("---\n\n")
-            f.write(article)
+        # 写入文章存储（ID 带任务 ID，同一秒内多次运行也不会互相覆盖，见 article_store.py）
+        from article_store import get_article_store
+        from tracing import new_job_id
+        score_text = "未评分" if best_score is None else f"{best_score}%"
+        content = f"# {title}\n\n**AI 评分**：{score_text}\n\n---\n\n{article}"
+        filename = get_article_store().save(
+            f"article_gemini_tool_{new_job_id()}", content, title=title, provider="Gemini (gemini_tool.py)",
+            ai_score=best_score
+        )
 
-        print(f"✓ 已保存到：{filename}")
+        print(f"✓ 已保存到：{filename}（导出为文件：python article_store.py export <目录>）")
 
         return {
             "title": title,
@@ -346,7 +348,7 @@ def main():
     parser.add_argument("--humanize", action="store_true", help="人工化重写")
     parser.add_argument("--article", action="store_true", help="生成完整文章")
     parser.add_argument("--domain", default="情感,心理", help="内容领域（用于 --article）")
-    parser.add_argument("--model", default="models/gemini-3-pro-preview", help="指定模型（默认：Gemini 3 Pro）")
+    parser.add_argument("--model", default=None, help="指定模型（默认按模型注册表选择，见 model_registry.py）")
     parser.add_argument("--api-key", help="API Key（或使用 GEMINI_API_KEY 环境变量）")
 
     args = parser.parse_args()
@@ -362,9 +364,11 @@ def main():
     if args.article:
         # 生成完整文章
         result = tool.generate_article(args.domain)
+        if not result:
+            sys.exit(1)
         print(f"\n最终结果：")
         print(f"  标题：{result['title']}")
-        print(f"  AI 评分：{result['ai_score']}%")
+        print(f"  AI 评分：{'未评分' if result['ai_score'] is None else str(result['ai_score']) + '%'}")
         print(f"  文件：{result['filename']}")
 
     elif args.evaluate:
@@ -381,6 +385,8 @@ def main():
             text = args.prompt
 
         score = tool.evaluate_ai_score(text)
+        if score is None:
+            sys.exit(1)
         print(f"\nAI 评分：{score}%")
 
     elif args.humanize:
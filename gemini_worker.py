@@ -6,31 +6,106 @@ Gemini 工作流脚本
 import google.generativeai as genai
 from typing import Dict, Tuple
 import os
+from prompt_cache import PromptParts, prompt_text
 
 
 class GeminiAgent:
     """Gemini AI 代理，用于处理公众号文章的选题、写作和优化"""
 
-    def __init__(self, api_key: str, thinking_model: str = "gemini-2.0-flash-thinking-exp", pro_model: str = "gemini-1.5-pro"):
+    def __init__(self, api_key: str, thinking_model: str = None, pro_model: str = None):
         """
         初始化 Gemini 代理
 
         Args:
             api_key: Google API Key
-            thinking_model: 深度思考模型（用于选题和复杂分析）
-            pro_model: Pro 模型（用于写作和优化）
+            thinking_model: 深度思考模型（用于选题），默认按路由策略选择
+            pro_model: Pro 模型（用于写作和重写），默认按路由策略选择；评分始终按路由策略选择便宜的快速模型
         """
+        from token_budget import ContextBudget
+        from prompt_cache import CacheStats
         genai.configure(api_key=api_key)
+        self.api_key = api_key
 
-        # 配置深度思考模型（用于选题）
+        # 指定的模型优先；未指定时每次调用按 gemini 流程的路由策略选择（见 model_router.py）
         self.thinking_model = thinking_model
-        self.thinking_genai = genai.GenerativeModel(thinking_model)
-
-        # 配置 Pro 模型（用于写作和优化）
         self.pro_model = pro_model
-        self.pro_genai = genai.GenerativeModel(pro_model)
+        # 各步骤的估算用量和费用（任务结束时输出，见 token_budget.cost_report）
+        self.budget = ContextBudget("gemini")
+        # 路由策略只读取一次（见 model_router.py）
+        from model_router import load_routing
+        self.routing = load_routing("gemini")
+        # 缓存命中统计（见 prompt_cache.py）
+        self.cache_stats = CacheStats()
+
+        print(f"[Gemini] 初始化完成 - Thinking: {thinking_model or 'auto'}, Pro: {pro_model or 'auto'}")
+
+    def _model_for(self, step: str) -> str:
+        """
+        按步骤选择模型
 
-        print(f"[Gemini] 初始化完成 - Thinking: {thinking_model}, Pro: {pro_model}")
+        Args:
+            step: topic / write / evaluate / rewrite
+
+        Returns:
+            模型名称
+        """
+        from model_router import route
+        preferred = {"topic": self.thinking_model, "write": self.pro_model, "rewrite": self.pro_model}.get(step)
+        return route("gemini", "gemini", step, preferred, routing=self.routing)
+
+    def _generate(self, step: str, prompt: str, json_mode: bool = False, score: bool = False) -> str:
+        """
+        调用步骤对应的模型生成文本（支持录制/回放，见 cassette.py；耗时和错误计入模型注册表；
+        配置了多个 Key 时按 Key 池轮换，见 key_pool.py；用量按步骤计入 self.budget）
+
+        Args:
+            step: topic / write / evaluate / rewrite
+            prompt: 提示词（str，或拆分为固定前缀和后缀的 PromptParts，前缀够长时使用上下文缓存）
+            json_mode: 要求输出 JSON（response_mime_type=application/json）
+            score: 使用评分调用配置（极小输出上限、温度 0、流式读到第一个整数即停止，见 scoring.py）
+
+        Returns:
+            生成的文本
+        """
+        import time
+        from scoring import gemini_score
+        from cassette import cassette_call
+        from model_registry import record_call
+        from key_pool import get_key_pool
+        from prompt_cache import gemini_request, gemini_usage, record_usage, prefix_cacheable
+        model_name = self._model_for(step)
+
+        generation_config = {"response_mime_type": "application/json"} if json_mode else None
+
+        def generate(key):
+            model, contents = gemini_request(model_name, prompt, key)
+            if score:
+                # 前缀不可能命中缓存时读到整数即停止，不为统计用量读完整个流
+                on_usage = (lambda chunk: record_usage("gemini", gemini_usage(chunk), self.cache_stats)) \
+                    if prefix_cacheable("gemini", prompt) else None
+                return gemini_score(model, contents, on_usage=on_usage)
+            response = model.generate_content(contents, generation_config=generation_config)
+            record_usage("gemini", gemini_usage(response), self.cache_stats)
+            return response.text
+
+        def call():
+            started = time.perf_counter()
+            try:
+                text = get_key_pool("gemini", self.api_key).call(generate)
+            except Exception as e:
+                record_call(model_name, error=e)
+                raise
+            record_call(model_name, time.perf_counter() - started)
+            return text
+
+        request = {"model": model_name, "prompt": prompt_text(prompt)}
+        if json_mode:
+            request["json"] = True
+        if score:
+            request["profile"] = "score"
+        text = cassette_call("gemini", request, call)
+        self.budget.record("gemini", prompt_text(prompt), text, step, model_name)
+        return text
 
     def research_topic(self, domain: str = "科技,AI,互联网") -> Dict[str, str]:
         """
@@ -40,7 +115,7 @@ class GeminiAgent:
             domain: 内容领域，多个领域用逗号分隔
 
         Returns:
-            包含 title 和 outline 的字典
+            包含 title 和 outline 的字典，失败返回 None
         """
         print(f"[Gemini] 正在深度思考爆款选题...")
         print(f"[Gemini] 目标领域: {domain}")
@@ -57,48 +132,21 @@ class GeminiAgent:
 
 请给出：
 - 一个最推荐的标题（不超过30字）
-- 简要的内容大纲（200字左右）
-
-直接输出，格式如下：
-标题：《XXX》
-大纲：XXX"""
+- 简要的内容大纲（200字左右）"""
 
         try:
-            response = self.thinking_genai.generate_content(prompt)
-            result = response.text
-
-            # 解析结果
-            lines = result.strip().split('\n')
-            title = ""
-            outline = ""
-
-            for line in lines:
-                if line.startswith("标题：") or line.startswith("标题:"):
-                    title = line.split("：", 1)[-1].split(":", 1)[-1].strip()
-                elif line.startswith("大纲：") or line.startswith("大纲:"):
-                    outline = line.split("：", 1)[-1].split(":", 1)[-1].strip()
-                elif line and not title and "《" in line and "》" in line:
-                    # 提取标题
-                    start = line.find("《") + 1
-                    end = line.find("》")
-                    if start > 0 and end > start:
-                        title = line[start:end]
-
-            if not title:
-                title = "AI时代的思考：未来已来，你准备好了吗？"
-            if not outline:
-                outline = "探讨AI技术发展对人类社会的影响和启示"
-
-            print(f"[Gemini] ✓ 选定题目：{title}")
-            return {"title": title, "outline": outline}
+            # 要求输出 JSON 并在本地校验，格式不对时做修复调用（见 structured_output.py）
+            from structured_output import generate_structured
+            topic = generate_structured(
+                lambda p, json_mode: self._generate("topic", p, json_mode), prompt, "topic")
+
+            print(f"[Gemini] ✓ 选定题目：{topic['title']}")
+            return {"title": topic["title"], "outline": topic["outline"]}
 
         except Exception as e:
+            # 不再回退到默认选题继续跑完整个流程
             print(f"[Gemini] ✗ 选题失败: {e}")
-            # 返回默认选题
-            return {
-                "title": "AI时代的思考：技术革新与人文关怀",
-                "outline": "探讨AI技术发展对人类社会的深远影响"
-            }
+            return None
 
     def write_article(self, topic: str, outline: str = "", length: int = 2000) -> str:
         """
@@ -136,8 +184,7 @@ class GeminiAgent:
 请直接输出文章内容，不要任何开场白。"""
 
         try:
-            response = self.pro_genai.generate_content(prompt)
-            article = response.text.strip()
+            article = self._generate("write", prompt).strip()
 
             print(f"[Gemini] ✓ 文章撰写完成 ({len(article)}字)")
             return article
@@ -154,14 +201,15 @@ class GeminiAgent:
             text: 待检测的文本
 
         Returns:
-            AI 浓度评分 (0-100)，100代表完全像AI，0代表完全像人
+            AI 浓度评分 (0-100)，100代表完全像AI，0代表完全像人；评分失败返回 None
         """
         print(f"[Gemini] 正在评估AI浓度...")
 
         # 截取前2000字进行分析（避免超出限制）
         sample_text = text[:2000] if len(text) > 2000 else text
 
-        prompt = f"""你是一个专业的AI内容检测专家。请分析以下文本的"AI浓度"。
+        # 固定的分析标准在前、待测文本在后，前缀跨迭代不变，可命中上下文缓存（见 prompt_cache.py）
+        prompt = PromptParts("""你是一个专业的AI内容检测专家。请分析下面文本的"AI浓度"。
 
 分析标准：
 1. 困惑度(Perplexity): 词汇使用是否丰富多样
@@ -169,38 +217,49 @@ class GeminiAgent:
 3. 情感表达: 是否有真实的人类情感
 4. 用词习惯: 是否使用AI常见的连接词和句式
 
-文本内容：
-"""
-{sample_text}
-
 请给出一个0-100的评分：
 - 0-30分：很自然，像人写的
 - 30-60分：有些AI痕迹
-- 60-100分：明显是AI写的
+- 60-100分：明显是AI写的""", f"""
 
-只需要输出一个数字（0-100之间的整数），不要任何解释。"""
+文本内容：
+\"\"\"
+{sample_text}
+\"\"\"""")
 
         try:
-            response = self.pro_genai.generate_content(prompt)
-            result = response.text.strip()
-
-            # 提取数字
-            import re
-            match = re.search(r'\d+', result)
-            if match:
-                score = int(match.group())
-                # 确保在0-100范围内
-                score = max(0, min(100, score))
+            from structured_output import generate_structured
+            from scoring import ensemble_config, scorer_labels, heuristic_score, ensemble_score, describe
+
+            def model_score():
+                return generate_structured(
+                    lambda p, json_mode: self._generate("evaluate", p, score=True), prompt, "score", compact=True
+                )["score"]
+
+            # 集成评分（见 scoring.py）：本代理只有 Gemini，primary / gemini 都是 Gemini 评分模型的重复调用
+            names, method = ensemble_config()
+            scorers = {}
+            for label, name in scorer_labels(names):
+                if name in ("primary", "gemini"):
+                    scorers[label] = model_score
+                elif name == "heuristic":
+                    scorers[label] = lambda: heuristic_score(text)
+                else:
+                    print(f"[Gemini] ⚠ 评分器 {label} 不适用于 Gemini 工作流，已跳过")
+            if len(scorers) <= 1 and "heuristic" not in scorers:
+                score = model_score()
             else:
-                # 如果无法提取，使用默认值
-                score = 70
+                result = ensemble_score(scorers or {"primary": model_score}, method)
+                print(f"[Gemini] 集成评分：{describe(result)}")
+                score = result["score"]
 
             print(f"[Gemini] ✓ AI浓度评分：{score}%")
             return score
 
         except Exception as e:
+            # 不再用默认分数冒充评分结果
             print(f"[Gemini] ✗ 评分失败: {e}")
-            return 70  # 默认值
+            return None
 
     def humanize_rewrite(self, text: str, current_score: int) -> str:
         """
@@ -216,12 +275,12 @@ class GeminiAgent:
         print(f"[Gemini] 正在进行人话化重写...")
         print(f"[Gemini] 当前AI率: {current_score}% -> 目标: <30%")
 
-        prompt = f"""你是一位文字编辑，擅长将AI写的文章改写得像真人写的。
+        # 固定的改写规则在前、当前评分和原文在后（见 prompt_cache.py）
+        prompt = PromptParts("""你是一位文字编辑，擅长将AI写的文章改写得像真人写的。
 
-当前AI评分：{current_score}%
 目标AI评分：<30%
 
-请重写以下文章，要求：
+请重写下面的原文，要求：
 1. 大幅增加口语化表达
 2. 打乱句式结构，长短句交替
 3. 加入更多个人观点、吐槽、感慨
@@ -233,15 +292,17 @@ class GeminiAgent:
 9. 可以加入一些"我觉得"、"说实话"等主观表达
 10. 偶尔出现一些小瑕疵（如不完整的句子）会更像人
 
+请直接输出重写后的文章，不要任何开场白。""", f"""
+
+当前AI评分：{current_score}%
+
 原文：
-"""
+\"\"\"
 {text}
-
-请直接输出重写后的文章，不要任何开场白。"""
+\"\"\"""")
 
         try:
-            response = self.pro_genai.generate_content(prompt)
-            rewritten = response.text.strip()
+            rewritten = self._generate("rewrite", prompt).strip()
 
             print(f"[Gemini] ✓ 重写完成 ({len(rewritten)}字)")
             return rewritten
@@ -0,0 +1,230 @@
+"""
+历史文章模块
+功能：分页列出和读取文章存储中的历史文章（见 article_store.py）；解析旧版文章文件的元数据头
+      （标题、服务商、AI 评分），导入大量旧文件时在共享进程池中并行解析；
+      提供批量渲染公众号 HTML 和占位符封面的命令行入口
+
+用法：
+    python history.py --output rendered --theme default
+"""
+
+import os
+
+
+# 服务商名称简写（注意：更具体的判断要放在前面）
+PROVIDER_SHORT_NAMES = [
+    ('Gemini 3 Pro', 'Gemini API'),
+    ('Gemini Web + DeepSeek', 'Gemini Web + DeepSeek'),
+    ('Gemini Web', 'Gemini Web'),
+    ('Zhipu GLM', '智谱 GLM'),
+]
+
+# 文章数达到该值时才使用进程池（进程间传参的开销高于解析少量文件头）
+PARALLEL_THRESHOLD = 16
+
+
+def _short_provider(provider):
+    for marker, short in PROVIDER_SHORT_NAMES:
+        if marker in provider:
+            return short
+    return provider
+
+
+def parse_article_header(filepath):
+    """
+    解析文章头部元数据（模块级函数，可在进程池中执行）
+
+    Args:
+        filepath: 文章文件路径
+
+    Returns:
+        dict: {"filename", "title", "size", "modified_time", "provider", "ai_score"}，读取失败返回 None
+    """
+    try:
+        filename = os.path.basename(filepath)
+        stat = os.stat(filepath)
+
+        # 读取文件前几行获取标题和provider
+        title = filename  # 默认使用文件名
+        provider = "Unknown"
+        ai_score = None
+
+        with open(filepath, 'r', encoding='utf-8') as f:
+            in_comment = False
+            title_found = False  # 标记是否已找到标题
+
+            for i, line in enumerate(f):
+                # 检查HTML注释格式的元数据
+                if line.strip() == '<!--':
+                    in_comment = True
+                    continue
+                if line.strip() == '-->':
+                    in_comment = False
+                    continue
+                if in_comment:
+                    if 'Title:' in line:
+                        title = line.split('Title:')[1].strip()
+                        title_found = True
+                    elif 'Provider:' in line:
+                        provider = line.split('Provider:')[1].strip()
+                    elif 'AI Score:' in line:
+                        score_text = line.split('AI Score:')[1].strip()
+                        ai_score = score_text.replace('%', '').strip()
+                    continue
+
+                # 旧格式兼容（如果不在注释中）
+                elif i < 15:  # 只检查前15行
+                    # 尝试解析 Markdown 标题 (# 标题)
+                    if not title_found and line.strip().startswith('# '):
+                        title = line.strip()[2:].strip()
+                        title_found = True
+                    # 旧格式的 **Provider**: xxx
+                    elif '**Provider**' in line or 'Provider**' in line:
+                        provider = line.split('**:**')[1].strip() if '**:**' in line else line.replace('**Provider**: ', '').replace('**Provider**:', '').strip()
+                    # 旧格式的 **AI Score**: xxx
+                    elif '**AI Score**' in line or 'AI Score**' in line:
+                        score_text = line.split('**:**')[1].strip() if '**:**' in line else line.replace('**AI Score**: ', '').replace('**AI Score**:', '').strip()
+                        ai_score = score_text.replace('%', '').strip()
+                else:
+                    # 元数据都在文件头部，之后的正文不必再读
+                    break
+
+        return {
+            "filename": filename,
+            "title": title,
+            "size": stat.st_size,
+            "modified_time": stat.st_mtime,
+            "provider": _short_provider(provider),
+            "ai_score": ai_score
+        }
+    except Exception as e:
+        print(f"Error reading file {filepath}: {e}")
+        return None
+
+
+def parse_headers(paths):
+    """
+    批量解析文章头（文件较多时多核并行，导入旧版文章时使用）
+
+    Returns:
+        list: 解析成功的元数据 dict，保持输入顺序
+    """
+    paths = [os.path.abspath(p) for p in paths]
+    if len(paths) >= PARALLEL_THRESHOLD:
+        from process_pool import map_cpu
+        results = map_cpu(parse_article_header, paths, chunksize=8)
+    else:
+        results = [parse_article_header(p) for p in paths]
+    return [r for r in results if r is not None]
+
+
+def list_history(page=1, per_page=10):
+    """
+    分页列出历史文章（从文章存储的索引列读取，不解压正文）
+
+    Returns:
+        tuple: (当前页的元数据列表, 文章总数)
+    """
+    from article_store import get_article_store
+
+    store = get_article_store()
+    page = max(1, page)
+    return store.list(offset=(page - 1) * per_page, limit=per_page), store.count()
+
+
+def read_article(filename):
+    """
+    按文件名读取历史文章的 Markdown 内容
+
+    先查文章存储；找不到时兼容还没导入的旧版文件（项目目录下的 article*.md）
+
+    Returns:
+        str: 文章内容，不存在返回 None
+    """
+    from article_store import get_article_store, article_id_from_filename
+
+    if article_id_from_filename(filename) is None:
+        return None
+    content = get_article_store().read(filename)
+    if content is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), filename)
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+    return content
+
+
+def batch_render(filenames, output_dir, theme="default", covers=True):
+    """
+    批量把文章渲染为公众号 HTML（以及占位符封面），多核并行
+
+    Args:
+        filenames: 文章文件名列表（文章存储中的 article_xxx.md）
+        output_dir: 输出目录
+        theme: 排版主题
+        covers: 是否同时渲染占位符封面
+
+    Returns:
+        dict: {"success": bool, "html": [...], "covers": [...], "error": str}
+    """
+    from wechat_renderer import render_many
+    from article_store import get_article_store, article_id_from_filename
+
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        store = get_article_store()
+        records = []
+        for filename in filenames:
+            record = store.get(article_id_from_filename(os.path.basename(filename)) or "")
+            if record is None:
+                print(f"[History] ⚠ 文章不存在: {filename}")
+                continue
+            records.append(record)
+
+        html_files = []
+        for record, html in zip(records, render_many([r["content"] for r in records], theme)):
+            html_path = os.path.join(output_dir, f"{record['id']}.html")
+            with open(html_path, 'w', encoding='utf-8') as f:
+                f.write(html)
+            html_files.append(html_path)
+        print(f"[History] ✓ 已渲染 {len(html_files)} 篇 HTML")
+
+        cover_files = []
+        if covers:
+            from cover_generator import CoverGenerator
+            generator = CoverGenerator()
+            items = [
+                (record["title"] or record["id"], generator.select_style(record["content"]),
+                 os.path.join(output_dir, f"{record['id']}_cover.png"))
+                for record in records
+            ]
+            for result in generator.render_placeholders(items):
+                if result.get("success"):
+                    cover_files.append(result["image_path"])
+                else:
+                    print(f"[History] ✗ 封面渲染失败: {result.get('error')}")
+            print(f"[History] ✓ 已渲染 {len(cover_files)} 张占位符封面")
+
+        return {"success": True, "html": html_files, "covers": cover_files}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="批量渲染历史文章")
+    parser.add_argument("files", nargs="*", help="文章文件名（默认文章存储中的全部文章）")
+    parser.add_argument("--output", default="rendered", help="输出目录")
+    parser.add_argument("--theme", default="default", help="排版主题")
+    parser.add_argument("--no-covers", action="store_true", help="不渲染占位符封面")
+    args = parser.parse_args()
+
+    if args.files:
+        filenames = args.files
+    else:
+        from article_store import get_article_store
+        filenames = [f"{article_id}.md" for article_id in get_article_store().iter_ids()]
+    result = batch_render(filenames, args.output, args.theme, not args.no_covers)
+    if not result["success"]:
+        print(f"[History] ✗ 批量渲染失败: {result['error']}")
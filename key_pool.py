@@ -0,0 +1,326 @@
+"""
+API Key 池
+功能：每个服务商可在 .env 中配置多个 Key，按 Key 记录调用数、在途请求、错误和限流冷却，
+      调用时优先选择在途最少的可用 Key，遇到 429 自动换下一个 Key 重试，批量任务的吞吐随 Key 数扩展
+
+环境变量（逗号分隔，未配置时回退到单个 Key 的变量）：
+    GEMINI_API_KEYS     回退 GEMINI_API_KEY
+    ZHIPU_API_KEYS      回退 ZHIPU_API_KEY
+    DEEPSEEK_API_KEYS   回退 DEEPSEEK_API_KEY
+    KEY_COOLDOWN        限流后的冷却时间（秒，默认 60；响应带 Retry-After 时以其为准）
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+
+PROVIDER_ENV = {
+    "gemini": ("GEMINI_API_KEYS", "GEMINI_API_KEY"),
+    "zhipu": ("ZHIPU_API_KEYS", "ZHIPU_API_KEY"),
+    "deepseek": ("DEEPSEEK_API_KEYS", "DEEPSEEK_API_KEY"),
+}
+
+
+class KeyRateLimited(Exception):
+    """Key 被限流（429 / 配额用尽）"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(error):
+    """判断异常是否为限流或配额用尽"""
+    if isinstance(error, KeyRateLimited):
+        return True
+    message = str(error)
+    return "429" in message or "quota" in message.lower() or "ResourceExhausted" in type(error).__name__
+
+
+def mask_key(key):
+    """日志和状态接口中显示的 Key（只保留首尾）"""
+    return f"{key[:6]}...{key[-4:]}" if len(key) > 12 else "***"
+
+
+class KeyPool:
+    """单个服务商的 Key 池（线程安全）"""
+
+    def __init__(self, provider, keys, cooldown=60):
+        """
+        Args:
+            provider: 服务商标识
+            keys: Key 列表
+            cooldown: 限流后的默认冷却时间（秒）
+        """
+        self.provider = provider
+        self.keys = list(dict.fromkeys(k for k in keys if k))
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = {
+            key: {"in_flight": 0, "calls": 0, "errors": 0, "rate_limited": 0,
+                  "cooldown_until": 0, "last_used": 0, "last_error": None}
+            for key in self.keys
+        }
+
+    @property
+    def size(self):
+        return len(self.keys)
+
+    def acquire(self, exclude=()):
+        """
+        取一个 Key：跳过冷却中的 Key，按（在途请求数, 累计调用数）最少优先；
+        全部冷却时取最早解除冷却的 Key
+
+        Args:
+            exclude: 本次调用已经试过的 Key
+
+        Returns:
+            str: Key（池为空时为 None）
+        """
+        with self._lock:
+            candidates = [k for k in self.keys if k not in exclude] or self.keys
+            if not candidates:
+                return None
+            now = time.time()
+            ready = [k for k in candidates if self._state[k]["cooldown_until"] <= now]
+            if ready:
+                key = min(ready, key=lambda k: (self._state[k]["in_flight"], self._state[k]["calls"]))
+            else:
+                key = min(candidates, key=lambda k: self._state[k]["cooldown_until"])
+            state = self._state[key]
+            state["in_flight"] += 1
+            state["calls"] += 1
+            state["last_used"] = now
+            return key
+
+    def release(self, key, error=None, retry_after=None):
+        """
+        归还 Key 并记录结果
+
+        Args:
+            key: acquire 取得的 Key
+            error: 调用异常（限流时进入冷却）
+            retry_after: 服务端建议的等待秒数
+        """
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                return
+            state["in_flight"] = max(0, state["in_flight"] - 1)
+            if error is None:
+                return
+            state["errors"] += 1
+            state["last_error"] = str(error)[:200]
+            if is_rate_limit_error(error):
+                state["rate_limited"] += 1
+                wait = retry_after if retry_after is not None else getattr(error, "retry_after", None)
+                try:
+                    wait = float(wait) if wait is not None else self.cooldown
+                except (TypeError, ValueError):
+                    wait = self.cooldown
+                state["cooldown_until"] = time.time() + wait
+                print(f"[KeyPool] ⚠ {self.provider} Key {mask_key(key)} 被限流，冷却 {wait:.0f} 秒")
+
+    @contextmanager
+    def lease(self, exclude=()):
+        """with pool.lease() as key: ...（异常自动记录，限流时 Key 进入冷却）"""
+        key = self.acquire(exclude)
+        try:
+            yield key
+        except Exception as e:
+            self.release(key, error=e)
+            raise
+        self.release(key)
+
+    def call(self, fn):
+        """
+        用池中的 Key 调用 fn(key)，遇到限流换下一个 Key 重试（每个 Key 最多试一次）
+
+        Returns:
+            fn 的返回值
+        """
+        from tracing import span
+        tried = []
+        while True:
+            try:
+                with self.lease(exclude=tried) as key:
+                    tried.append(key)
+                    with span(f"{self.provider} key attempt", cat="retry", key=mask_key(key),
+                              attempt=len(tried), retry=len(tried) > 1):
+                        return fn(key)
+            except Exception as e:
+                if not is_rate_limit_error(e) or len(tried) >= self.size:
+                    raise
+
+    async def call_async(self, coro_fn):
+        """call 的协程版本（coro_fn(key) 返回协程）"""
+        from tracing import span
+        tried = []
+        while True:
+            key = self.acquire(exclude=tried)
+            tried.append(key)
+            try:
+                with span(f"{self.provider} key attempt", cat="retry", key=mask_key(key),
+                          attempt=len(tried), retry=len(tried) > 1):
+                    result = await coro_fn(key)
+            except Exception as e:
+                self.release(key, error=e)
+                if not is_rate_limit_error(e) or len(tried) >= self.size:
+                    raise
+                continue
+            except BaseException:
+                self.release(key)
+                raise
+            self.release(key)
+            return result
+
+    def stats(self):
+        """各 Key 的状态（Key 已脱敏）"""
+        now = time.time()
+        with self._lock:
+            return {
+                "provider": self.provider,
+                "keys": [
+                    {
+                        "key": mask_key(key),
+                        "in_flight": state["in_flight"],
+                        "calls": state["calls"],
+                        "errors": state["errors"],
+                        "rate_limited": state["rate_limited"],
+                        "cooldown_s": max(0, round(state["cooldown_until"] - now, 1)),
+                        "last_error": state["last_error"]
+                    }
+                    for key, state in self._state.items()
+                ]
+            }
+
+
+def load_keys(provider, default=None):
+    """从环境变量读取服务商的 Key 列表"""
+    plural, single = PROVIDER_ENV.get(provider, (f"{provider.upper()}_API_KEYS", f"{provider.upper()}_API_KEY"))
+    keys = [k.strip() for k in os.getenv(plural, "").split(",") if k.strip()]
+    if not keys:
+        key = os.getenv(single, default)
+        keys = [key] if key else []
+    return keys
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_key_pool(provider, default=None):
+    """
+    获取服务商的共享 Key 池（首次使用时读取环境变量）
+
+    Args:
+        provider: gemini / zhipu / deepseek
+        default: 环境变量都未配置时使用的 Key
+    """
+    with _pools_lock:
+        pool = _pools.get(provider)
+        if pool is None:
+            keys = load_keys(provider, default)
+            if provider == "gemini" and len(keys) > 1 and not _gemini_binder.supported:
+                print(f"[KeyPool] ✗ 当前 google-generativeai 版本不支持按 Key 绑定客户端，"
+                      f"Gemini 只使用第一个 Key（已配置 {len(keys)} 个）")
+                keys = keys[:1]
+            pool = _pools[provider] = KeyPool(provider, keys,
+                                              cooldown=float(os.getenv("KEY_COOLDOWN", "60") or 60))
+        return pool
+
+
+def key_count(provider):
+    """服务商已配置的 Key 数（至少为 1，用于按 Key 数放大并发上限）"""
+    with _pools_lock:
+        pool = _pools.get(provider)
+    if pool is not None:
+        return max(1, pool.size)
+    if provider not in PROVIDER_ENV:
+        return 1
+    count = len(load_keys(provider))
+    if provider == "gemini" and count > 1 and not _gemini_binder.supported:
+        return 1
+    return max(1, count)
+
+
+def pool_stats():
+    """所有已使用的 Key 池状态"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+class GeminiKeyBindingError(Exception):
+    """当前 google-generativeai 版本无法把模型绑定到指定 Key"""
+
+
+class GeminiKeyBinder:
+    """
+    多 Key 时把 GenerativeModel 绑定到指定 Key 的客户端（同步和异步客户端都绑定）
+
+    google-generativeai 只有进程级的 genai.configure，没有公开的按实例指定 Key 的方式，
+    只能借助私有的 client._ClientManager 并替换模型的 _client / _async_client。该 SDK 已停止维护，
+    对私有接口的依赖全部集中在这里：接口不可用时 supported 为 False，Gemini Key 池退化为单 Key 并打印错误，
+    bind 抛出 GeminiKeyBindingError，不会静默地把请求发到全局配置的 Key 上
+    """
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._supported = None
+
+    @property
+    def supported(self):
+        """私有接口是否可用（首次访问时检查一次）"""
+        with self._lock:
+            if self._supported is None:
+                try:
+                    import google.generativeai as genai
+                    from google.generativeai.client import _ClientManager
+                    model = genai.GenerativeModel("gemini-pro")
+                    self._supported = (hasattr(_ClientManager, "configure") and hasattr(_ClientManager, "get_default_client")
+                                       and hasattr(model, "_client") and hasattr(model, "_async_client"))
+                except Exception:
+                    self._supported = False
+            return self._supported
+
+    def bind(self, model, key):
+        """
+        把模型绑定到 key 的客户端
+
+        Raises:
+            GeminiKeyBindingError: 私有接口不可用或模型不是 SDK 的 GenerativeModel
+        """
+        if not self.supported or not hasattr(model, "_client") or not hasattr(model, "_async_client"):
+            raise GeminiKeyBindingError("当前 google-generativeai 版本不支持按 Key 绑定客户端")
+        with self._lock:
+            clients = self._clients.get(key)
+            if clients is None:
+                from google.generativeai.client import _ClientManager
+                try:
+                    manager = _ClientManager()
+                    manager.configure(api_key=key)
+                    clients = (manager.get_default_client("generative"),
+                               manager.get_default_client("generative_async"))
+                except Exception as e:
+                    raise GeminiKeyBindingError(f"创建 Gemini Key {mask_key(key)} 的客户端失败: {e}") from e
+                self._clients[key] = clients
+        model._client, model._async_client = clients
+        return model
+
+
+_gemini_binder = GeminiKeyBinder()
+
+
+def bind_gemini_key(model, key):
+    """
+    把 GenerativeModel 绑定到 Key 池取得的 Key（见 GeminiKeyBinder）
+
+    只有一个 Key 时沿用 genai.configure 的全局客户端，不做任何改动
+    """
+    if key is None or get_key_pool("gemini").size <= 1:
+        return model
+    return _gemini_binder.bind(model, key)
@@ -0,0 +1,203 @@
+"""
+关键词引擎模块
+功能：用 Aho-Corasick 自动机一次扫描文章，同时得到封面风格得分、内容标签和 AI 痕迹短语
+"""
+
+import os
+import json
+import threading
+from collections import deque
+
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keywords_config.json")
+
+
+class AhoCorasick:
+    """多模式串匹配自动机"""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        self._built = False
+
+    def add(self, pattern, payload):
+        """
+        添加模式串
+
+        Args:
+            pattern: 模式串
+            payload: 命中时返回的附加数据
+        """
+        node = 0
+        for char in pattern:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = nxt
+        self._output[node].append((pattern, payload))
+        self._built = False
+
+    def build(self):
+        """BFS 构建失败指针"""
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+        self._built = True
+
+    def iter_matches(self, text):
+        """
+        扫描文本
+
+        Yields:
+            (结束位置, 模式串, payload)
+        """
+        if not self._built:
+            self.build()
+
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for pattern, payload in output[node]:
+                yield i, pattern, payload
+
+
+def _is_ascii_word_char(char):
+    return char.isascii() and char.isalnum()
+
+
+class KeywordEngine:
+    """基于加权关键词表的文章扫描器"""
+
+    def __init__(self, config=None):
+        """
+        初始化引擎
+
+        Args:
+            config: 关键词表（dict），默认读取 keywords_config.json
+        """
+        if config is None:
+            config = self._load_config()
+
+        self.default_style = config.get("default_style", "elegant")
+        self.style_order = list(config.get("styles", {}))
+        self.topic_order = list(config.get("topics", {}))
+        self.automaton = AhoCorasick()
+
+        for style, words in config.get("styles", {}).items():
+            for word, weight in words.items():
+                self.automaton.add(word.lower(), ("style", style, weight))
+        for topic, words in config.get("topics", {}).items():
+            for word, weight in words.items():
+                self.automaton.add(word.lower(), ("topic", topic, weight))
+        for phrase, weight in config.get("ai_markers", {}).items():
+            self.automaton.add(phrase.lower(), ("marker", phrase, weight))
+
+        self.automaton.build()
+
+    @staticmethod
+    def _load_config():
+        try:
+            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"[Keywords] ⚠ 读取关键词表失败: {e}")
+            return {}
+
+    def scan(self, text, max_topics=3):
+        """
+        单次扫描文章
+
+        Args:
+            text: 文章内容
+            max_topics: 最多返回的标签数
+
+        Returns:
+            dict: {
+                "style": str,              # 得分最高的封面风格（无命中时为 default_style）
+                "style_scores": dict,      # {风格: 加权得分}
+                "topics": list,            # 按得分排序的内容标签
+                "topic_scores": dict,      # {标签: 加权得分}
+                "ai_markers": dict,        # {AI 痕迹短语: 出现次数}
+                "ai_marker_score": int,    # AI 痕迹加权总分
+                "keywords": dict           # {命中的风格/标签关键词: 出现次数}
+            }
+        """
+        lowered = (text or "").lower()
+        style_scores = {}
+        topic_scores = {}
+        markers = {}
+        marker_score = 0
+        keywords = {}
+
+        for end, pattern, (kind, name, weight) in self.automaton.iter_matches(lowered):
+            # 英文关键词要求整词匹配（避免 "ai" 命中 "said"）
+            if pattern.isascii():
+                start = end - len(pattern) + 1
+                if (start > 0 and _is_ascii_word_char(lowered[start - 1])) or \
+                        (end + 1 < len(lowered) and _is_ascii_word_char(lowered[end + 1])):
+                    continue
+
+            if kind == "style":
+                style_scores[name] = style_scores.get(name, 0) + weight
+                keywords[pattern] = keywords.get(pattern, 0) + 1
+            elif kind == "topic":
+                topic_scores[name] = topic_scores.get(name, 0) + weight
+                keywords[pattern] = keywords.get(pattern, 0) + 1
+            else:
+                markers[name] = markers.get(name, 0) + 1
+                marker_score += weight
+
+        style = self.default_style
+        if style_scores:
+            # 同分时按关键词表中的顺序
+            style = max(self.style_order, key=lambda s: (style_scores.get(s, 0), -self.style_order.index(s)))
+
+        topics = sorted(topic_scores, key=lambda t: (-topic_scores[t], self.topic_order.index(t)))
+
+        return {
+            "style": style,
+            "style_scores": style_scores,
+            "topics": topics[:max_topics],
+            "topic_scores": topic_scores,
+            "ai_markers": markers,
+            "ai_marker_score": marker_score,
+            "keywords": keywords
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_keyword_engine():
+    """获取进程内共享的关键词引擎（自动机只构建一次）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = KeywordEngine()
+        return _engine
+
+
+def scan_article(text):
+    """扫描文章的便捷函数"""
+    return get_keyword_engine().scan(text)
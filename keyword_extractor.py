@@ -0,0 +1,247 @@
+"""
+关键词提取模块
+功能：基于语料文档频率（增量维护）的 TF-IDF 关键词提取，用于封面提示词、摘要和标签
+"""
+
+import os
+import re
+import json
+import math
+import time
+import atexit
+import heapq
+import threading
+
+
+DF_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keyword_df.json")
+
+# 词表过大时剪掉只出现过一次的词
+MAX_VOCABULARY = 200000
+
+# 写盘节流：累计这么多篇新文章，或距上次写盘超过这么多秒时才重写 JSON（进程退出时再写一次）
+SAVE_EVERY_DOCS = 20
+SAVE_INTERVAL = 60
+
+CJK_RUN_PATTERN = re.compile(r'[一-龥]+')
+
+STOP_WORDS = {'的', '了', '是', '在', '我', '你', '他', '她', '它', '我们', '他们', '这', '那', '有', '没有', '会', '能', '可以', '但是', '因为', '所以', '如果', '虽然', '然后', '还是', '或者', '和', '与', '及'}
+
+# n-gram 以这些字开头或结尾时多半不是完整的词
+BOUNDARY_CHARS = set('的了是在和与及也都就还又很把被让给着过吗呢吧啊呀么这那个一不')
+
+
+def iter_ngrams(text, min_n=2, max_n=4):
+    """按中文连续片段生成重叠的 n-gram"""
+    for run in CJK_RUN_PATTERN.findall(text):
+        length = len(run)
+        for i in range(length):
+            for n in range(min_n, max_n + 1):
+                if i + n > length:
+                    break
+                gram = run[i:i + n]
+                if gram in STOP_WORDS or gram[0] in BOUNDARY_CHARS or gram[-1] in BOUNDARY_CHARS:
+                    continue
+                yield gram
+
+
+def count_ngrams(text, min_n=2, max_n=4):
+    """统计重叠 n-gram 词频"""
+    counts = {}
+    for gram in iter_ngrams(text, min_n, max_n):
+        counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class DocumentFrequency:
+    """语料文档频率表（JSON 持久化，文章保存时增量更新，写盘按篇数和时间节流）"""
+
+    def __init__(self, path=DF_FILE):
+        self.path = path
+        self.docs = 0
+        self.df = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        # 未写盘的文章数、上次写盘时间；写盘在锁外进行，_save_lock 保证按快照顺序写
+        self._dirty = 0
+        self._last_save = time.time()
+        self._version = 0
+        self._saved_version = 0
+        self._save_lock = threading.Lock()
+        # 重建时已计入的文章 ID：刚保存的文章随后调用 add_document 时不再重复计入
+        self._rebuilt_ids = set()
+
+    def _ensure_loaded(self):
+        """首次使用时加载；文件不存在或损坏时从文章存储中的已有文章重建（调用方需持有锁）"""
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.docs = data.get("docs", 0)
+            self.df = data.get("df", {})
+        except (OSError, ValueError):
+            self._rebuild()
+            if self.docs:
+                self._write(self._snapshot())
+
+    def _rebuild(self):
+        """从文章存储（见 article_store.py）逐篇读取已有文章计入语料"""
+        try:
+            from article_store import get_article_store
+            store = get_article_store()
+            for article_id in store.iter_ids():
+                content = store.read(f"{article_id}.md")
+                if content:
+                    self._add(content)
+                    self._rebuilt_ids.add(article_id)
+        except Exception as e:
+            print(f"[Keywords] ⚠ 从文章存储重建文档频率失败: {e}")
+            return
+        print(f"[Keywords] ✓ 已从文章存储重建文档频率（{self.docs} 篇）")
+
+    def _add(self, text, counts=None):
+        self.docs += 1
+        for gram in (counts if counts is not None else count_ngrams(text)):
+            self.df[gram] = self.df.get(gram, 0) + 1
+
+    def _snapshot(self):
+        """待写盘的快照（调用方需持有锁；只复制字典，序列化和写文件在锁外）"""
+        if len(self.df) > MAX_VOCABULARY:
+            self.df = {gram: n for gram, n in self.df.items() if n > 1}
+        self._dirty = 0
+        self._last_save = time.time()
+        self._version += 1
+        return self._version, {"docs": self.docs, "df": dict(self.df)}
+
+    def _write(self, snapshot):
+        version, data = snapshot
+        with self._save_lock:
+            # 并发写盘时较旧的快照不覆盖较新的
+            if version <= self._saved_version:
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._saved_version = version
+
+    def add_document(self, text, counts=None, article_id=None):
+        """
+        把一篇文章计入语料（内存中立即生效；累计 SAVE_EVERY_DOCS 篇或超过 SAVE_INTERVAL 秒才写盘）
+
+        Args:
+            text: 文章内容
+            counts: 预先统计好的 n-gram 词频（如在进程池中算好），默认现算
+            article_id: 文章存储中的 ID；首次使用时从文章存储重建、已经计入过该文章时跳过
+        """
+        snapshot = None
+        with self._lock:
+            self._ensure_loaded()
+            if article_id in self._rebuilt_ids:
+                self._rebuilt_ids.discard(article_id)
+                return
+            self._add(text, counts)
+            self._dirty += 1
+            if self._dirty >= SAVE_EVERY_DOCS or time.time() - self._last_save >= SAVE_INTERVAL:
+                snapshot = self._snapshot()
+        if snapshot is not None:
+            self._write(snapshot)
+
+    def flush(self):
+        """把未写盘的更新写入文件（进程退出时自动调用）"""
+        with self._lock:
+            snapshot = self._snapshot() if self._dirty else None
+        if snapshot is not None:
+            self._write(snapshot)
+
+    def idf(self, gram):
+        """平滑 IDF：log((N + 1) / (df + 1)) + 1"""
+        with self._lock:
+            self._ensure_loaded()
+            return math.log((self.docs + 1) / (self.df.get(gram, 0) + 1)) + 1
+
+    def idf_map(self, grams):
+        """批量取 IDF（只加一次锁）"""
+        with self._lock:
+            self._ensure_loaded()
+            n = self.docs + 1
+            return {gram: math.log(n / (self.df.get(gram, 0) + 1)) + 1 for gram in grams}
+
+
+_df = None
+_df_lock = threading.Lock()
+
+
+def get_document_frequency():
+    """获取进程内共享的文档频率表"""
+    global _df
+    with _df_lock:
+        if _df is None:
+            _df = DocumentFrequency()
+            atexit.register(_df.flush)
+        return _df
+
+
+def record_article(text, filename=None):
+    """
+    文章保存后调用，增量更新文档频率
+
+    Args:
+        text: 文章正文
+        filename: 文章存储返回的文件名（首次使用时从文章存储重建的语料已包含该文章，据此避免重复计入）
+    """
+    try:
+        from article_store import article_id_from_filename
+        # 单篇只需几毫秒，在当前线程统计（比提交到进程池的序列化和进程间通信开销小）；
+        # 在锁外统计，持锁期间只做合并和写盘
+        counts = count_ngrams(text)
+        get_document_frequency().add_document(text, counts, article_id_from_filename(filename or ""))
+    except Exception as e:
+        print(f"[Keywords] ⚠ 更新文档频率失败: {e}")
+
+
+def extract_keywords(text, top_k=10, counts=None):
+    """
+    TF-IDF 关键词提取
+
+    Args:
+        text: 文章内容
+        top_k: 返回的关键词数
+        counts: 预先统计好的 n-gram 词频，默认现算
+
+    Returns:
+        list: 按得分从高到低的关键词
+    """
+    if counts is None:
+        counts = count_ngrams(text)
+    if not counts:
+        return []
+
+    idf = get_document_frequency().idf_map(counts)
+    # 长词略加权，避免 "原生家" 之类的碎片排在 "原生家庭" 前面
+    scored = ((tf * idf[gram] * (1 + 0.1 * len(gram)), gram) for gram, tf in counts.items() if tf > 1 or len(counts) < 50)
+    candidates = heapq.nlargest(top_k * 4, scored)
+
+    keywords = []
+    for _, gram in candidates:
+        # 跳过与已选词互相包含的 n-gram
+        if any(gram in chosen or chosen in gram for chosen in keywords):
+            continue
+        keywords.append(gram)
+        if len(keywords) >= top_k:
+            break
+    return keywords
+
+
+def extract_keywords_many(texts, top_k=10):
+    """
+    批量提取关键词：n-gram 统计在共享进程池中多核并行，IDF 打分在本进程完成
+
+    Returns:
+        list: 与 texts 顺序对应的关键词列表
+    """
+    from process_pool import map_cpu
+    texts = list(texts)
+    all_counts = map_cpu(count_ngrams, texts)
+    return [extract_keywords(text, top_k, counts) for text, counts in zip(texts, all_counts)]
@@ -7,8 +7,6 @@ import os
 from dotenv import load_dotenv
 from gemini_worker import GeminiAgent
 from wechat_uploader import WeChatUploader
-from datetime import datetime
-import json
 
 # 加载环境变量
 load_dotenv()
@@ -25,7 +23,8 @@ class AutoArticleSystem:
         print()
 
         # 从环境变量获取配置
-        self.gemini_api_key = os.getenv("GEMINI_API_KEY", "")
+        from key_pool import load_keys
+        self.gemini_api_key = (load_keys("gemini") or [""])[0]  # 多个 Key 时由 Key 池轮换
         self.wechat_app_id = os.getenv("WECHAT_APP_ID", "")
         self.wechat_app_secret = os.getenv("WECHAT_APP_SECRET", "")
 
@@ -45,11 +44,8 @@ class AutoArticleSystem:
         # 初始化 Gemini
         if self.gemini_api_key:
             try:
-                self.gemini = GeminiAgent(
-                    api_key=self.gemini_api_key,
-                    thinking_model="gemini-2.0-flash-thinking-exp",
-                    pro_model="gemini-1.5-pro"
-                )
+                # 模型按步骤从模型注册表选择（见 model_registry.py）
+                self.gemini = GeminiAgent(api_key=self.gemini_api_key)
             except Exception as e:
                 print(f"[System] ✗ Gemini 初始化失败: {e}")
         else:
@@ -86,6 +82,8 @@ class AutoArticleSystem:
 
         # 步骤1：选题
         topic_result = self.gemini.research_topic(domain=self.domain)
+        if not topic_result:
+            return None
         title = topic_result['title']
         outline = topic_result['outline']
 
@@ -103,9 +101,14 @@ class AutoArticleSystem:
         print("=" * 60)
         print()
 
-        # 步骤3：优化循环
+        # 步骤3：优化循环（每一版草稿和评分都以差量形式保存，见 article_store.py）
+        from article_store import DraftLog
+        from tracing import new_job_id
+        article_id = f"article_{new_job_id()}"
+        drafts = DraftLog(article_id)
         best_article = article
-        best_score = 100
+        # 还没有拿到有效评分时为 None（首次评分就失败时按未评分保存，不能把初始值当作评分）
+        best_score = None
         history = []
 
         for i in range(1, self.max_iterations + 1):
@@ -113,14 +116,20 @@ class AutoArticleSystem:
 
             # 检测 AI 率
             score = self.gemini.evaluate_ai_score(article)
+            if score is None:
+                # 评分失败时不再继续重写，保留已评过分的最佳版本
+                print("-> ✗ 评分失败，停止优化")
+                article = best_article
+                break
             history.append({
                 "iteration": i,
                 "score": score,
                 "length": len(article)
             })
+            drafts.add(article, score)
 
             # 记录最佳版本
-            if score < best_score:
+            if best_score is None or score < best_score:
                 best_score = score
                 best_article = article
 
@@ -142,9 +151,10 @@ class AutoArticleSystem:
             print()
 
         return {
+            "article_id": article_id,
             "title": title,
             "content": article,
-            "ai_score": best_score,
+            "ai_score": best_score,  # 未评分时为 None
             "iterations": len(history),
             "history": history
         }
@@ -170,7 +180,14 @@ class AutoArticleSystem:
         print("=" * 60)
 
         # 将内容转换为 HTML（如果需要）
-        html_content = self.wechat.markdown_to_html(content)
+        try:
+            html_content = self.wechat.markdown_to_html(content)
+        except Exception as e:
+            print(f"[System] ✗ Markdown 转换失败，取消上传: {e}")
+            return False
+
+        # 上传正文中的本地图片，替换为微信地址
+        html_content = self.wechat.upload_content_images(html_content)
 
         # 上传
         success = self.wechat.upload_draft(
@@ -185,33 +202,53 @@ class AutoArticleSystem:
 
     def save_to_file(self, article_data: dict):
         """
-        将文章保存到本地文件
+        将文章保存到文章存储（见 article_store.py，详细数据压缩后一并保存）
 
         Args:
             article_data: 文章数据
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"article_{timestamp}.md"
+        from article_store import get_article_store
+        from tracing import new_job_id
 
-        try:
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(f"# {article_data['title']}\n\n")
-                f.write(f"AI评分：{article_data['ai_score']}%\n")
-                f.write(f"迭代次数：{article_data['iterations']}\n\n")
-                f.write("---\n\n")
-                f.write(article_data['content'])
-
-            print(f"[System] ✓ 文章已保存到本地: {filename}")
+        # 与优化循环保存的草稿使用同一个 ID
+        article_id = article_data.get('article_id') or f"article_{new_job_id()}"
 
-            # 同时保存 JSON 格式的详细数据
-            json_filename = f"article_{timestamp}_data.json"
-            with open(json_filename, 'w', encoding='utf-8') as f:
-                json.dump(article_data, f, ensure_ascii=False, indent=2)
-
-            print(f"[System] ✓ 详细数据已保存: {json_filename}")
+        try:
+            score = article_data['ai_score']
+            content = (
+                f"# {article_data['title']}\n\n"
+                f"AI评分：{'未评分' if score is None else f'{score}%'}\n"
+                f"迭代次数：{article_data['iterations']}\n\n"
+                "---\n\n"
+                f"{article_data['content']}"
+            )
+            filename = get_article_store().save(
+                article_id, content, title=article_data['title'], provider="Gemini (main.py)",
+                ai_score=article_data['ai_score'], data=article_data
+            )
+
+            print(f"[System] ✓ 文章已保存: {filename}（导出为文件：python article_store.py export <目录>）")
+
+            # 计入语料文档频率（TF-IDF 关键词提取用）
+            from keyword_extractor import record_article
+            record_article(article_data['content'], filename)
 
         except Exception as e:
-            print(f"[System] ✗ 保存文件失败: {e}")
+            print(f"[System] ✗ 保存文章失败: {e}")
+
+    def print_cost_report(self):
+        """输出各步骤的估算用量和费用（模型按路由策略选择，见 model_router.py）"""
+        from token_budget import cost_report
+        summary = self.gemini.budget.summary()
+        if not summary["by_step"]:
+            return
+        print("各步骤费用（估算）：")
+        for line in cost_report(summary):
+            print(f"  {line}")
+        cache = self.gemini.cache_stats.summary()
+        if cache["prompt_tokens"]:
+            print(f"  提示词缓存命中：{cache['cached_tokens']}/{cache['prompt_tokens']} 输入 token（{cache['hit_rate']:.0%}）")
+        print()
 
     def run(self, auto_upload: bool = False):
         """
@@ -237,13 +274,15 @@ class AutoArticleSystem:
         print("=" * 60)
         print(f"标题：{article_data['title']}")
         print(f"字数：{len(article_data['content'])} 字")
-        print(f"AI评分：{article_data['ai_score']}%")
+        score = article_data['ai_score']
+        print(f"AI评分：{'未评分' if score is None else f'{score}%'}")
         print(f"迭代次数：{article_data['iterations']}")
         print()
         print("优化历史：")
         for h in article_data['history']:
             print(f"  第{h['iteration']}次: AI率={h['score']}%, 字数={h['length']}")
         print()
+        self.print_cost_report()
 
         # 自动上传
         if auto_upload:
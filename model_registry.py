@@ -0,0 +1,286 @@
+"""
+模型注册表
+功能：后台定期调用 list_models 并对候选模型做极小的探测调用，把可用性、探测延迟、错误率和配额冷却缓存到磁盘；
+      实际调用的耗时和错误也会计入（各服务商的模型都记录），按步骤选择模型时由 model_router.py 读取这些测量值，
+      启动时不再逐个试探（取代 list_models.py / auto_test.py / check_quota.py 的手工探测）
+
+环境变量：
+    MODEL_REGISTRY_FILE       缓存文件（默认 model_registry.json）
+    MODEL_REGISTRY_INTERVAL   后台刷新间隔（秒，默认 3600）
+    MODEL_REGISTRY_REFRESH    是否启动后台刷新（默认 true；压测和离线环境设为 false）
+
+用法：
+    python model_registry.py            # 查看缓存
+    python model_registry.py --refresh  # 立即刷新并探测
+"""
+
+import os
+import json
+import time
+import threading
+
+
+DEFAULT_REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_registry.json")
+
+PROBE_PROMPT = "Say OK"
+
+# 指数滑动平均系数
+EWMA_ALPHA = 0.3
+# 错误率超过该值（且至少有 2 次记录）视为不健康
+MAX_ERROR_RATE = 0.5
+# 429（配额用尽）后的冷却时间（秒）
+QUOTA_COOLDOWN = 15 * 60
+# 实际调用结果写盘的最小间隔（秒）
+SAVE_INTERVAL = 30
+
+
+def _ewma(old, value):
+    return value if old is None else old + EWMA_ALPHA * (value - old)
+
+
+class ModelRegistry:
+    """模型可用性和延迟缓存（线程安全）"""
+
+    def __init__(self, path=DEFAULT_REGISTRY_FILE, interval=3600):
+        """
+        Args:
+            path: 缓存文件路径
+            interval: 刷新间隔（秒）
+        """
+        self.path = path
+        self.interval = interval
+        self.models = {}
+        self.refreshed_at = 0
+        self._lock = threading.Lock()
+        self._saved_at = 0
+        self._thread = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.models = data.get("models", {})
+            self.refreshed_at = data.get("refreshed_at", 0)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"[Models] ⚠ 读取模型注册表失败: {e}")
+
+    def save(self):
+        """原子写入缓存文件"""
+        with self._lock:
+            data = {"refreshed_at": self.refreshed_at,
+                    "models": {name: dict(entry) for name, entry in self.models.items()}}
+            self._saved_at = time.time()
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"[Models] ⚠ 保存模型注册表失败: {e}")
+
+    def _entry(self, model):
+        entry = self.models.get(model)
+        if entry is None:
+            entry = self.models[model] = {
+                "available": None, "probe_latency_ms": None, "call_latency_ms": None,
+                "error_rate": None, "calls": 0, "errors": 0, "last_error": None,
+                "cooldown_until": 0, "last_checked": 0
+            }
+        return entry
+
+    def record(self, model, latency=None, error=None, probe=False):
+        """
+        记录一次调用结果（探测或实际调用）
+
+        Args:
+            model: 模型名称
+            latency: 耗时（秒），失败时可为 None
+            error: 异常或错误信息，成功为 None
+            probe: 是否为探测调用（只有探测延迟参与排序，实际调用的耗时受输出长度影响）
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entry(model)
+            entry["calls"] += 1
+            entry["last_checked"] = now
+            entry["error_rate"] = _ewma(entry["error_rate"], 1.0 if error else 0.0)
+            if error:
+                message = str(error)
+                entry["errors"] += 1
+                entry["last_error"] = message[:200]
+                if "429" in message or "quota" in message.lower() or "ResourceExhausted" in type(error).__name__:
+                    entry["cooldown_until"] = now + QUOTA_COOLDOWN
+                elif "404" in message or "NotFound" in type(error).__name__:
+                    entry["available"] = False
+            else:
+                entry["available"] = True
+                key = "probe_latency_ms" if probe else "call_latency_ms"
+                if latency is not None:
+                    entry[key] = round(_ewma(entry[key], latency * 1000), 1)
+            due = not probe and now - self._saved_at > SAVE_INTERVAL
+            if due:
+                self._saved_at = now
+        if due:
+            # 实际调用多在事件循环上记录，写盘交给 IO 线程池，不阻塞事件循环
+            from pipeline_executor import get_executor
+            get_executor().submit_blocking(self.save, pool="io")
+
+    def is_healthy(self, model):
+        """可用、不在配额冷却期、错误率不高（没有记录的模型视为健康）"""
+        entry = self.models.get(model)
+        if entry is None:
+            return True
+        if entry["available"] is False or entry["cooldown_until"] > time.time():
+            return False
+        return not (entry["calls"] >= 2 and (entry["error_rate"] or 0) > MAX_ERROR_RATE)
+
+    def get(self, model):
+        """模型的测量记录（副本，没有记录时为 None）"""
+        with self._lock:
+            entry = self.models.get(model)
+            return dict(entry) if entry else None
+
+    def refresh(self, probe=True):
+        """
+        刷新：list_models 更新可用性（不消耗配额），再对候选模型各做一次最小探测
+
+        Returns:
+            dict: {"success": bool, "listed": int, "probed": int, "error": str}
+        """
+        try:
+            import google.generativeai as genai
+            from dotenv import load_dotenv
+            load_dotenv()
+            from key_pool import get_key_pool, bind_gemini_key
+            from model_router import MODEL_CATALOG
+            pool = get_key_pool("gemini")
+            if not pool.size:
+                return {"success": False, "error": "GEMINI_API_KEY not found"}
+            # list_models 不消耗配额，用全局客户端（与写稿流程启动时配置的 Key 相同）
+            genai.configure(api_key=pool.keys[0])
+
+            candidates = list(MODEL_CATALOG["gemini"])
+            listed = {m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods}
+            with self._lock:
+                for model in candidates:
+                    self._entry(model)["available"] = model in listed
+
+            probed = 0
+            if probe:
+                for model in candidates:
+                    if model not in listed:
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        # 探测调用走 Key 池：计入各 Key 的调用数，限流时该 Key 冷却并换下一个
+                        pool.call(lambda key, name=model: bind_gemini_key(genai.GenerativeModel(name), key).generate_content(
+                            PROBE_PROMPT, generation_config={"max_output_tokens": 4, "temperature": 0}))
+                        self.record(model, time.perf_counter() - started, probe=True)
+                    except Exception as e:
+                        self.record(model, error=e, probe=True)
+                    probed += 1
+
+            with self._lock:
+                self.refreshed_at = time.time()
+            self.save()
+            print(f"[Models] ✓ 模型注册表已刷新: {len(listed)} 个可用模型，探测 {probed} 个")
+            return {"success": True, "listed": len(listed), "probed": probed}
+        except Exception as e:
+            print(f"[Models] ✗ 刷新模型注册表失败: {e}")
+            return {"success": False, "error": str(e)}
+
+    def start_background_refresh(self):
+        """启动后台刷新线程（缓存未过期时等到期再刷新）"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._refresh_loop, name="model-registry", daemon=True)
+        self._thread.start()
+
+    def _refresh_loop(self):
+        while True:
+            wait = self.refreshed_at + self.interval - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            result = self.refresh()
+            if not result["success"]:
+                # 失败后不立即重试，避免在离线环境里空转
+                with self._lock:
+                    self.refreshed_at = time.time()
+
+    def snapshot(self):
+        """当前缓存（用于展示）"""
+        with self._lock:
+            models = {name: dict(entry) for name, entry in self.models.items()}
+        return {
+            "refreshed_at": self.refreshed_at,
+            "models": models
+        }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry():
+    """获取进程内共享的模型注册表（首次使用时从磁盘加载，并按配置启动后台刷新）"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry(
+                path=os.getenv("MODEL_REGISTRY_FILE") or DEFAULT_REGISTRY_FILE,
+                interval=float(os.getenv("MODEL_REGISTRY_INTERVAL", "3600") or 3600)
+            )
+            if os.getenv("MODEL_REGISTRY_REFRESH", "true").lower() == "true":
+                _registry.start_background_refresh()
+        return _registry
+
+
+def record_call(model, latency=None, error=None):
+    """记录一次实际调用结果的便捷函数"""
+    get_model_registry().record(model, latency, error)
+
+
+def print_registry(registry):
+    """打印模型状态表"""
+    print("=" * 78)
+    refreshed = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(registry.refreshed_at)) if registry.refreshed_at else "never"
+    print(f"Model registry ({registry.path}), refreshed: {refreshed}")
+    print("=" * 78)
+    print(f"{'model':40s} {'state':10s} {'probe ms':>9s} {'call ms':>9s} {'err rate':>9s}")
+    now = time.time()
+    for name, entry in sorted(registry.models.items()):
+        if entry["cooldown_until"] > now:
+            state = "QUOTA"
+        elif entry["available"] is False:
+            state = "NOT FOUND"
+        elif registry.is_healthy(name):
+            state = "OK"
+        else:
+            state = "ERRORS"
+        probe = entry["probe_latency_ms"]
+        call = entry["call_latency_ms"]
+        error_rate = entry["error_rate"]
+        print(f"{name:40s} {state:10s} {probe if probe is not None else '-':>9} "
+              f"{call if call is not None else '-':>9} "
+              f"{f'{error_rate:.2f}' if error_rate is not None else '-':>9}")
+        if state != "OK" and entry["last_error"]:
+            print(f"    last error: {entry['last_error'][:70]}")
+    print("=" * 78)
+    print("各步骤选中的模型见 python model_router.py")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gemini 模型注册表")
+    parser.add_argument("--refresh", action="store_true", help="立即刷新（list_models + 探测调用）")
+    parser.add_argument("--no-probe", action="store_true", help="刷新时只调用 list_models，不做探测调用")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(path=os.getenv("MODEL_REGISTRY_FILE") or DEFAULT_REGISTRY_FILE)
+    if args.refresh:
+        registry.refresh(probe=not args.no_probe)
+    print_registry(registry)
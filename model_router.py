@@ -0,0 +1,223 @@
+"""
+模型路由
+功能：按流程配置的路由策略为每个步骤（选题 topic / 写作 write / 评分 evaluate / 重写 rewrite）选择模型，
+      目标可选 quality（质量优先）、latency（延迟优先）、cost（费用优先）；
+      延迟取模型注册表的实测值（见 model_registry.py），费用按模型单价和该步骤的典型 token 用量估算（见 token_budget.py），
+      不健康（不可用、配额冷却、错误率高）的模型不参与选择。默认只让贵的模型写作，评分用便宜的快速模型
+
+路由策略写在 prompts_config.json 对应流程的 routing 中（未配置的步骤用 DEFAULT_ROUTING）：
+    "zhipu": {"routing": {"topic": "quality", "write": "quality", "evaluate": "cost", "rewrite": "quality"}}
+也可以限定候选模型：
+    "zhipu": {"routing": {"rewrite": {"goal": "cost", "models": ["glm-4.5-air", "glm-4.7"]}}}
+
+用法：
+    python model_router.py              # 查看各流程各步骤选中的模型
+    python model_router.py zhipu        # 只看一个流程
+"""
+
+import math
+
+
+ROUTING_GOALS = ("quality", "latency", "cost")
+
+ROUTED_STEPS = ("topic", "write", "evaluate", "rewrite")
+
+DEFAULT_ROUTING = {
+    "topic": "quality",
+    "write": "quality",
+    "evaluate": "cost",
+    "rewrite": "quality",
+}
+
+# 各服务商可路由的模型：quality 为质量档位（越大越好），thinking 为默认带思考过程
+# （思考模型在输出答案前会先消耗大量 token，评分步骤不使用，见 scoring.py）
+MODEL_CATALOG = {
+    "gemini": {
+        "models/gemini-3-pro-preview": {"quality": 5, "thinking": True},
+        "models/gemini-2.5-pro": {"quality": 4, "thinking": True},
+        "models/gemini-2.5-flash": {"quality": 3, "thinking": True},
+        "models/gemini-2.5-flash-lite": {"quality": 2, "thinking": False},
+        "models/gemini-2.0-flash-001": {"quality": 2, "thinking": False},
+        "models/gemini-2.0-flash-lite-001": {"quality": 1, "thinking": False},
+    },
+    "zhipu": {
+        "glm-4.7": {"quality": 4, "thinking": True},
+        "glm-4.5-air": {"quality": 3, "thinking": True},
+        "glm-4-flash": {"quality": 1, "thinking": False},
+    },
+    "deepseek": {
+        "deepseek-chat": {"quality": 3, "thinking": False},
+    },
+}
+
+# 不使用思考模型的步骤
+NON_THINKING_STEPS = {"evaluate"}
+
+# 各步骤一次调用的典型 token 用量（输入, 输出），用于按费用排序
+STEP_TOKENS = {
+    "topic": (300, 400),
+    "write": (300, 2500),
+    "evaluate": (1700, 8),
+    "rewrite": (3300, 3000),
+}
+
+
+def load_routing(pipeline):
+    """
+    读取流程的路由策略（默认值 + prompts_config.json 中的 routing）
+
+    Returns:
+        dict: {步骤: {"goal": str, "models": list 或 None}}
+    """
+    from token_budget import _pipeline_config
+    configured = _pipeline_config(pipeline).get("routing", {}) if pipeline else {}
+    routing = {}
+    for step in ROUTED_STEPS:
+        rule = configured.get(step, DEFAULT_ROUTING[step])
+        if isinstance(rule, str):
+            rule = {"goal": rule}
+        goal = rule.get("goal", DEFAULT_ROUTING[step])
+        if goal not in ROUTING_GOALS:
+            print(f"[Router] ⚠ {pipeline} 的 {step} 路由目标无效: {goal}，使用 {DEFAULT_ROUTING[step]}")
+            goal = DEFAULT_ROUTING[step]
+        routing[step] = {"goal": goal, "models": rule.get("models")}
+    return routing
+
+
+def expected_cost(model, step, provider=None):
+    """按步骤的典型用量估算一次调用的费用（美元）"""
+    from token_budget import estimate_cost
+    input_tokens, output_tokens = STEP_TOKENS.get(step, STEP_TOKENS["write"])
+    return estimate_cost(provider, input_tokens, output_tokens, model)
+
+
+def _latency_ms(entry):
+    """注册表中的实测延迟：优先探测延迟（不受输出长度影响），其次实际调用耗时"""
+    if not entry:
+        return None
+    probe = entry.get("probe_latency_ms")
+    return probe if probe is not None else entry.get("call_latency_ms")
+
+
+def candidates(provider, step, models=None):
+    """
+    步骤可用的候选模型
+
+    Args:
+        provider: gemini / zhipu / deepseek
+        step: topic / write / evaluate / rewrite
+        models: 路由策略限定的模型列表
+
+    Returns:
+        list: 模型名称（按目录顺序）
+    """
+    catalog = MODEL_CATALOG.get(provider, {})
+    names = [m for m in (models or catalog) if m in catalog] or list(catalog)
+    if step in NON_THINKING_STEPS:
+        names = [m for m in names if not catalog[m]["thinking"]] or names
+    return names
+
+
+def rank(provider, step, goal, models=None):
+    """
+    按目标给候选模型排序（健康的在前）
+
+    quality：质量档位高的优先，同档延迟低的优先；
+    latency：实测延迟低的优先，没有测量数据的排在后面（按质量档位从低到高，小模型通常更快）；
+    cost：按典型用量估算的单次费用低的优先，同价延迟低的优先
+
+    Returns:
+        list: [{"model", "healthy", "quality", "latency_ms", "cost_usd"}]
+    """
+    from model_registry import get_model_registry
+    registry = get_model_registry()
+    catalog = MODEL_CATALOG.get(provider, {})
+
+    rows = []
+    for model in candidates(provider, step, models):
+        latency = _latency_ms(registry.get(model))
+        rows.append({
+            "model": model,
+            "healthy": registry.is_healthy(model),
+            "quality": catalog[model]["quality"],
+            "latency_ms": latency,
+            "cost_usd": round(expected_cost(model, step, provider), 6),
+        })
+
+    def latency_key(row):
+        return row["latency_ms"] if row["latency_ms"] is not None else math.inf
+
+    if goal == "latency":
+        key = lambda row: (latency_key(row), row["quality"])
+    elif goal == "cost":
+        key = lambda row: (row["cost_usd"], latency_key(row), -row["quality"])
+    else:
+        key = lambda row: (-row["quality"], latency_key(row), row["cost_usd"])
+    return sorted(rows, key=lambda row: (not row["healthy"],) + key(row))
+
+
+def route(pipeline, provider, step, preferred=None, routing=None):
+    """
+    选择步骤使用的模型
+
+    Args:
+        pipeline: 流程（决定读取哪份路由策略）
+        provider: gemini / zhipu / deepseek
+        step: topic / write / evaluate / rewrite
+        preferred: 调用方指定的模型（健康时直接使用）
+        routing: 已读取的路由策略（load_routing 的结果）；每次调用都要选模型的调用方应在开始时读取一次传入，
+                 避免每次调用都重新读取解析 prompts_config.json
+
+    Returns:
+        str: 模型名称（服务商没有可路由的模型时为 None）
+    """
+    if preferred:
+        from model_registry import get_model_registry
+        if get_model_registry().is_healthy(preferred):
+            return preferred
+    rule = (routing or load_routing(pipeline))[step]
+    ranked = rank(provider, step, rule["goal"], rule["models"])
+    return ranked[0]["model"] if ranked else preferred
+
+
+def routing_table(pipeline, providers):
+    """
+    流程各步骤的路由结果（用于展示）
+
+    Args:
+        pipeline: 流程
+        providers: {步骤: 服务商}，如 token_budget.PIPELINE_STEPS[pipeline]
+
+    Returns:
+        list: [{"step", "provider", "goal", "model", "ranking"}]
+    """
+    routing = load_routing(pipeline)
+    table = []
+    for step in ROUTED_STEPS:
+        provider = providers.get(step)
+        if provider not in MODEL_CATALOG:
+            continue
+        ranked = rank(provider, step, routing[step]["goal"], routing[step]["models"])
+        table.append({
+            "step": step, "provider": provider, "goal": routing[step]["goal"],
+            "model": ranked[0]["model"] if ranked else None, "ranking": ranked
+        })
+    return table
+
+
+if __name__ == "__main__":
+    import sys
+    from token_budget import PIPELINE_STEPS
+
+    pipelines = sys.argv[1:] or list(PIPELINE_STEPS)
+    for name in pipelines:
+        print("=" * 78)
+        print(f"Pipeline: {name}")
+        print("=" * 78)
+        for row in routing_table(name, PIPELINE_STEPS.get(name, {})):
+            print(f"{row['step']:10s} {row['goal']:8s} -> {row['model']}")
+            for candidate in row["ranking"]:
+                latency = candidate["latency_ms"]
+                print(f"    {candidate['model']:36s} q{candidate['quality']} "
+                      f"{latency if latency is not None else '-':>8} ms  ${candidate['cost_usd']:.6f}"
+                      f"{'' if candidate['healthy'] else '  (unhealthy)'}")
@@ -0,0 +1,158 @@
+"""
+异步流水线执行器
+功能：进程内共享一个 asyncio 事件循环（后台线程），写稿任务以协程运行；HTTP 调用走共享的异步连接池，
+      阻塞的 SDK 调用和本地重活放进有界线程池，按服务商限制并发，使单进程可同时推进几十个任务
+
+环境变量：
+    PIPELINE_MAX_JOBS          同时运行的任务数上限（默认 32，超出的任务排队）
+    PIPELINE_SDK_WORKERS       阻塞 SDK 调用线程池大小（默认 8）
+    PIPELINE_IO_WORKERS        封面生成、文件读写等本地任务线程池大小（默认 4）
+    PROVIDER_MAX_CONCURRENCY   每个服务商每个 API Key 同时在途的请求数上限（默认 8，配置多个 Key 时按 Key 数放大）
+"""
+
+import os
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+class PipelineExecutor:
+    """共享事件循环 + 有界线程池"""
+
+    def __init__(self, max_jobs=None, sdk_workers=None, io_workers=None, provider_limit=None):
+        """
+        初始化执行器（事件循环在首次使用时启动）
+
+        Args:
+            max_jobs: 同时运行的任务数上限
+            sdk_workers: 阻塞 SDK 调用线程池大小
+            io_workers: 本地任务线程池大小
+            provider_limit: 每个服务商的并发上限
+        """
+        self.max_jobs = max_jobs or _env_int("PIPELINE_MAX_JOBS", 32)
+        self.provider_limit = provider_limit or _env_int("PROVIDER_MAX_CONCURRENCY", 8)
+        self._pools = {
+            "sdk": ThreadPoolExecutor(max_workers=sdk_workers or _env_int("PIPELINE_SDK_WORKERS", 8),
+                                      thread_name_prefix="pipeline-sdk"),
+            "io": ThreadPoolExecutor(max_workers=io_workers or _env_int("PIPELINE_IO_WORKERS", 4),
+                                     thread_name_prefix="pipeline-io"),
+        }
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._job_slots = None
+        self._limits = {}
+        self._capacity = {}
+        self._http = None
+        self.active_jobs = 0
+        self.queued_jobs = 0
+
+    @property
+    def loop(self):
+        """事件循环（首次访问时在后台线程启动）"""
+        with self._start_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="pipeline-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coro):
+        """
+        从任意线程把协程提交到事件循环
+
+        Returns:
+            concurrent.futures.Future：可 result() 等待或 cancel() 取消
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """提交协程并阻塞等待结果（供 Flask 路由等同步代码使用）"""
+        return self.submit(coro).result(timeout)
+
+    async def run_blocking(self, fn, *args, pool="sdk", **kwargs):
+        """
+        在有界线程池中执行阻塞函数（保留当前上下文，使追踪 span 归入当前任务）
+
+        Args:
+            fn: 阻塞函数
+            pool: "sdk"（服务商 SDK）或 "io"（封面生成、文件读写等）
+        """
+        context = contextvars.copy_context()
+        call = functools.partial(context.run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._pools[pool], call)
+
+    def submit_blocking(self, fn, *args, pool="io"):
+        """
+        把阻塞函数提交到线程池后立即返回（可在事件循环内调用，不等待结果）
+
+        Returns:
+            concurrent.futures.Future
+        """
+        return self._pools[pool].submit(fn, *args)
+
+    def limit(self, provider):
+        """服务商并发信号量（async with executor.limit("deepseek"): ...），容量为每 Key 上限 × Key 数"""
+        semaphore = self._limits.get(provider)
+        if semaphore is None:
+            from key_pool import key_count
+            self._capacity[provider] = self.provider_limit * key_count(provider)
+            semaphore = self._limits[provider] = asyncio.Semaphore(self._capacity[provider])
+        return semaphore
+
+    def http(self):
+        """共享的异步 HTTP 客户端（连接复用，只能在事件循环内使用）"""
+        if self._http is None:
+            import httpx
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(120, connect=10),
+                limits=httpx.Limits(max_connections=self.provider_limit * 8, max_keepalive_connections=32)
+            )
+        return self._http
+
+    async def job_slot(self):
+        """获取任务名额（超出 max_jobs 时排队），返回后须调用 release_job_slot"""
+        if self._job_slots is None:
+            self._job_slots = asyncio.Semaphore(self.max_jobs)
+        self.queued_jobs += 1
+        try:
+            await self._job_slots.acquire()
+        finally:
+            self.queued_jobs -= 1
+        self.active_jobs += 1
+
+    def release_job_slot(self):
+        self.active_jobs -= 1
+        self._job_slots.release()
+
+    def stats(self):
+        """运行概况"""
+        return {
+            "active_jobs": self.active_jobs,
+            "queued_jobs": self.queued_jobs,
+            "max_jobs": self.max_jobs,
+            "provider_limit": self.provider_limit,
+            "in_flight": {name: self._capacity[name] - s._value for name, s in self._limits.items()}
+        }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """获取进程内共享的执行器"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = PipelineExecutor()
+        return _executor
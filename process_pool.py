@@ -0,0 +1,152 @@
+"""
+进程池模块
+功能：封面渲染、Markdown 转 HTML、n-gram 统计、历史文章头解析等 CPU 密集任务放进进程内共享的进程池，
+      不再在 Flask 请求线程或任务线程里占着 GIL 拖慢状态轮询；批量任务可跑满多核；
+      CPU 采样（见 profiler.py）运行期间任务在子进程内采样，结果合并回主进程的采样器
+
+环境变量：
+    CPU_POOL_WORKERS   进程数（默认 CPU 核数，0 表示不用进程池、直接在调用线程执行）
+"""
+
+import os
+import threading
+import functools
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def _default_workers():
+    try:
+        return max(0, int(os.getenv("CPU_POOL_WORKERS", os.cpu_count() or 1)))
+    except ValueError:
+        return os.cpu_count() or 1
+
+
+class CPUPool:
+    """懒启动的共享进程池（spawn 方式，避免在多线程进程里 fork）"""
+
+    def __init__(self, workers=None):
+        """
+        Args:
+            workers: 进程数，0 表示在调用线程内同步执行
+        """
+        self.workers = _default_workers() if workers is None else workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _reset(self, broken):
+        with self._lock:
+            if self._pool is broken:
+                self._pool = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _unwrap_profiled(inner):
+        """run_profiled 的 Future -> 只含结果的 Future（采样结果合并到主进程的采样器）"""
+        from profiler import merge_worker_samples
+        outer = Future()
+
+        def done(future):
+            try:
+                result, counts = future.result()
+            except Exception as e:
+                outer.set_exception(e)
+                return
+            merge_worker_samples(counts)
+            outer.set_result(result)
+
+        inner.add_done_callback(done)
+        return outer
+
+    @staticmethod
+    def _run_inline(fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        提交任务（fn 和参数需可 pickle，即模块级函数）
+
+        Returns:
+            concurrent.futures.Future
+        """
+        if self.workers == 0:
+            return self._run_inline(fn, *args, **kwargs)
+        from profiler import profiling_interval, run_profiled
+        interval = profiling_interval()
+        if interval is not None:
+            return self._unwrap_profiled(self._submit(run_profiled, fn, interval, *args, **kwargs))
+        return self._submit(fn, *args, **kwargs)
+
+    def _submit(self, fn, *args, **kwargs):
+        pool = self._get_pool()
+        try:
+            return pool.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            # 子进程异常退出后进程池不可用，重建一次
+            self._reset(pool)
+            return self._get_pool().submit(fn, *args, **kwargs)
+
+    def map(self, fn, items, chunksize=1):
+        """并行执行并按输入顺序返回结果列表（单项或未启用进程池时直接执行）"""
+        items = list(items)
+        if self.workers == 0 or len(items) <= 1:
+            return [fn(item) for item in items]
+        from profiler import profiling_interval, run_profiled, merge_worker_samples
+        interval = profiling_interval()
+        if interval is not None:
+            results = []
+            for result, counts in self._map(functools.partial(run_profiled, fn, interval), items, chunksize):
+                merge_worker_samples(counts)
+                results.append(result)
+            return results
+        return self._map(fn, items, chunksize)
+
+    def _map(self, fn, items, chunksize):
+        pool = self._get_pool()
+        try:
+            return list(pool.map(fn, items, chunksize=chunksize))
+        except BrokenProcessPool:
+            self._reset(pool)
+            return list(self._get_pool().map(fn, items, chunksize=chunksize))
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+_cpu_pool = None
+_cpu_pool_lock = threading.Lock()
+
+
+def get_cpu_pool():
+    """获取进程内共享的进程池"""
+    global _cpu_pool
+    with _cpu_pool_lock:
+        if _cpu_pool is None:
+            _cpu_pool = CPUPool()
+        return _cpu_pool
+
+
+def submit_cpu(fn, *args, **kwargs):
+    """提交 CPU 密集任务的便捷函数，返回 Future"""
+    return get_cpu_pool().submit(fn, *args, **kwargs)
+
+
+def map_cpu(fn, items, chunksize=1):
+    """批量并行执行 CPU 密集任务的便捷函数"""
+    return get_cpu_pool().map(fn, items, chunksize=chunksize)
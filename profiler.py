@@ -0,0 +1,237 @@
+"""
+运行时剖析模块
+功能：低开销的全线程栈采样 CPU 剖析（输出 collapsed stacks，可直接生成火焰图）和 tracemalloc 内存快照对比；
+      采样期间提交到共享进程池的任务在子进程内同样采样，栈合并到 cpu-pool 根节点下
+"""
+
+import os
+import sys
+import time
+import threading
+import tracemalloc
+
+
+class SamplingProfiler:
+    """后台线程定时采样所有线程的调用栈"""
+
+    def __init__(self, interval=0.005, max_depth=64):
+        """
+        初始化采样器
+
+        Args:
+            interval: 采样间隔（秒）
+            max_depth: 每个栈最多保留的帧数（从栈顶算起）
+        """
+        self.interval = interval
+        self.max_depth = max_depth
+        self.counts = {}
+        self.samples = 0
+        self.started_at = None
+        self.stopped_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return self
+        self._stop.clear()
+        self.started_at = time.time()
+        self.stopped_at = None
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.stopped_at = time.time()
+        return self
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        return f"{module}:{code.co_name}"
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, frame in frames.items():
+                    if ident == own_ident:
+                        continue
+                    stack = []
+                    while frame is not None and len(stack) < self.max_depth:
+                        stack.append(self._frame_label(frame))
+                        frame = frame.f_back
+                    stack.append(names.get(ident, f"thread-{ident}"))
+                    key = ";".join(reversed(stack))
+                    self.counts[key] = self.counts.get(key, 0) + 1
+                self.samples += 1
+
+    def merge(self, counts, label="cpu-pool"):
+        """
+        合并子进程的采样结果（根节点的线程名替换为 label）
+
+        Args:
+            counts: 子进程采样器的 {collapsed 栈: 次数}
+            label: 火焰图中的根节点名称
+        """
+        with self._lock:
+            for stack, count in counts.items():
+                key = label + ";" + stack.split(";", 1)[1] if ";" in stack else label
+                self.counts[key] = self.counts.get(key, 0) + count
+
+    def collapsed(self):
+        """
+        导出 collapsed stacks（每行 "线程;模块:函数;... 次数"，按次数倒序）
+
+        可直接交给 flamegraph.pl 或 speedscope 生成火焰图
+        """
+        with self._lock:
+            items = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)
+        return "\n".join(f"{stack} {count}" for stack, count in items) + ("\n" if items else "")
+
+    def summary(self, top=20):
+        """采样概况：总样本数和自身耗时最多的函数"""
+        with self._lock:
+            counts = dict(self.counts)
+            samples = self.samples
+        own = {}
+        for stack, count in counts.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            own[leaf] = own.get(leaf, 0) + count
+        total = sum(counts.values()) or 1
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": samples,
+            "duration_s": round((self.stopped_at or time.time()) - self.started_at, 2) if self.started_at else 0,
+            "top_self": [
+                {"frame": frame, "count": count, "percent": round(count * 100 / total, 1)}
+                for frame, count in sorted(own.items(), key=lambda kv: kv[1], reverse=True)[:top]
+            ]
+        }
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def start_profiler(interval=0.005):
+    """开始 CPU 采样（已在运行时返回当前采样器）"""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None or not _profiler.running:
+            _profiler = SamplingProfiler(interval=max(0.001, float(interval))).start()
+        return _profiler
+
+
+def stop_profiler():
+    """停止 CPU 采样，返回采样器（从未启动时返回 None）"""
+    with _profiler_lock:
+        if _profiler is not None:
+            _profiler.stop()
+        return _profiler
+
+
+def get_profiler():
+    """当前（或最近一次）采样器"""
+    return _profiler
+
+
+def profiling_interval():
+    """CPU 采样正在运行时返回采样间隔，否则为 None（进程池据此决定是否在子进程内采样）"""
+    profiler = _profiler
+    return profiler.interval if profiler is not None and profiler.running else None
+
+
+def run_profiled(fn, interval, *args, **kwargs):
+    """
+    在进程池子进程中执行 fn 并采样（主进程的 sys._current_frames() 看不到子进程）
+
+    Returns:
+        tuple: (fn 的结果, {collapsed 栈: 次数})
+    """
+    profiler = SamplingProfiler(interval=interval).start()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        profiler.stop()
+    return result, profiler.counts
+
+
+def merge_worker_samples(counts):
+    """把子进程的采样结果合并到当前采样器（采样已停止时丢弃）"""
+    profiler = _profiler
+    if profiler is not None and counts:
+        profiler.merge(counts)
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def take_memory_snapshot(frames=10, top=30, key_type="lineno"):
+    """
+    拍一次 tracemalloc 快照，并与上一次快照对比
+
+    首次调用时启动 tracemalloc（此时只建立基线）。
+
+    Args:
+        frames: tracemalloc 记录的栈深度
+        top: 返回增长最多的前 N 项
+        key_type: 分组方式（lineno / filename / traceback）
+
+    Returns:
+        dict: {"tracing": bool, "current_mb", "peak_mb", "baseline": bool, "diff": [...]}
+    """
+    global _snapshot
+    with _snapshot_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _snapshot = None
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "tracing": True,
+            "current_mb": round(current / 1024 / 1024, 2),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+            "baseline": _snapshot is None,
+            "diff": []
+        }
+
+        if _snapshot is not None:
+            for stat in snapshot.compare_to(_snapshot, key_type)[:top]:
+                result["diff"].append({
+                    "location": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "size_kb": round(stat.size / 1024, 1),
+                    "count_diff": stat.count_diff,
+                    "count": stat.count
+                })
+        _snapshot = snapshot
+        return result
+
+
+def stop_memory_tracking():
+    """停止 tracemalloc 并丢弃基线快照"""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
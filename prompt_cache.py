@@ -0,0 +1,286 @@
+"""
+提示词前缀缓存
+功能：评分、重写提示词拆成固定的指令前缀（规则、评分标准、输出格式）和可变的后缀（原文、当前评分），
+      前缀放在最前面、跨迭代和跨任务逐字不变，服务商的上下文缓存才能命中：
+      - Gemini：前缀足够长时创建显式缓存（CachedContent，作为 system_instruction），之后只发送后缀；
+        较短的前缀依靠隐式前缀缓存
+      - 智谱 / DeepSeek：前缀作为 system 消息，由服务端自动做前缀缓存（DeepSeek 磁盘缓存、智谱上下文缓存）
+      各服务商返回的缓存命中 token 数按服务商统计命中率（进程内累计 + 单个任务）
+
+注意：目前评分、重写提示词的固定前缀只有约 30-250 token，低于 Gemini（显式 / 隐式缓存约 1024 token 起）
+和智谱的最小缓存长度，因此不会创建显式缓存，这两家基本不会命中；DeepSeek 的自动前缀缓存以 64 token 为单位，
+达到 64 token 的前缀（如重写提示词）可以命中整单位的部分。前缀加长（如加入详细评分细则、示例）后 Gemini、智谱的缓存即可生效，
+命中率统计如实反映这一点；显式缓存路径由压测目标 prompt-cache 检查
+
+环境变量：
+    PROMPT_CACHE              是否启用缓存（Gemini 显式缓存、流式评分调用的命中统计，默认 true）
+    PROMPT_CACHE_TTL          显式缓存有效期（秒，默认 3600）
+    PROMPT_CACHE_MIN_TOKENS   前缀达到该 token 数才创建显式缓存（默认 1024，低于服务商下限的缓存会创建失败）
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import namedtuple
+
+
+class PromptParts(namedtuple("PromptParts", ["prefix", "suffix"])):
+    """拆分后的提示词：prefix 为固定的指令前缀，suffix 为每次调用不同的内容"""
+
+    __slots__ = ()
+
+    @property
+    def text(self):
+        """完整提示词（不支持缓存的调用方式直接发送）"""
+        return self.prefix + self.suffix
+
+
+def prompt_text(prompt):
+    """提示词的完整文本（兼容普通字符串）"""
+    return prompt.text if isinstance(prompt, PromptParts) else prompt
+
+
+def chat_messages(prompt):
+    """
+    OpenAI 兼容接口的 messages：拆分的提示词把前缀放在 system 消息中
+
+    Returns:
+        list
+    """
+    if isinstance(prompt, PromptParts):
+        return [{"role": "system", "content": prompt.prefix.strip()},
+                {"role": "user", "content": prompt.suffix.strip()}]
+    return [{"role": "user", "content": prompt}]
+
+
+def openai_usage(data):
+    """
+    从 chat/completions 响应中取 (输入 token 数, 缓存命中 token 数)
+
+    DeepSeek 返回 prompt_cache_hit_tokens，智谱等 OpenAI 兼容接口返回 prompt_tokens_details.cached_tokens
+
+    Returns:
+        tuple: 响应中没有 usage 时为 None
+    """
+    usage = (data or {}).get("usage")
+    if not usage or usage.get("prompt_tokens") is None:
+        return None
+    cached = usage.get("prompt_cache_hit_tokens")
+    if cached is None:
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    return usage["prompt_tokens"], cached or 0
+
+
+def gemini_usage(response):
+    """从 Gemini 响应的 usage_metadata 中取 (输入 token 数, 缓存命中 token 数)，没有时为 None"""
+    metadata = getattr(response, "usage_metadata", None)
+    prompt_tokens = getattr(metadata, "prompt_token_count", None)
+    if not prompt_tokens:
+        return None
+    return prompt_tokens, getattr(metadata, "cached_content_token_count", 0) or 0
+
+
+class CacheStats:
+    """按服务商统计输入 token 的缓存命中（线程安全）"""
+
+    def __init__(self):
+        self.providers = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider, usage):
+        """
+        记录一次调用
+
+        Args:
+            provider: 服务商
+            usage: (输入 token 数, 缓存命中 token 数)，为 None 时忽略
+        """
+        if not usage:
+            return
+        prompt_tokens, cached_tokens = usage
+        with self._lock:
+            entry = self.providers.setdefault(provider, {"calls": 0, "hits": 0, "prompt_tokens": 0,
+                                                         "cached_tokens": 0})
+            entry["calls"] += 1
+            entry["hits"] += 1 if cached_tokens else 0
+            entry["prompt_tokens"] += prompt_tokens
+            entry["cached_tokens"] += cached_tokens
+
+    def summary(self):
+        """各服务商的调用数、命中次数、缓存命中的 token 占比"""
+        with self._lock:
+            providers = {provider: dict(entry) for provider, entry in self.providers.items()}
+        for entry in providers.values():
+            entry["hit_rate"] = round(entry["cached_tokens"] / entry["prompt_tokens"], 3) if entry["prompt_tokens"] else 0.0
+        prompt_tokens = sum(e["prompt_tokens"] for e in providers.values())
+        cached_tokens = sum(e["cached_tokens"] for e in providers.values())
+        return {
+            "by_provider": providers,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "hit_rate": round(cached_tokens / prompt_tokens, 3) if prompt_tokens else 0.0
+        }
+
+
+_stats = CacheStats()
+
+
+def get_cache_stats():
+    """进程内累计的缓存命中统计"""
+    return _stats
+
+
+# DeepSeek 的自动前缀缓存以 64 token 为单位，其余服务商按 PROMPT_CACHE_MIN_TOKENS 判断
+PREFIX_CACHE_MIN_TOKENS = {"deepseek": 64}
+
+
+def prefix_cacheable(provider, prompt):
+    """
+    提示词的固定前缀是否可能命中服务商的缓存（PROMPT_CACHE 关闭、未拆分或前缀过短时为 False）
+
+    流式评分调用据此决定是否读完整个流取最后一块中的 usage：不可能命中时读到整数就关闭流
+
+    Returns:
+        bool
+    """
+    from token_budget import estimate_tokens
+    cache = get_gemini_cache()
+    if not cache.enabled or not isinstance(prompt, PromptParts):
+        return False
+    minimum = PREFIX_CACHE_MIN_TOKENS.get(provider, cache.min_tokens)
+    return estimate_tokens(prompt.prefix, provider) >= minimum
+
+
+def record_usage(provider, usage, job_stats=None):
+    """记录到进程内统计，并记录到任务自己的统计（可选）"""
+    _stats.record(provider, usage)
+    if job_stats is not None:
+        job_stats.record(provider, usage)
+
+
+class GeminiContextCache:
+    """Gemini 显式缓存：同一模型、同一前缀在有效期内只创建一次，跨迭代和跨任务复用（线程安全）"""
+
+    # 离过期不足该秒数时不再使用，重新创建
+    EXPIRY_MARGIN = 60
+    # 创建失败后该段时间内不再尝试（如前缀低于服务商的最小缓存长度）
+    FAILURE_BACKOFF = 600
+
+    def __init__(self, ttl=3600, min_tokens=1024, enabled=True):
+        """
+        Args:
+            ttl: 缓存有效期（秒）
+            min_tokens: 前缀达到该 token 数才创建
+            enabled: 是否启用
+        """
+        self.ttl = ttl
+        self.min_tokens = min_tokens
+        self.enabled = enabled
+        self.created = 0
+        self.reused = 0
+        self.skipped = 0
+        self._entries = {}
+        self._short_prefixes = set()
+        self._lock = threading.Lock()
+
+    def _eligible(self, prefix):
+        from token_budget import estimate_tokens
+        if not self.enabled:
+            return False
+        tokens = estimate_tokens(prefix, "gemini")
+        if tokens >= self.min_tokens:
+            return True
+        # 前缀太短：每个前缀只提示一次
+        digest = hashlib.sha1(prefix.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.skipped += 1
+            if digest in self._short_prefixes:
+                return False
+            self._short_prefixes.add(digest)
+        print(f"[PromptCache] ⚠ 前缀约 {tokens} tokens，低于 PROMPT_CACHE_MIN_TOKENS={self.min_tokens}，不创建显式缓存")
+        return False
+
+    def get(self, model_name, prefix):
+        """
+        取前缀的缓存（没有或即将过期时创建）
+
+        Returns:
+            CachedContent，不满足条件或创建失败时为 None
+        """
+        if not self._eligible(prefix):
+            return None
+        key = (model_name, hashlib.sha1(prefix.encode("utf-8")).hexdigest())
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry["expires"] > now + self.EXPIRY_MARGIN:
+                if entry["cache"] is not None:
+                    self.reused += 1
+                return entry["cache"]
+            # 持锁创建：同一前缀并发时只创建一次
+            import datetime
+            from google.generativeai import caching
+            try:
+                cache = caching.CachedContent.create(model=model_name, system_instruction=prefix,
+                                                     ttl=datetime.timedelta(seconds=self.ttl))
+                self._entries[key] = {"cache": cache, "expires": now + self.ttl}
+                self.created += 1
+                print(f"[PromptCache] ✓ 已创建 Gemini 上下文缓存 ({model_name}, {len(prefix)} 字)")
+                return cache
+            except Exception as e:
+                self._entries[key] = {"cache": None, "expires": now + self.FAILURE_BACKOFF}
+                print(f"[PromptCache] ⚠ 创建 Gemini 上下文缓存失败，改为发送完整提示词: {e}")
+                return None
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            active = sum(1 for e in self._entries.values() if e["cache"] is not None and e["expires"] > now)
+        return {"enabled": self.enabled, "min_tokens": self.min_tokens, "active": active,
+                "created": self.created, "reused": self.reused, "skipped_short_prefix": self.skipped}
+
+
+_gemini_cache = None
+_gemini_cache_lock = threading.Lock()
+
+
+def get_gemini_cache():
+    """获取进程内共享的 Gemini 显式缓存（首次使用时读取环境变量）"""
+    global _gemini_cache
+    with _gemini_cache_lock:
+        if _gemini_cache is None:
+            _gemini_cache = GeminiContextCache(
+                ttl=int(os.getenv("PROMPT_CACHE_TTL", "3600") or 3600),
+                min_tokens=int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024") or 1024),
+                enabled=os.getenv("PROMPT_CACHE", "true").lower() == "true"
+            )
+        return _gemini_cache
+
+
+def gemini_request(model_name, prompt, key=None):
+    """
+    准备一次 Gemini 调用：拆分的提示词有可用的显式缓存时，返回绑定缓存的模型和后缀，否则返回普通模型和完整提示词
+
+    显式缓存属于创建它的 Key，配置了多个 Gemini Key 时只依靠隐式前缀缓存
+
+    Args:
+        model_name: 模型名称
+        prompt: 提示词（str 或 PromptParts）
+        key: Key 池取得的 Key
+
+    Returns:
+        tuple: (GenerativeModel, 发送的内容)
+    """
+    import google.generativeai as genai
+    from key_pool import get_key_pool, bind_gemini_key
+    if isinstance(prompt, PromptParts) and get_key_pool("gemini").size <= 1:
+        cache = get_gemini_cache().get(model_name, prompt.prefix)
+        if cache is not None:
+            return genai.GenerativeModel.from_cached_content(cached_content=cache), prompt.suffix
+    return bind_gemini_key(genai.GenerativeModel(model_name), key), prompt_text(prompt)
+
+
+def cache_summary():
+    """进程内的缓存命中统计和 Gemini 显式缓存状态（用于展示）"""
+    return {**_stats.summary(), "gemini_context_cache": get_gemini_cache().stats()}
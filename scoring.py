@@ -0,0 +1,285 @@
+"""
+评分调用配置
+功能：AI 浓度评分只需要一个 0-100 的整数，不该和写文章用同一套模型和生成参数。
+      评分调用单独使用：非思考的快速模型、温度 0、极小的输出上限、遇到换行即停，
+      并以流式读取，读到第一个完整的整数就得到答案（剩下最多几个 token 只为取最后一块中的用量）。
+      每篇文章最多 5 次评分，耗时和费用都随之下降
+
+各服务商的参数见 SCORE_PROFILES；评分模型由路由策略的 evaluate 步骤选择（默认费用优先，且不用思考模型，见 model_router.py）；
+gemini-web 走网页客户端，无法控制生成参数，只使用精简的输出要求
+
+单个模型的一次评分噪声很大，分数在目标线附近来回跳会多跑几轮重写。可开启集成评分：
+并发调用多个评分器（本流程的评分模型、其他服务商、同一模型的重复调用、本地启发式评分），
+取中位数或截尾均值，并给出各评分器的分数和方差。评分器并发执行，总耗时等于最慢的一个
+
+环境变量：
+    SCORE_ENSEMBLE   评分器列表，逗号分隔（默认 primary，即只用本流程的评分模型）
+                     可选 primary（本流程的评分模型）/ gemini / zhipu / deepseek / heuristic（本地 AI 痕迹短语密度），
+                     同一项写多次即重复调用，如 primary,primary,zhipu,heuristic
+    SCORE_COMBINE    合并方式：median（中位数，默认）/ trimmed_mean（去掉最高、最低各 1/4 后取平均）
+"""
+
+import os
+import re
+import asyncio
+import statistics
+
+
+# 评分最多 3 位数字，留一点余量给模型偶尔输出的空格、百分号
+SCORE_MAX_TOKENS = 8
+
+SCORE_PROFILES = {
+    "gemini": {
+        "generation_config": {"max_output_tokens": SCORE_MAX_TOKENS, "temperature": 0, "stop_sequences": ["\n"]},
+    },
+    "zhipu": {
+        # do_sample=False 即贪心解码（等同温度 0）
+        "params": {"max_tokens": SCORE_MAX_TOKENS, "do_sample": False, "stop": ["\n"]},
+    },
+    "deepseek": {
+        "params": {"max_tokens": SCORE_MAX_TOKENS, "temperature": 0, "stop": ["\n"]},
+    },
+}
+
+_INTEGER = re.compile(r'\d+')
+
+
+def integer_complete(text):
+    """
+    文本中的第一个整数是否已经完整（后面已有非数字字符，或已满 3 位）
+
+    Returns:
+        bool
+    """
+    match = _INTEGER.search(text)
+    return bool(match) and (match.end() < len(text) or len(match.group()) >= 3)
+
+
+def truncate_after_integer(text):
+    """截掉第一个整数之后的内容（流式读取时最后一块可能多带了字符）"""
+    match = _INTEGER.search(text)
+    return text[:match.end()] if match else text
+
+
+def read_until_integer(chunks):
+    """
+    逐块读取流式输出，读到第一个完整整数就停止（调用方随即关闭流）
+
+    Args:
+        chunks: 文本块的可迭代对象
+
+    Returns:
+        str: 截至第一个整数的文本
+    """
+    text = ""
+    for chunk in chunks:
+        text += chunk
+        if integer_complete(text):
+            break
+    return truncate_after_integer(text)
+
+
+async def read_until_integer_async(chunks):
+    """read_until_integer 的异步版本（chunks 为异步迭代器）"""
+    text = ""
+    async for chunk in chunks:
+        text += chunk
+        if integer_complete(text):
+            break
+    return truncate_after_integer(text)
+
+
+def _chunk_texts(response, last):
+    # 流式响应的最后一块可能只有结束原因、没有文本，取 .text 会抛 ValueError
+    for chunk in response:
+        last[0] = chunk
+        try:
+            yield chunk.text
+        except ValueError:
+            continue
+
+
+def gemini_score(model, prompt, on_usage=None):
+    """
+    按评分配置调用 Gemini（流式，读到第一个完整整数即得到答案）
+
+    Args:
+        model: genai.GenerativeModel（应为路由策略给 evaluate 步骤选出的快速模型）
+        prompt: 评分提示词（应带精简输出要求，见 structured_output.COMPACT_INSTRUCTIONS）
+        on_usage: 读完流后以最后一块调用（usage_metadata 在最后一块中，用于缓存命中统计）；
+                  为 None 时读到整数即停止，不读剩余部分
+
+    Returns:
+        str: 截至第一个整数的回答
+    """
+    response = model.generate_content(prompt, generation_config=SCORE_PROFILES["gemini"]["generation_config"],
+                                      stream=True)
+    last = [None]
+    chunks = _chunk_texts(response, last)
+    text = read_until_integer(chunks)
+    if on_usage is not None:
+        # 只在前缀可能命中缓存时读完剩余的几个 token（见 prompt_cache.prefix_cacheable）
+        for _ in chunks:
+            pass
+        if last[0] is not None:
+            on_usage(last[0])
+    return text
+
+
+# ---------------- 集成评分 ----------------
+
+ENSEMBLE_SCORERS = ("primary", "gemini", "zhipu", "deepseek", "heuristic")
+
+COMBINE_METHODS = ("median", "trimmed_mean")
+
+# 截尾均值两端各去掉的比例
+TRIM_RATIO = 0.25
+
+# 启发式评分：每千字的 AI 痕迹短语加权分乘以该系数换算为 0-100
+HEURISTIC_POINTS = 10
+
+
+def ensemble_config():
+    """
+    读取集成评分配置
+
+    Returns:
+        tuple: (评分器名称列表, 合并方式)
+    """
+    names = []
+    for name in os.getenv("SCORE_ENSEMBLE", "primary").split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name not in ENSEMBLE_SCORERS:
+            print(f"[Scoring] ⚠ 未知的评分器: {name}，已忽略")
+            continue
+        names.append(name)
+    method = os.getenv("SCORE_COMBINE", "median").strip().lower()
+    if method not in COMBINE_METHODS:
+        print(f"[Scoring] ⚠ 未知的合并方式: {method}，使用 median")
+        method = "median"
+    return names or ["primary"], method
+
+
+def scorer_available(name):
+    """评分器是否可用：服务商评分器需要配置了对应的 API Key"""
+    if name in ("primary", "heuristic"):
+        return True
+    from key_pool import load_keys
+    return bool(load_keys(name))
+
+
+def scorer_labels(names):
+    """
+    给评分器编号（同一评分器出现多次时加 #2、#3 区分）
+
+    Returns:
+        list: [(标签, 评分器名称)]
+    """
+    labels = []
+    for index, name in enumerate(names):
+        repeat = names[:index].count(name)
+        labels.append((f"{name}#{repeat + 1}" if repeat else name, name))
+    return labels
+
+
+def heuristic_score(text):
+    """
+    本地启发式评分：AI 痕迹短语（keywords_config.json 的 ai_markers）的加权分按每千字密度换算到 0-100
+
+    不调用模型、几乎不耗时，分数稳定但粗糙，只适合作为集成中的一票
+
+    Returns:
+        int: 0-100
+    """
+    if not text:
+        return 0
+    from keyword_engine import scan_article
+    density = scan_article(text)["ai_marker_score"] * 1000 / len(text)
+    return min(100, round(density * HEURISTIC_POINTS))
+
+
+def combine_scores(scores, method="median"):
+    """
+    合并多个评分器的分数
+
+    Args:
+        scores: {标签: 分数}
+        method: median / trimmed_mean
+
+    Returns:
+        dict: {"score": 合并后的分数, "scores": 各评分器分数, "method": 合并方式,
+               "variance": 总体方差, "stdev": 标准差, "spread": 最高分 - 最低分}
+    """
+    values = sorted(scores.values())
+    if method == "trimmed_mean" and len(values) >= 3:
+        trim = max(1, int(len(values) * TRIM_RATIO))
+        combined = statistics.mean(values[trim:-trim])
+    else:
+        combined = statistics.median(values)
+    variance = statistics.pvariance(values) if len(values) > 1 else 0.0
+    return {
+        "score": int(combined + 0.5),
+        "scores": dict(scores),
+        "method": method,
+        "variance": round(variance, 1),
+        "stdev": round(variance ** 0.5, 1),
+        "spread": values[-1] - values[0],
+    }
+
+
+def _combine_results(labels, results, method, log):
+    scores = {}
+    errors = {}
+    for label, result in zip(labels, results):
+        if isinstance(result, BaseException):
+            errors[label] = result
+            log(f"[Scoring] ⚠ 评分器 {label} 失败: {result}")
+        else:
+            scores[label] = result
+    if not scores:
+        # 全部失败时按原来的单评分器行为抛出异常
+        raise next(iter(errors.values()))
+    combined = combine_scores(scores, method)
+    combined["errors"] = {label: str(e) for label, e in errors.items()}
+    return combined
+
+
+def ensemble_score(scorers, method="median", log=print):
+    """
+    并发调用多个评分器并合并（线程池，总耗时等于最慢的评分器）
+
+    Args:
+        scorers: {标签: 无参函数，返回 0-100 的整数}
+        method: median / trimmed_mean
+        log: 日志函数
+
+    Returns:
+        dict: 见 combine_scores，另有 "errors"（失败的评分器）；全部失败时抛出第一个异常
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    labels = list(scorers)
+    with ThreadPoolExecutor(max_workers=len(labels)) as pool:
+        futures = [pool.submit(fn) for fn in scorers.values()]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return _combine_results(labels, results, method, log)
+
+
+async def ensemble_score_async(scorers, method="median", log=print):
+    """ensemble_score 的协程版本（scorers 的值为返回协程的无参函数）"""
+    labels = list(scorers)
+    results = await asyncio.gather(*(fn() for fn in scorers.values()), return_exceptions=True)
+    return _combine_results(labels, results, method, log)
+
+
+def describe(result):
+    """集成评分的日志描述，如 "median of primary 40, zhipu 44, heuristic 35 (σ 3.7)" """
+    parts = ", ".join(f"{label} {score}" for label, score in result["scores"].items())
+    return f"{result['method']} of {parts} (σ {result['stdev']})"
@@ -0,0 +1,303 @@
+"""
+结构化输出
+功能：选题、评分等需要从模型回答中取字段的步骤统一要求输出 JSON（服务商支持时开启原生 JSON 模式），
+      本地按 schema 校验；校验失败时只把原回答和错误发回去做一次低成本的格式修复，
+      修复仍失败则抛出 StructuredOutputError，不再静默回退到"AI时代的思考"之类的默认值继续跑完整个流程
+
+兼容没有按 JSON 回答、但格式清楚的旧式输出（标题：《XXX》/ 只有一个数字），这类回答不需要修复调用；
+评分调用可用精简格式（compact，只输出一个整数），配合 scoring.py 的极小输出上限
+
+环境变量：
+    STRUCTURED_REPAIRS   校验失败后的修复次数（默认 1，0 表示不修复直接报错）
+"""
+
+import os
+import re
+import json
+
+
+TOPIC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string", "minLength": 2, "maxLength": 60, "description": "文章标题，不带书名号"},
+        "outline": {"type": "string", "minLength": 2, "description": "文章大纲"}
+    },
+    "required": ["title", "outline"]
+}
+
+SCORE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 0, "maximum": 100, "description": "AI 浓度评分"}
+    },
+    "required": ["score"]
+}
+
+SCHEMAS = {
+    "topic": TOPIC_SCHEMA,
+    "score": SCORE_SCHEMA,
+}
+
+# 精简输出格式（只有单个字段时可用，输出几个 token 即可，见 scoring.py 的评分调用配置）
+COMPACT_INSTRUCTIONS = {
+    "score": "\n\n只输出一个 0-100 的整数，不要任何其他文字或符号。",
+}
+
+# 修复提示词里附带的原回答最大长度（修复只需要看格式，不需要全文）
+REPAIR_EXCERPT = 2000
+
+_TYPES = {
+    "object": dict,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+}
+
+
+class StructuredOutputError(Exception):
+    """模型回答无法解析为符合 schema 的结构（修复后仍失败）"""
+
+    def __init__(self, name, error, output):
+        super().__init__(f"{name}: {error}")
+        self.name = name
+        self.error = error
+        self.output = output
+
+
+def _max_repairs():
+    try:
+        return max(0, int(os.getenv("STRUCTURED_REPAIRS", "1")))
+    except ValueError:
+        return 1
+
+
+def validate(data, schema, path="$"):
+    """
+    按 JSON Schema 的子集校验（type / properties / required / minimum / maximum / minLength / maxLength）
+
+    Returns:
+        str: 第一个错误的描述，通过校验返回 None
+    """
+    expected = schema.get("type")
+    if expected:
+        # bool 是 int 的子类，不能当作整数
+        if isinstance(data, bool) and expected in ("integer", "number"):
+            return f"{path} 应为 {expected}"
+        if not isinstance(data, _TYPES[expected]):
+            return f"{path} 应为 {expected}"
+    if isinstance(data, dict):
+        for key in schema.get("required", []):
+            if key not in data:
+                return f"{path} 缺少字段 {key}"
+        for key, sub in schema.get("properties", {}).items():
+            if key in data:
+                error = validate(data[key], sub, f"{path}.{key}")
+                if error:
+                    return error
+    if isinstance(data, (int, float)) and not isinstance(data, bool):
+        if "minimum" in schema and data < schema["minimum"]:
+            return f"{path} 不能小于 {schema['minimum']}"
+        if "maximum" in schema and data > schema["maximum"]:
+            return f"{path} 不能大于 {schema['maximum']}"
+    if isinstance(data, str):
+        if len(data.strip()) < schema.get("minLength", 0):
+            return f"{path} 太短"
+        if "maxLength" in schema and len(data) > schema["maxLength"]:
+            return f"{path} 超过 {schema['maxLength']} 字"
+    return None
+
+
+def extract_json(text):
+    """
+    从回答中取出 JSON 对象（兼容 ```json 代码块和前后的说明文字）
+
+    Returns:
+        解析结果，找不到时返回 None
+    """
+    text = text.strip()
+    fenced = re.search(r'```(?:json)?\s*(.*?)```', text, re.S)
+    if fenced:
+        text = fenced.group(1).strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    start, end = text.find("{"), text.rfind("}")
+    if 0 <= start < end:
+        try:
+            return json.loads(text[start:end + 1])
+        except ValueError:
+            pass
+    return None
+
+
+def _clean_title(title):
+    return title.strip().strip("《》\"“”'").strip()
+
+
+def _legacy_topic(text):
+    """旧式选题回答：标题：《XXX》 + 大纲：XXX（大纲可跨多行）"""
+    match = re.search(r'标题[：:]\s*《(.+?)》', text) or re.search(r'《(.+?)》', text)
+    if not match:
+        return None
+    outline = re.search(r'大纲[：:]\s*(.+)', text, re.S)
+    return {"title": match.group(1), "outline": outline.group(1).strip() if outline else ""}
+
+
+def _legacy_score(text):
+    """旧式评分回答：整个回答只有一个 0-100 的数字"""
+    match = re.fullmatch(r'\s*(?:\*\*)?(\d{1,3})(?:\*\*)?\s*%?\s*[。.]?\s*', text)
+    return {"score": int(match.group(1))} if match else None
+
+
+LEGACY_PARSERS = {
+    "topic": _legacy_topic,
+    "score": _legacy_score,
+}
+
+
+def parse(name, text):
+    """
+    解析并校验回答
+
+    Args:
+        name: schema 名称（topic / score）
+        text: 模型回答
+
+    Returns:
+        tuple: (数据 dict, 错误描述)，成功时错误为 None
+    """
+    schema = SCHEMAS[name]
+    data = extract_json(text or "")
+    if not isinstance(data, dict):
+        # 只有一个数字的回答本身也是合法 JSON，同样交给旧式解析
+        legacy = LEGACY_PARSERS.get(name)
+        parsed = legacy(text or "") if legacy else None
+        if parsed is not None:
+            data = parsed
+        elif data is None:
+            return None, "回答格式无法解析"
+    if name == "topic" and isinstance(data, dict) and isinstance(data.get("title"), str):
+        data["title"] = _clean_title(data["title"])
+    if name == "score" and isinstance(data, dict) and isinstance(data.get("score"), float) \
+            and data["score"].is_integer():
+        data["score"] = int(data["score"])
+    error = validate(data, schema)
+    return (None, error) if error else (data, None)
+
+
+def _example(schema):
+    return json.dumps({
+        key: f"<{sub.get('description', key)}>" if sub.get("type") == "string" else 0
+        for key, sub in schema["properties"].items()
+    }, ensure_ascii=False)
+
+
+def instructions(name, compact=False):
+    """追加到提示词末尾的输出格式要求（compact 时用精简格式）"""
+    if compact and name in COMPACT_INSTRUCTIONS:
+        return COMPACT_INSTRUCTIONS[name]
+    schema = SCHEMAS[name]
+    fields = "；".join(
+        f"{key}（{sub.get('description', key)}，{sub['type']}"
+        + (f"，{sub['minimum']}-{sub['maximum']}" if "minimum" in sub else "") + "）"
+        for key, sub in schema["properties"].items()
+    )
+    return f"\n\n请只输出一个 JSON 对象，不要任何解释或代码块标记。字段：{fields}。\n示例：{_example(schema)}"
+
+
+def structured_prompt(prompt, name, compact=False):
+    """带输出格式要求的提示词（拆分的提示词把格式要求并入固定前缀，见 prompt_cache.py）"""
+    from prompt_cache import PromptParts
+    if isinstance(prompt, PromptParts):
+        return PromptParts(prompt.prefix + instructions(name, compact), prompt.suffix)
+    return prompt + instructions(name, compact)
+
+
+def repair_prompt(name, output, error, compact=False, original=""):
+    """格式修复提示词：只发原回答（截断）和错误，不重新生成内容"""
+    excerpt = output if len(output) <= REPAIR_EXCERPT else output[:REPAIR_EXCERPT] + "…"
+    if compact and name in COMPACT_INSTRUCTIONS:
+        # 精简输出有极小的长度上限，格式不对的回答往往被截断、无法从中整理出结果，只能带上原提示词重新回答
+        from prompt_cache import PromptParts
+        note = f"\n\n（上一次的回答“{excerpt}”不符合要求：{error}）{instructions(name, compact)}"
+        if isinstance(original, PromptParts):
+            return PromptParts(original.prefix + instructions(name, compact), original.suffix + note)
+        return original + note
+    return f"""下面的回答不符合要求的格式（错误：{error}）。
+请保留原意，按要求的格式重新输出。
+
+原回答：
+{excerpt}{instructions(name, compact)}"""
+
+
+def generate_structured(call, prompt, name, log=print, compact=False):
+    """
+    按结构化输出要求调用模型，校验失败时做修复调用
+
+    Args:
+        call: call(prompt, json_mode) -> str，json_mode 为 True 时调用方应开启服务商的 JSON 模式
+        prompt: 原始提示词（不含格式要求；str 或 prompt_cache.PromptParts）
+        name: schema 名称（topic / score）
+        log: 日志函数
+        compact: 使用精简输出格式（不开 JSON 模式，如评分只输出一个整数）
+
+    Returns:
+        dict: 通过校验的数据
+    """
+    from tracing import span
+    json_mode = not (compact and name in COMPACT_INSTRUCTIONS)
+    output = call(structured_prompt(prompt, name, compact), json_mode)
+    data, error = parse(name, output)
+    for attempt in range(_max_repairs()):
+        if data is not None:
+            break
+        log(f"[Structured] ⚠ {name} 回答格式错误（{error}），第 {attempt + 1} 次修复")
+        with span(f"{name} repair", cat="retry", attempt=attempt + 1, error=error) as current:
+            output = call(repair_prompt(name, output, error, compact, prompt), json_mode)
+            data, error = parse(name, output)
+            current.set(valid=data is not None)
+    if data is None:
+        raise StructuredOutputError(name, error, output)
+    return data
+
+
+async def generate_structured_async(call, prompt, name, log=print, compact=False):
+    """generate_structured 的协程版本（call 返回协程）"""
+    from tracing import span
+    json_mode = not (compact and name in COMPACT_INSTRUCTIONS)
+    output = await call(structured_prompt(prompt, name, compact), json_mode)
+    data, error = parse(name, output)
+    for attempt in range(_max_repairs()):
+        if data is not None:
+            break
+        log(f"[Structured] ⚠ {name} 回答格式错误（{error}），第 {attempt + 1} 次修复")
+        with span(f"{name} repair", cat="retry", attempt=attempt + 1, error=error) as current:
+            output = await call(repair_prompt(name, output, error, compact, prompt), json_mode)
+            data, error = parse(name, output)
+            current.set(valid=data is not None)
+    if data is None:
+        raise StructuredOutputError(name, error, output)
+    return data
+
+
+def parse_gptzero_score(text):
+    """
+    从 GPTZero 的响应中取 AI 概率（0-100）
+
+    Returns:
+        int: 评分，响应里没有可用字段时返回 None（不再取响应文本里的第一个数字）
+    """
+    data = extract_json(text or "")
+    try:
+        document = data["documents"][0]
+    except (TypeError, KeyError, IndexError):
+        return None
+    prob = document.get("completely_generated_prob")
+    if prob is None:
+        prob = (document.get("class_probabilities") or {}).get("ai")
+    if not isinstance(prob, (int, float)) or isinstance(prob, bool):
+        return None
+    return max(0, min(100, round(prob * 100)))
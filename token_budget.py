@@ -0,0 +1,408 @@
+"""
+Token 预算模块
+功能：本地估算各服务商的 token 数（不调用接口），按步骤限制提示词中嵌入的上下文大小：
+      大纲去掉寒暄和格式噪音后再截断，重写只发送 AI 痕迹最重的段落、已经像人写的段落原样保留；
+      任务开始前按流程预估 token 用量和费用，任务结束时按步骤汇总实际用量和费用
+
+步骤上限可在 prompts_config.json 中按流程配置（单位为 token，指嵌入提示词的上下文部分）：
+    "gemini-deepseek": {"token_budget": {"outline": 1000, "rewrite": 3000, "evaluate": 1600}}
+"""
+
+import os
+import re
+import json
+import math
+import threading
+
+
+# 每字符的 token 数（中日韩字符 / 其他字符），按各家公开的换算比例取整
+# DeepSeek：1 个中文字符约 0.6 token，1 个英文字符约 0.3 token；智谱 GLM 相近；Gemini 对中文切分更细
+TOKEN_RATIOS = {
+    "gemini": (0.8, 0.25),
+    "gemini-web": (0.8, 0.25),
+    "deepseek": (0.6, 0.3),
+    "zhipu": (0.6, 0.25),
+}
+DEFAULT_RATIO = (1.0, 0.3)
+
+# 每百万 token 的参考价格（美元，输入 / 输出）；gemini-web 走网页客户端不计费
+TOKEN_PRICES = {
+    "gemini": (2.0, 12.0),
+    "gemini-web": (0.0, 0.0),
+    "deepseek": (0.28, 0.42),
+    "zhipu": (0.6, 2.2),
+}
+
+# 各模型每百万 token 的参考价格（美元，输入 / 输出），未列出的模型按服务商价格计算；
+# 模型路由按这些价格估算各步骤的费用（见 model_router.py）
+MODEL_PRICES = {
+    "models/gemini-3-pro-preview": (2.0, 12.0),
+    "models/gemini-2.5-pro": (1.25, 10.0),
+    "models/gemini-2.5-flash": (0.30, 2.50),
+    "models/gemini-2.5-flash-lite": (0.10, 0.40),
+    "models/gemini-2.0-flash-001": (0.10, 0.40),
+    "models/gemini-2.0-flash-lite-001": (0.075, 0.30),
+    "glm-4.7": (0.6, 2.2),
+    "glm-4.5-air": (0.2, 1.1),
+    "glm-4-flash": (0.0, 0.0),
+    "deepseek-chat": (0.28, 0.42),
+}
+
+# 各步骤嵌入提示词的上下文 token 上限
+DEFAULT_STEP_LIMITS = {
+    "outline": 1000,    # 写作提示词中的大纲
+    "rewrite": 3000,    # 重写提示词中的原文
+    "evaluate": 1600,   # 评分提示词中的样本
+}
+
+# 各流程每个步骤使用的服务商（gptzero 检测按字数计费，不计入 token）
+PIPELINE_STEPS = {
+    "gemini": {"topic": "gemini", "write": "gemini", "evaluate": "gemini", "rewrite": "gemini"},
+    "zhipu": {"topic": "zhipu", "write": "zhipu", "evaluate": "zhipu", "rewrite": "zhipu"},
+    "gemini-web": {"topic": "gemini-web", "write": "gemini-web", "evaluate": None, "rewrite": "gemini-web"},
+    "gemini-deepseek": {"topic": "gemini-web", "write": "deepseek", "evaluate": "gemini-web", "rewrite": "gemini-web"},
+}
+
+# 预估用的提示词模板长度（字符）和输出长度
+TEMPLATE_CHARS = {"topic": 200, "write": 150, "evaluate": 80, "rewrite": 250}
+TOPIC_OUTPUT_CHARS = {"gemini-deepseek": 800}
+DEFAULT_TOPIC_OUTPUT_CHARS = 300
+SCORE_OUTPUT_CHARS = 4
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts_config.json")
+
+_CJK = re.compile(r'[　-〿㐀-䶿一-鿿豈-﫿＀-￯]')
+_SPACE = re.compile(r'\s+')
+
+# 大纲中常见的寒暄和收尾（整行丢弃）
+_OUTLINE_CHATTER = re.compile(r'^(好的|当然|以下是|下面是|这是|希望|如果你|如果您|需要我|祝)')
+# 大纲的章节行（一、 / 1. / ## ）
+_OUTLINE_SECTION = re.compile(r'^([一二三四五六七八九十]+[、.．]|\d+[、.．]|#)')
+
+
+def estimate_tokens(text, provider=None):
+    """
+    本地估算 token 数
+
+    Args:
+        text: 文本
+        provider: 服务商（gemini / gemini-web / deepseek / zhipu），决定换算比例
+
+    Returns:
+        int: 估算的 token 数
+    """
+    if not text:
+        return 0
+    cjk_ratio, other_ratio = TOKEN_RATIOS.get(provider, DEFAULT_RATIO)
+    cjk = len(_CJK.findall(text))
+    other = len(_SPACE.sub(" ", text)) - cjk
+    return int(math.ceil(cjk * cjk_ratio + other * other_ratio))
+
+
+def estimate_cost(provider, input_tokens, output_tokens, model=None):
+    """按参考价格估算费用（美元；指定模型且有单价时按模型价格）"""
+    input_price, output_price = MODEL_PRICES.get(model) or TOKEN_PRICES.get(provider, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def _pipeline_config(pipeline):
+    try:
+        with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f).get(pipeline, {})
+    except (OSError, ValueError):
+        return {}
+
+
+def load_step_limits(pipeline):
+    """读取流程的步骤上限（默认值 + prompts_config.json 中的 token_budget）"""
+    limits = dict(DEFAULT_STEP_LIMITS)
+    limits.update(_pipeline_config(pipeline).get("token_budget", {}))
+    return limits
+
+
+def _truncate_lines(lines, max_tokens, provider):
+    """按行截断到上限以内（至少保留一行）"""
+    kept = []
+    used = 0
+    for line in lines:
+        cost = estimate_tokens(line, provider) + 1
+        if kept and used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def compress_outline(outline_text, max_tokens, provider=None):
+    """
+    压缩大纲：去掉寒暄、收尾、Markdown 修饰和空行；仍超出上限时先删次级要点，最后按行截断
+
+    Args:
+        outline_text: 大纲原文
+        max_tokens: 上限
+        provider: 接收大纲的服务商
+
+    Returns:
+        str: 压缩后的大纲
+    """
+    lines = []
+    for line in (outline_text or "").splitlines():
+        line = line.replace("**", "").rstrip()
+        stripped = line.strip()
+        if not stripped or set(stripped) <= set("-=*_"):
+            continue
+        if _OUTLINE_CHATTER.match(stripped) and "标题" not in stripped:
+            continue
+        lines.append(line)
+
+    if estimate_tokens("\n".join(lines), provider) <= max_tokens:
+        return "\n".join(lines)
+
+    # 删掉缩进的次级要点，保留标题、章节和一级要点
+    lines = [line for line in lines if not line.startswith(("  ", "\t")) or _OUTLINE_SECTION.match(line.strip())]
+    if estimate_tokens("\n".join(lines), provider) <= max_tokens:
+        return "\n".join(lines)
+
+    return "\n".join(_truncate_lines(lines, max_tokens, provider))
+
+
+class RewritePlan:
+    """重写计划：超出上限时只把 AI 痕迹最重的段落发给模型，其余段落原样保留"""
+
+    NOTE = "（以下为需要修改的段落，段落之间空一行，请逐段重写并保持段落数量和顺序不变）"
+
+    def __init__(self, article, paragraphs, selected):
+        """
+        Args:
+            article: 原文
+            paragraphs: 原文段落
+            selected: 需要重写的段落下标（升序）；为 None 表示整篇重写
+        """
+        self.article = article
+        self.paragraphs = paragraphs
+        self.selected = selected
+
+    @property
+    def trimmed(self):
+        return self.selected is not None
+
+    @property
+    def text(self):
+        """嵌入重写提示词的原文"""
+        if not self.trimmed:
+            return self.article
+        return self.NOTE + "\n\n" + "\n\n".join(self.paragraphs[i] for i in self.selected)
+
+    def merge(self, rewritten):
+        """
+        把重写结果合并回原文
+
+        段落数量一致时逐段替换；数量不一致时无法确定对应关系：被重写的段落连续时整段放回原位置，
+        不连续时保留原文（拼接会把后面的内容挪到中间未改动的段落之前，打乱文章顺序）
+        """
+        if not self.trimmed:
+            return rewritten
+        parts = [p.strip() for p in re.split(r'\n\s*\n', rewritten.strip()) if p.strip()]
+        merged = list(self.paragraphs)
+        if len(parts) == len(self.selected):
+            for index, part in zip(self.selected, parts):
+                merged[index] = part
+        elif self.selected[-1] - self.selected[0] == len(self.selected) - 1:
+            merged[self.selected[0]:self.selected[-1] + 1] = [rewritten.strip()]
+        else:
+            print(f"[Budget] ⚠ 重写结果有 {len(parts)} 段，应为 {len(self.selected)} 段，无法逐段放回，保留原文")
+            return self.article
+        return "\n\n".join(merged)
+
+
+def plan_rewrite(article, max_tokens, provider=None):
+    """
+    规划重写：全文不超过上限时整篇重写；否则按 AI 痕迹密度（keyword_engine 的 ai_markers 加权分 / 长度）
+    从高到低选段落直到用满上限，已经像人写的段落不再发送
+
+    Returns:
+        RewritePlan
+    """
+    paragraphs = [p.strip() for p in re.split(r'\n\s*\n', article or "") if p.strip()]
+    costs = [estimate_tokens(p, provider) + 1 for p in paragraphs]
+    if sum(costs) <= max_tokens:
+        return RewritePlan(article, paragraphs, None)
+
+    from keyword_engine import get_keyword_engine
+    engine = get_keyword_engine()
+    density = [engine.scan(p)["ai_marker_score"] / max(1, cost) for p, cost in zip(paragraphs, costs)]
+
+    budget = max_tokens - estimate_tokens(RewritePlan.NOTE, provider)
+    selected = []
+    used = 0
+    for index in sorted(range(len(paragraphs)), key=lambda i: (-density[i], i)):
+        if used + costs[index] > budget:
+            continue
+        selected.append(index)
+        used += costs[index]
+
+    if not selected:
+        # 单段就超出上限：只能整篇发送
+        return RewritePlan(article, paragraphs, None)
+    return RewritePlan(article, paragraphs, sorted(selected))
+
+
+class ContextBudget:
+    """单个任务的上下文预算和 token 用量统计（线程安全）"""
+
+    def __init__(self, pipeline):
+        """
+        Args:
+            pipeline: 流程（gemini / zhipu / gemini-web / gemini-deepseek）
+        """
+        self.pipeline = pipeline
+        self.limits = load_step_limits(pipeline)
+        self.steps = PIPELINE_STEPS.get(pipeline, {})
+        self.usage = {}
+        self.by_step = {}
+        self._lock = threading.Lock()
+
+    def fit_outline(self, outline_text):
+        """压缩写作步骤中嵌入的大纲"""
+        return compress_outline(outline_text, self.limits["outline"], self.steps.get("write"))
+
+    def plan_rewrite(self, article):
+        """规划重写步骤中嵌入的原文"""
+        return plan_rewrite(article, self.limits["rewrite"], self.steps.get("rewrite"))
+
+    def fit_sample(self, article):
+        """截取评分步骤的样本（按 token 上限截断）"""
+        provider = self.steps.get("evaluate")
+        if estimate_tokens(article, provider) <= self.limits["evaluate"]:
+            return article
+        cjk_ratio, _ = TOKEN_RATIOS.get(provider, DEFAULT_RATIO)
+        sample = article[:int(self.limits["evaluate"] / cjk_ratio)]
+        while len(sample) > 1 and estimate_tokens(sample, provider) > self.limits["evaluate"]:
+            sample = sample[:int(len(sample) * 0.9)]
+        return sample
+
+    def record(self, provider, prompt, response, step=None, model=None):
+        """
+        记录一次调用的估算用量，返回输入 token 数
+
+        Args:
+            provider: 服务商
+            prompt: 提示词
+            response: 回答
+            step: 步骤（topic / write / evaluate / rewrite），用于按步骤汇总费用
+            model: 实际使用的模型（按模型单价计费）
+        """
+        input_tokens = estimate_tokens(prompt, provider)
+        output_tokens = estimate_tokens(response if isinstance(response, str) else "", provider)
+        cost = estimate_cost(provider, input_tokens, output_tokens, model)
+        with self._lock:
+            entry = self.usage.setdefault(provider, {"calls": 0, "input_tokens": 0, "output_tokens": 0,
+                                                     "cost_usd": 0.0})
+            entry["calls"] += 1
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost_usd"] += cost
+            if step:
+                entry = self.by_step.setdefault(step, {"calls": 0, "input_tokens": 0, "output_tokens": 0,
+                                                       "cost_usd": 0.0, "models": {}})
+                entry["calls"] += 1
+                entry["input_tokens"] += input_tokens
+                entry["output_tokens"] += output_tokens
+                entry["cost_usd"] += cost
+                name = model or provider
+                entry["models"][name] = entry["models"].get(name, 0) + 1
+        return input_tokens
+
+    def summary(self):
+        """用量汇总（估算值）"""
+        with self._lock:
+            usage = {provider: dict(entry) for provider, entry in self.usage.items()}
+            by_step = {step: dict(entry, models=dict(entry["models"])) for step, entry in self.by_step.items()}
+        for entry in list(usage.values()) + list(by_step.values()):
+            entry["cost_usd"] = round(entry["cost_usd"], 6)
+        return {
+            "by_provider": usage,
+            "by_step": by_step,
+            "input_tokens": sum(e["input_tokens"] for e in usage.values()),
+            "output_tokens": sum(e["output_tokens"] for e in usage.values()),
+            "cost_usd": round(sum(e["cost_usd"] for e in usage.values()), 6)
+        }
+
+
+def cost_report(summary):
+    """
+    按步骤的费用报告（任务结束时输出）
+
+    Args:
+        summary: ContextBudget.summary() 的结果
+
+    Returns:
+        list: 报告行
+    """
+    lines = []
+    for step, entry in summary.get("by_step", {}).items():
+        models = ", ".join(f"{model} x{calls}" for model, calls in entry["models"].items())
+        lines.append(f"{step:8s} {entry['calls']:>2} calls  {entry['input_tokens']:>6} in / "
+                     f"{entry['output_tokens']:>6} out  ${entry['cost_usd']:.4f}  ({models})")
+    lines.append(f"{'total':8s} {summary['input_tokens']:>16} in / {summary['output_tokens']:>6} out  "
+                 f"${summary['cost_usd']:.4f}")
+    return lines
+
+
+def forecast_job(pipeline, article_length=None, iterations=2):
+    """
+    任务开始前预估 token 用量和费用（按最坏情况：评分 iterations 次、重写 iterations - 1 次；
+    各步骤按模型路由选中的模型计价，见 model_router.py）
+
+    Args:
+        pipeline: 流程
+        article_length: 文章字数，默认取 prompts_config.json 中的 article_length（没有则 2000）
+        iterations: 优化轮数
+
+    Returns:
+        dict: {"pipeline", "steps": [...], "input_tokens", "output_tokens", "cost_usd"}
+    """
+    from model_router import MODEL_CATALOG, route, load_routing
+    steps = PIPELINE_STEPS.get(pipeline, PIPELINE_STEPS["zhipu"])
+    routing = load_routing(pipeline)
+    limits = load_step_limits(pipeline)
+    if article_length is None:
+        article_length = _pipeline_config(pipeline).get("article_length", 2000)
+    # 中文正文按每字 1 个 CJK 字符估算，写作输出通常比要求略长
+    article_chars = int(article_length * 1.1)
+    topic_chars = TOPIC_OUTPUT_CHARS.get(pipeline, DEFAULT_TOPIC_OUTPUT_CHARS)
+
+    def tokens(chars, provider):
+        return int(math.ceil(chars * TOKEN_RATIOS.get(provider, DEFAULT_RATIO)[0]))
+
+    plan = [("topic", 1, TEMPLATE_CHARS["topic"], topic_chars)]
+    write_context = topic_chars if pipeline == "gemini-deepseek" else 0
+    plan.append(("write", 1, TEMPLATE_CHARS["write"] + write_context, article_chars))
+    plan.append(("evaluate", iterations, TEMPLATE_CHARS["evaluate"] + article_chars, SCORE_OUTPUT_CHARS))
+    plan.append(("rewrite", max(0, iterations - 1), TEMPLATE_CHARS["rewrite"] + article_chars, article_chars))
+
+    result = {"pipeline": pipeline, "steps": [], "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0}
+    for step, calls, input_chars, output_chars in plan:
+        provider = steps.get(step)
+        if provider is None or calls == 0:
+            continue
+        input_tokens = tokens(input_chars, provider)
+        output_tokens = tokens(output_chars, provider)
+        context_limit = limits.get(step)
+        if context_limit:
+            input_tokens = min(input_tokens, tokens(TEMPLATE_CHARS[step], provider) + context_limit)
+            if step == "rewrite":
+                output_tokens = min(output_tokens, context_limit)
+        input_tokens *= calls
+        output_tokens *= calls
+        model = route(pipeline, provider, step, routing=routing) if provider in MODEL_CATALOG else None
+        cost = estimate_cost(provider, input_tokens, output_tokens, model)
+        result["steps"].append({
+            "step": step, "provider": provider, "model": model, "calls": calls,
+            "input_tokens": input_tokens, "output_tokens": output_tokens, "cost_usd": round(cost, 6)
+        })
+        result["input_tokens"] += input_tokens
+        result["output_tokens"] += output_tokens
+        result["cost_usd"] += cost
+    result["cost_usd"] = round(result["cost_usd"], 6)
+    return result
@@ -0,0 +1,260 @@
+"""
+任务追踪模块
+功能：把一次写稿任务的步骤、服务商调用、子进程、封面尝试和文件写入记录为带起止时间和属性的 span，
+      按任务导出为 Chrome trace-viewer 兼容的 JSON（chrome://tracing 或 https://ui.perfetto.dev 打开）
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+
+TRACE_DIR = os.getenv("TRACE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "traces")
+
+# 内存中保留的最近任务数
+MAX_RECENT_TRACES = 50
+
+_current = contextvars.ContextVar("current_tracer", default=None)
+
+
+def new_job_id():
+    """生成任务 ID（时间戳 + 随机后缀）"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+def http_status(error):
+    """从异常中取 HTTP 状态码（status_code 属性或 "API error: 429" 之类的信息），没有时为 None"""
+    code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(code, int):
+        return code
+    match = re.search(r'\b([1-5]\d\d)\b', str(error))
+    return int(match.group(1)) if match else None
+
+
+class Span:
+    """进行中的 span，可在结束前补充属性"""
+
+    __slots__ = ("name", "cat", "start", "tid", "attrs")
+
+    def __init__(self, name, cat, start, tid, attrs):
+        self.name = name
+        self.cat = cat
+        self.start = start
+        self.tid = tid
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """补充属性（如 token 数、状态码）"""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """单个任务的 span 收集器（线程安全）"""
+
+    def __init__(self, job_id=None, name="job", **attrs):
+        """
+        初始化追踪器
+
+        Args:
+            job_id: 任务 ID，默认自动生成
+            name: 任务名称
+            **attrs: 任务级属性（如 provider、domain）
+        """
+        self.job_id = job_id or new_job_id()
+        self.name = name
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.finished_at = None
+        self.status = "running"
+        self._origin = time.perf_counter()
+        self._events = []
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._step = None
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _tid(self):
+        ident = threading.get_ident()
+        with self._lock:
+            tid = self._threads.get(ident)
+            if tid is None:
+                tid = len(self._threads) + 1
+                self._threads[ident] = tid
+                self._events.append({
+                    "name": "thread_name", "ph": "M", "pid": 1, "tid": tid,
+                    "args": {"name": threading.current_thread().name}
+                })
+            return tid
+
+    def begin(self, name, cat="step", **attrs):
+        """开始一个 span（需配对调用 end）"""
+        return Span(name, cat, self._now_us(), self._tid(), dict(attrs))
+
+    def end(self, span, status="ok", **attrs):
+        """结束 span 并记录为 Chrome 的完整事件（ph=X）"""
+        span.attrs.update(attrs)
+        span.attrs.setdefault("status", status)
+        event = {
+            "name": span.name, "cat": span.cat, "ph": "X", "pid": 1, "tid": span.tid,
+            "ts": round(span.start, 1), "dur": round(self._now_us() - span.start, 1),
+            "args": span.attrs
+        }
+        with self._lock:
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name, cat="step", **attrs):
+        """以上下文管理器记录 span，异常时 status 记为 error（错误信息中有 HTTP 状态码时记为 http_status）"""
+        current = self.begin(name, cat, **attrs)
+        try:
+            yield current
+        except BaseException as e:
+            code = http_status(e)
+            if code is not None:
+                current.attrs.setdefault("http_status", code)
+            self.end(current, status="error", error=f"{type(e).__name__}: {e}"[:300])
+            raise
+        self.end(current)
+
+    def step(self, name, **attrs):
+        """切换流程步骤：结束上一个步骤 span，开始新的步骤 span"""
+        if self._step is not None:
+            self.end(self._step)
+        self._step = self.begin(name, "step", **attrs) if name else None
+
+    def instant(self, name, cat="log", **attrs):
+        """记录瞬时事件（如日志行）"""
+        event = {
+            "name": name, "cat": cat, "ph": "i", "s": "t", "pid": 1, "tid": self._tid(),
+            "ts": round(self._now_us(), 1), "args": attrs
+        }
+        with self._lock:
+            self._events.append(event)
+
+    def finish(self, status="ok"):
+        """结束任务：关闭当前步骤并记录状态"""
+        self.step(None)
+        self.status = status
+        self.finished_at = time.time()
+
+    def to_chrome(self):
+        """导出为 Chrome trace-viewer JSON"""
+        with self._lock:
+            events = list(self._events)
+        events.insert(0, {"name": "process_name", "ph": "M", "pid": 1, "tid": 0,
+                          "args": {"name": f"{self.name} {self.job_id}"}})
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "job_id": self.job_id,
+                "status": self.status,
+                "started_at": datetime.fromtimestamp(self.started_at).strftime("%Y-%m-%d %H:%M:%S"),
+                "duration_ms": round(((self.finished_at or time.time()) - self.started_at) * 1000, 1),
+                **{k: str(v) for k, v in self.attrs.items()}
+            }
+        }
+
+    def summary(self):
+        """任务列表用的摘要"""
+        with self._lock:
+            events = list(self._events)
+        return {
+            "job_id": self.job_id,
+            "name": self.name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(((self.finished_at or time.time()) - self.started_at) * 1000, 1),
+            "spans": sum(1 for e in events if e["ph"] == "X"),
+            **{k: str(v) for k, v in self.attrs.items()}
+        }
+
+    def save(self, trace_dir=TRACE_DIR):
+        """写入 <trace_dir>/<job_id>.json，返回文件路径"""
+        os.makedirs(trace_dir, exist_ok=True)
+        path = os.path.join(trace_dir, f"{self.job_id}.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome(), f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return path
+
+
+_recent = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def start_trace(job_id=None, name="job", **attrs):
+    """为当前线程（上下文）开始一个任务追踪"""
+    tracer = Tracer(job_id, name, **attrs)
+    _current.set(tracer)
+    with _recent_lock:
+        _recent[tracer.job_id] = tracer
+        while len(_recent) > MAX_RECENT_TRACES:
+            _recent.popitem(last=False)
+    return tracer
+
+
+def finish_trace(tracer, status="ok"):
+    """结束任务追踪并写盘"""
+    tracer.finish(status)
+    if _current.get() is tracer:
+        _current.set(None)
+    try:
+        tracer.save()
+    except OSError as e:
+        print(f"[Trace] ⚠ 保存追踪文件失败: {e}")
+
+
+def current_tracer():
+    """当前上下文的追踪器（没有则为 None）"""
+    return _current.get()
+
+
+@contextmanager
+def span(name, cat="step", **attrs):
+    """在当前任务中记录 span；没有进行中的任务时不做任何事"""
+    tracer = _current.get()
+    if tracer is None:
+        yield Span(name, cat, 0, 0, {})
+        return
+    with tracer.span(name, cat, **attrs) as current:
+        yield current
+
+
+def list_traces():
+    """最近任务列表（内存中的任务 + 磁盘上的追踪文件），按开始时间倒序"""
+    with _recent_lock:
+        jobs = {job_id: tracer.summary() for job_id, tracer in _recent.items()}
+    if os.path.isdir(TRACE_DIR):
+        for filename in os.listdir(TRACE_DIR):
+            job_id, ext = os.path.splitext(filename)
+            if ext == ".json" and job_id not in jobs:
+                jobs[job_id] = {"job_id": job_id, "status": "saved",
+                                "started_at": os.path.getmtime(os.path.join(TRACE_DIR, filename))}
+    return sorted(jobs.values(), key=lambda j: j["started_at"], reverse=True)
+
+
+def get_trace(job_id):
+    """按任务 ID 获取 Chrome trace JSON（先查内存，再查磁盘），不存在返回 None"""
+    with _recent_lock:
+        tracer = _recent.get(job_id)
+    if tracer is not None:
+        return tracer.to_chrome()
+    if os.path.basename(job_id) != job_id:
+        return None
+    path = os.path.join(TRACE_DIR, f"{job_id}.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,193 @@
+"""
+公众号 HTML 渲染模块
+功能：进程内把 Markdown 渲染为带内联样式的公众号 HTML，无需调用 Node 脚本
+"""
+
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# 主题样式表：{标签: CSS}，公众号会过滤 <style>，只能写在 style 属性里
+THEMES = {
+    "default": {
+        "section": "font-size: 16px; color: #333; line-height: 1.75; letter-spacing: 0.5px; padding: 0 8px;",
+        "h1": "font-size: 22px; font-weight: bold; color: #222; margin: 1.2em 0 0.8em; text-align: center;",
+        "h2": "font-size: 19px; font-weight: bold; color: #222; margin: 1.5em 0 0.8em; padding-left: 10px; border-left: 4px solid #5B8A8A;",
+        "h3": "font-size: 17px; font-weight: bold; color: #333; margin: 1.2em 0 0.6em;",
+        "p": "margin: 0 0 1em; text-align: justify;",
+        "blockquote": "margin: 1em 0; padding: 10px 15px; border-left: 3px solid #ddd; background: #f7f7f7; color: #666;",
+        "ul": "margin: 0 0 1em; padding-left: 1.5em;",
+        "ol": "margin: 0 0 1em; padding-left: 1.5em;",
+        "li": "margin: 0.3em 0;",
+        "strong": "font-weight: bold; color: #5B8A8A;",
+        "em": "font-style: italic;",
+        "a": "color: #576b95; text-decoration: none;",
+        "code": "font-family: Menlo, Consolas, monospace; font-size: 14px; background: #f3f3f3; padding: 2px 4px; border-radius: 3px;",
+        "pre": "margin: 1em 0; padding: 12px; background: #f6f8fa; border-radius: 4px; overflow-x: auto;",
+        "img": "display: block; max-width: 100%; margin: 1em auto; border-radius: 4px;",
+        "hr": "margin: 1.5em 0; border: none; border-top: 1px solid #eee;",
+    },
+    "grace": {
+        "section": "font-size: 16px; color: #3f3f3f; line-height: 1.9; letter-spacing: 1px; padding: 0 10px;",
+        "h1": "font-size: 22px; font-weight: bold; color: #9F7AEA; margin: 1.2em 0 0.8em; text-align: center;",
+        "h2": "font-size: 18px; font-weight: bold; color: #fff; background: #9F7AEA; margin: 1.5em 0 0.8em; padding: 4px 12px; border-radius: 4px; display: inline-block;",
+        "h3": "font-size: 17px; font-weight: bold; color: #9F7AEA; margin: 1.2em 0 0.6em;",
+        "p": "margin: 0 0 1.2em; text-align: justify;",
+        "blockquote": "margin: 1em 0; padding: 12px 16px; border-left: 4px solid #9F7AEA; background: #faf7ff; color: #666; border-radius: 4px;",
+        "ul": "margin: 0 0 1em; padding-left: 1.5em;",
+        "ol": "margin: 0 0 1em; padding-left: 1.5em;",
+        "li": "margin: 0.4em 0;",
+        "strong": "font-weight: bold; color: #9F7AEA;",
+        "em": "font-style: italic; color: #666;",
+        "a": "color: #9F7AEA; text-decoration: none; border-bottom: 1px dashed #9F7AEA;",
+        "code": "font-family: Menlo, Consolas, monospace; font-size: 14px; background: #faf7ff; color: #9F7AEA; padding: 2px 4px; border-radius: 3px;",
+        "pre": "margin: 1em 0; padding: 12px; background: #faf7ff; border-radius: 6px; overflow-x: auto;",
+        "img": "display: block; max-width: 100%; margin: 1.2em auto; border-radius: 8px; box-shadow: 0 2px 8px rgba(0,0,0,0.1);",
+        "hr": "margin: 2em 0; border: none; border-top: 1px dashed #d6c8f5;",
+    },
+    "simple": {
+        "section": "font-size: 16px; color: #000; line-height: 1.8; padding: 0 5px;",
+        "h1": "font-size: 20px; font-weight: bold; margin: 1em 0 0.6em;",
+        "h2": "font-size: 18px; font-weight: bold; margin: 1.2em 0 0.6em;",
+        "h3": "font-size: 16px; font-weight: bold; margin: 1em 0 0.5em;",
+        "p": "margin: 0 0 1em;",
+        "blockquote": "margin: 1em 0; padding-left: 12px; border-left: 2px solid #000; color: #555;",
+        "ul": "margin: 0 0 1em; padding-left: 1.5em;",
+        "ol": "margin: 0 0 1em; padding-left: 1.5em;",
+        "li": "margin: 0.2em 0;",
+        "strong": "font-weight: bold;",
+        "em": "font-style: italic;",
+        "a": "color: #000; text-decoration: underline;",
+        "code": "font-family: Menlo, Consolas, monospace; font-size: 14px;",
+        "pre": "margin: 1em 0; padding: 10px; border: 1px solid #eee; overflow-x: auto;",
+        "img": "display: block; max-width: 100%; margin: 1em auto;",
+        "hr": "margin: 1.5em 0; border: none; border-top: 1px solid #000;",
+    },
+}
+
+DEFAULT_THEME = "default"
+
+# 开头的 HTML 注释元数据（Title/AI Score/Provider…），不应出现在正文里
+METADATA_COMMENT_PATTERN = re.compile(r'^\s*<!--.*?-->\s*', re.DOTALL)
+
+
+def _compile_theme(styles):
+    """把主题样式表预编译为 (匹配开标签的正则, {标签: ' style="..."'})"""
+    tags = [tag for tag in styles if tag != "section"]
+    pattern = re.compile(r'<(%s)(\s[^>]*?)?(\s*/?)>' % "|".join(tags))
+    attrs = {tag: f' style="{css}"' for tag, css in styles.items()}
+    return pattern, attrs
+
+
+class WeChatRenderer:
+    """公众号 HTML 渲染器（复用 Markdown 实例 + 预编译主题 + 渲染缓存）"""
+
+    def __init__(self, cache_size: int = 128):
+        """
+        初始化渲染器
+
+        Args:
+            cache_size: 渲染缓存的最大条目数
+        """
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._compiled = {name: _compile_theme(styles) for name, styles in THEMES.items()}
+        self._md = None
+
+        try:
+            import markdown
+            self._md = markdown.Markdown(extensions=["extra", "sane_lists"])
+        except ImportError:
+            print("[Renderer] ⚠ 警告：未安装 markdown 库，渲染时将报错")
+            print("[Renderer] 安装命令: pip install markdown")
+
+    def render(self, markdown_text: str, theme: str = DEFAULT_THEME) -> str:
+        """
+        渲染 Markdown 为带内联样式的公众号 HTML
+
+        Args:
+            markdown_text: Markdown 格式文本
+            theme: 主题名（default, grace, simple），未知主题回退到 default
+
+        Returns:
+            HTML 格式文本
+
+        Raises:
+            未安装 markdown 库或转换失败时抛出异常（失败结果不写入缓存）
+        """
+        if theme not in self._compiled:
+            theme = DEFAULT_THEME
+
+        key = (hashlib.sha256(markdown_text.encode("utf-8")).hexdigest(), theme)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+            html = self._convert(markdown_text)
+            html = self._inline_styles(html, theme)
+
+            self._cache[key] = html
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return html
+
+    def _convert(self, markdown_text: str) -> str:
+        """
+        Markdown -> HTML（调用方需持有锁，Markdown 实例不是线程安全的）
+
+        失败时直接抛出，不能把未渲染的 Markdown 包上主题当作 HTML 发布
+        """
+        body = METADATA_COMMENT_PATTERN.sub("", markdown_text, count=1)
+        if not self._md:
+            raise ImportError("未安装 markdown 库，无法渲染公众号 HTML（pip install markdown）")
+        try:
+            return self._md.reset().convert(body)
+        except Exception as e:
+            print(f"[Renderer] ✗ Markdown转换失败: {e}")
+            raise
+
+    def _inline_styles(self, html: str, theme: str) -> str:
+        """给每个开标签加上主题的 style 属性（已有 style 的保持不变）"""
+        pattern, attrs = self._compiled[theme]
+
+        def add_style(match):
+            tag, rest, close = match.group(1), match.group(2) or "", match.group(3)
+            if "style=" in rest:
+                return match.group(0)
+            return f"<{tag}{attrs[tag]}{rest}{close}>"
+
+        html = pattern.sub(add_style, html)
+        return f'<section{attrs["section"]}>{html}</section>'
+
+
+_default_renderer = None
+_default_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> WeChatRenderer:
+    """获取进程内共享的渲染器"""
+    global _default_renderer
+    with _default_renderer_lock:
+        if _default_renderer is None:
+            _default_renderer = WeChatRenderer()
+        return _default_renderer
+
+
+def render_wechat_html(markdown_text: str, theme: str = DEFAULT_THEME) -> str:
+    """渲染公众号 HTML 的便捷函数"""
+    return get_renderer().render(markdown_text, theme)
+
+
+def _render_item(item):
+    """map 用的单参数包装"""
+    return render_wechat_html(*item)
+
+
+def render_many(texts, theme: str = DEFAULT_THEME) -> list:
+    """批量渲染（多核并行），结果与输入顺序对应"""
+    from process_pool import map_cpu
+    return map_cpu(_render_item, [(text, theme) for text in texts])
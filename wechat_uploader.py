@@ -8,11 +8,33 @@ from wechatpy.exceptions import WeChatClientException
 import requests
 import json
 import time
+import os
+import re
+import hashlib
+import threading
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+# 匹配 HTML 中的 <img src="...">
+IMG_SRC_PATTERN = re.compile(r'(<img\b[^>]*?\bsrc=)(["\'])(.*?)\2', re.IGNORECASE)
+
+# uploadimg 接口的图片大小限制
+UPLOADIMG_MAX_BYTES = 1024 * 1024
+
+# 允许作为正文图片上传的本地文件扩展名
+LOCAL_IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 class WeChatUploader:
     """微信公众号文章上传器"""
 
+    # 正文图片去重缓存：{图片内容 sha256: 微信图片 URL}，进程内共享
+    _image_url_cache = {}
+    _image_cache_lock = threading.Lock()
+
     def __init__(self, app_id: str, app_secret: str):
         """
         初始化微信客户端
@@ -25,7 +47,14 @@ class WeChatUploader:
         self.app_secret = app_secret
 
         try:
-            self.client = WeChatClient(app_id, app_secret)
+            # WECHAT_ACCESS_TOKEN：使用外部统一管理的 token（也用于本地压测替身）
+            access_token = os.getenv("WECHAT_ACCESS_TOKEN") or None
+            self.client = WeChatClient(app_id, app_secret, access_token=access_token)
+
+            # WECHAT_API_BASE：覆盖接口地址（如本地压测替身）
+            api_base = os.getenv("WECHAT_API_BASE")
+            if api_base:
+                self.client.API_BASE_URL = api_base.rstrip("/") + "/"
             print("[WeChat] 微信客户端初始化成功")
         except Exception as e:
             print(f"[WeChat] ✗ 初始化失败: {e}")
@@ -60,6 +89,10 @@ class WeChatUploader:
         # 如果有指定图片，上传该图片
         if image_path:
             try:
+                # thumb 素材限制为 64KB 以内的 JPG，先按预算压缩
+                from cover_encoder import encode_cover, WECHAT_THUMB_MAX_BYTES
+                image_path = encode_cover(image_path, max_bytes=WECHAT_THUMB_MAX_BYTES, fmt="JPEG")
+
                 with open(image_path, 'rb') as f:
                     result = self.client.material.add('thumb', f)
                     media_id = result['media_id']
@@ -112,8 +145,68 @@ class WeChatUploader:
                 print("[WeChat] ⚠ 警告：无法上传封面图，将不显示封面")
                 show_cover_pic = 0
 
-        # 构建文章数据
-        articles = {
+        articles = self._draft_articles(title, content, thumb_media_id, author, digest, show_cover_pic)
+
+        try:
+            # 调用草稿箱接口（wechatpy 1.x 没有封装 draft，直接请求 draft/add）
+            result = self.client.post('draft/add', data=articles)
+            return self._report_draft_result(result)
+
+        except WeChatClientException as e:
+            self._report_api_error(e)
+            return False
+
+        except Exception as e:
+            print(f"[WeChat] ✗ 未知错误: {e}")
+            return False
+
+    async def upload_draft_async(self, title: str, content: str, thumb_media_id: str = None,
+                                 author: str = "", digest: str = "", show_cover_pic: int = 1) -> bool:
+        """
+        upload_draft 的异步版本（在 pipeline_executor 的事件循环中运行，HTTP 走共享的异步连接池）
+
+        Args:
+            同 upload_draft
+
+        Returns:
+            是否成功
+        """
+        if not self.client:
+            print("[WeChat] ✗ 客户端未初始化")
+            return False
+
+        from pipeline_executor import get_executor
+        executor = get_executor()
+
+        print(f"[WeChat] 正在上传草稿...")
+        print(f"[WeChat] 标题：{title}")
+
+        if not thumb_media_id:
+            thumb_media_id = await executor.run_blocking(self.upload_thumb, use_default=True, pool="io")
+            if not thumb_media_id:
+                print("[WeChat] ⚠ 警告：无法上传封面图，将不显示封面")
+                show_cover_pic = 0
+
+        articles = self._draft_articles(title, content, thumb_media_id, author, digest, show_cover_pic)
+
+        try:
+            body = json.dumps(articles, ensure_ascii=False).encode('utf-8')
+            result = await self._api_post_async('draft/add', content=body,
+                                                headers={'Content-Type': 'application/json'})
+            return self._report_draft_result(result)
+
+        except WeChatClientException as e:
+            self._report_api_error(e)
+            return False
+
+        except Exception as e:
+            print(f"[WeChat] ✗ 未知错误: {e}")
+            return False
+
+    @staticmethod
+    def _draft_articles(title, content, thumb_media_id, author, digest, show_cover_pic) -> dict:
+        """构建草稿箱接口的文章数据"""
+        return {
             "articles": [
                 {
                     "title": title,
@@ -129,59 +222,292 @@ class WeChatUploader:
             ]
         }
 
-        try:
-            # 调用草稿箱接口
-            result = self.client.draft.add(articles)
+    @staticmethod
+    def _report_draft_result(result: dict) -> bool:
+        if 'media_id' in result:
+            print(f"[WeChat] ✓ 草稿已保存成功！")
+            print(f"[WeChat] Media ID: {result['media_id']}")
+            print(f"[WeChat] 请登录公众号后台查看草稿箱")
+            return True
+        print(f"[WeChat] ✗ 上传失败: {result}")
+        return False
+
+    @staticmethod
+    def _report_api_error(e: WeChatClientException):
+        print(f"[WeChat] ✗ API错误: {e}")
+        print(f"[WeChat] 错误码：{e.errcode}")
+        print(f"[WeChat] 错误信息：{e.errmsg}")
+
+        # 常见错误提示
+        if e.errcode == 40001:
+            print("[WeChat] 提示：AppID 或 AppSecret 可能不正确")
+        elif e.errcode == 40164:
+            print("[WeChat] 提示：IP地址不在白名单中，请在公众号后台配置")
+        elif e.errcode == 45009:
+            print("[WeChat] 提示：接口调用超过限制")
+
+    async def _api_post_async(self, path: str, **kwargs) -> dict:
+        """
+        异步调用公众号接口（地址与 wechatpy 客户端一致，含 WECHAT_API_BASE 覆盖）
 
-            if 'media_id' in result:
-                print(f"[WeChat] ✓ 草稿已保存成功！")
-                print(f"[WeChat] Media ID: {result['media_id']}")
-                print(f"[WeChat] 请登录公众号后台查看草稿箱")
-                return True
-            else:
-                print(f"[WeChat] ✗ 上传失败: {result}")
-                return False
+        Raises:
+            WeChatClientException: 接口返回非 0 errcode
+        """
+        from pipeline_executor import get_executor
+        executor = get_executor()
+
+        # access_token 由 wechatpy 管理（过期时同步刷新），放进线程池避免阻塞事件循环
+        access_token = await executor.run_blocking(lambda: self.client.access_token, pool="io")
+        async with executor.limit("wechat"):
+            response = await executor.http().post(
+                f"{self.client.API_BASE_URL}{path}",
+                params={'access_token': access_token},
+                timeout=60,
+                **kwargs
+            )
+        response.raise_for_status()
+        result = response.json()
+        if result.get('errcode', 0) != 0:
+            raise WeChatClientException(result['errcode'], result.get('errmsg'), client=self.client)
+        return result
+
+    def upload_content_images(self, html: str, base_dir: str = ".", max_workers: int = 4) -> str:
+        """
+        上传正文中的本地图片并替换 src（公众号正文不能引用本地路径）
 
-        except WeChatClientException as e:
-            print(f"[WeChat] ✗ API错误: {e}")
-            print(f"[WeChat] 错误码：{e.errcode}")
-            print(f"[WeChat] 错误信息：{e.errmsg}")
-
-            # 常见错误提示
-            if e.errcode == 40001:
-                print("[WeChat] 提示：AppID 或 AppSecret 可能不正确")
-            elif e.errcode == 40164:
-                print("[WeChat] 提示：IP地址不在白名单中，请在公众号后台配置")
-            elif e.errcode == 45009:
-                print("[WeChat] 提示：接口调用超过限制")
+        Args:
+            html: 文章 HTML
+            base_dir: 相对路径图片的根目录
+            max_workers: 并发上传的最大线程数
 
+        Returns:
+            替换为微信图片 URL 后的 HTML
+        """
+        if not self.client:
+            return html
+
+        src_to_digest, digest_to_path = self._collect_local_images(html, base_dir)
+        if not src_to_digest:
+            return html
+
+        with self._image_cache_lock:
+            pending = {d: p for d, p in digest_to_path.items() if d not in self._image_url_cache}
+
+        # 并发上传，总耗时约等于最慢的一张
+        if pending:
+            workers = max(1, min(max_workers, len(pending)))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(self._upload_image, path): digest
+                           for digest, path in pending.items()}
+                for future in as_completed(futures):
+                    url = future.result()
+                    if url:
+                        with self._image_cache_lock:
+                            self._image_url_cache[futures[future]] = url
+
+        return self._replace_image_srcs(html, src_to_digest)
+
+    async def upload_content_images_async(self, html: str, base_dir: str = ".") -> str:
+        """
+        upload_content_images 的异步版本：所有图片在事件循环上并发上传
+
+        Args:
+            html: 文章 HTML
+            base_dir: 相对路径图片的根目录
+
+        Returns:
+            替换为微信图片 URL 后的 HTML
+        """
+        if not self.client:
+            return html
+
+        import asyncio
+        from pipeline_executor import get_executor
+        executor = get_executor()
+
+        src_to_digest, digest_to_path = await executor.run_blocking(
+            self._collect_local_images, html, base_dir, pool="io")
+        if not src_to_digest:
+            return html
+
+        with self._image_cache_lock:
+            pending = {d: p for d, p in digest_to_path.items() if d not in self._image_url_cache}
+
+        if pending:
+            digests = list(pending)
+            urls = await asyncio.gather(*(self._upload_image_async(pending[d]) for d in digests))
+            with self._image_cache_lock:
+                for digest, url in zip(digests, urls):
+                    if url:
+                        self._image_url_cache[digest] = url
+
+        return self._replace_image_srcs(html, src_to_digest)
+
+    def _collect_local_images(self, html: str, base_dir: str):
+        """
+        收集正文中的本地图片，按内容哈希去重
+
+        Returns:
+            ({src: 内容 sha256}, {内容 sha256: 本地路径})
+        """
+        src_to_digest = {}
+        digest_to_path = {}
+        for match in IMG_SRC_PATTERN.finditer(html):
+            src = match.group(3)
+            if src in src_to_digest:
+                continue
+            path = self._resolve_local_image(src, base_dir)
+            if not path:
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            except OSError as e:
+                print(f"[WeChat] ⚠ 读取图片失败 {src}: {e}")
+                continue
+            src_to_digest[src] = digest
+            digest_to_path.setdefault(digest, path)
+        return src_to_digest, digest_to_path
+
+    def _replace_image_srcs(self, html: str, src_to_digest: dict) -> str:
+        """把已上传图片的 src 替换为微信图片 URL"""
+        with self._image_cache_lock:
+            src_to_url = {src: self._image_url_cache.get(digest)
+                          for src, digest in src_to_digest.items()}
+
+        uploaded = sum(1 for url in src_to_url.values() if url)
+        print(f"[WeChat] 正文图片：{uploaded}/{len(src_to_url)} 张已替换为微信地址")
+
+        def replace(match):
+            url = src_to_url.get(match.group(3))
+            if not url:
+                return match.group(0)
+            return f"{match.group(1)}{match.group(2)}{url}{match.group(2)}"
+
+        return IMG_SRC_PATTERN.sub(replace, html)
+
+    def _resolve_local_image(self, src: str, base_dir: str) -> str:
+        """
+        把 img src 解析为本地文件路径，远程图片或不允许读取的路径返回 None
+
+        正文来自客户端，只接受文章存储封面目录和项目目录下 cover_* 中的图片（解析符号链接后校验），
+        不接受绝对路径和 file:// 地址，避免借上传接口读取服务器上的任意文件
+        """
+        # 带协议的地址（http:、data:、file: 等）和 //host 都不是可上传的本地图片
+        if re.match(r'^[A-Za-z][A-Za-z0-9+.-]*:', src) or src.startswith('//'):
+            return None
+
+        path = unquote(src)
+        roots = (base_dir, os.getcwd())
+        # Web 预览里的封面图走 /cover/<path> 路由，/cover/covers/... 相对文章存储目录（与 serve_cover 一致）
+        if path.startswith('/cover/'):
+            path = path[len('/cover/'):]
+            if path.startswith('covers/'):
+                from article_store import get_article_store
+                roots = (get_article_store().directory,)
+        elif os.path.isabs(path):
+            print(f"[WeChat] ⚠ 不上传绝对路径的本地图片: {src}")
+            return None
+
+        # 先按 base_dir 解析，再按当前工作目录（旧版封面图写在工作目录下）
+        for root in roots:
+            candidate = os.path.realpath(os.path.join(root, path))
+            if os.path.isfile(candidate) and self._is_allowed_image(candidate):
+                return candidate
+        print(f"[WeChat] ⚠ 图片不在允许的目录中，跳过: {src}")
+        return None
+
+    @staticmethod
+    def _is_allowed_image(path: str) -> bool:
+        """路径（已 realpath）是否位于文章存储封面目录或项目目录的 cover_* 下，且为图片文件"""
+        if not path.lower().endswith(LOCAL_IMAGE_EXTENSIONS):
             return False
+        from article_store import get_article_store
+        covers_root = os.path.realpath(os.path.join(get_article_store().directory, "covers"))
+        project_root = os.path.realpath(PROJECT_DIR)
+        try:
+            if os.path.commonpath([path, covers_root]) == covers_root:
+                return True
+            if os.path.commonpath([path, project_root]) != project_root:
+                return False
+        except ValueError:
+            # Windows 下不同盘符
+            return False
+        return os.path.relpath(path, project_root).split(os.sep)[0].startswith("cover_")
+
+    @staticmethod
+    def _prepare_upload_image(image_path: str) -> str:
+        """uploadimg 仅支持 1MB 以内的图片，超出时先压缩，返回实际上传的文件路径"""
+        if os.path.getsize(image_path) > UPLOADIMG_MAX_BYTES:
+            from cover_encoder import encode_cover
+            image_path = encode_cover(image_path, max_bytes=UPLOADIMG_MAX_BYTES, fmt="JPEG")
+        return image_path
+
+    async def _upload_image_async(self, image_path: str) -> str:
+        """_upload_image 的异步版本"""
+        from pipeline_executor import get_executor
+        executor = get_executor()
+
+        def read_image():
+            path = self._prepare_upload_image(image_path)
+            with open(path, 'rb') as f:
+                return os.path.basename(path), f.read()
 
+        try:
+            name, data = await executor.run_blocking(read_image, pool="io")
+            result = await self._api_post_async('media/uploadimg', files={'media': (name, data)})
+            print(f"[WeChat] ✓ 正文图片上传成功: {os.path.basename(image_path)}")
+            return result['url']
         except Exception as e:
-            print(f"[WeChat] ✗ 未知错误: {e}")
-            return False
+            print(f"[WeChat] ✗ 正文图片上传失败 {image_path}: {e}")
+            return None
 
-    def markdown_to_html(self, markdown_text: str) -> str:
+    def _upload_image(self, image_path: str) -> str:
+        """调用 uploadimg 接口上传正文图片，返回图片 URL"""
+        try:
+            image_path = self._prepare_upload_image(image_path)
+
+            # 走相对路径，使 WECHAT_API_BASE 同样生效
+            with open(image_path, 'rb') as f:
+                result = self.client.post('media/uploadimg', files={'media': f})
+            url = result['url']
+            print(f"[WeChat] ✓ 正文图片上传成功: {os.path.basename(image_path)}")
+            return url
+        except Exception as e:
+            print(f"[WeChat] ✗ 正文图片上传失败 {image_path}: {e}")
+            return None
+
+    def markdown_to_html(self, markdown_text: str, theme: str = "default") -> str:
         """
-        将 Markdown 转换为 HTML（公众号需要HTML格式）
+        将 Markdown 转换为带内联样式的 HTML（公众号需要HTML格式）
 
         Args:
             markdown_text: Markdown 格式文本
+            theme: 排版主题（default, grace, simple）
 
         Returns:
             HTML 格式文本
+
+        Raises:
+            渲染失败时抛出异常（不把未渲染的 Markdown 当作 HTML 发布）
         """
-        try:
-            import markdown
-            html = markdown.markdown(markdown_text)
-            return html
-        except ImportError:
-            print("[WeChat] ⚠ 警告：未安装 markdown 库，将直接使用原文")
-            print("[WeChat] 安装命令: pip install markdown")
-            return markdown_text
-        except Exception as e:
-            print(f"[WeChat] ✗ Markdown转换失败: {e}")
-            return markdown_text
+        # 单篇在当前进程渲染：比提交到进程池快，且共用进程内的渲染缓存
+        from wechat_renderer import render_wechat_html
+        return render_wechat_html(markdown_text, theme)
+
+    def markdown_to_html_many(self, texts: list, theme: str = "default") -> list:
+        """
+        批量渲染多篇文章（多核并行）
+
+        Args:
+            texts: Markdown 文本列表
+            theme: 排版主题
+
+        Returns:
+            与 texts 顺序对应的 HTML 列表
+        """
+        from wechat_renderer import render_many
+        return render_many(texts, theme)
 
 
 # 测试代码